@@ -0,0 +1,391 @@
+"""
+生态指数与土地利用分析计算内核
+使用Numba将逐像素计算融合为一次遍历（Numba为可选依赖）
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+# fused_indices 输出平面顺序：前4个为归一化差值指数，其后为Tasseled Cap分量
+NORM_DIFF_INDEX_NAMES = ('ndvi', 'ndwi', 'ndbi', 'ndsi')
+
+# 不启用nnan/ninf，保证输入中的NaN能正确传播
+_FASTMATH_FLAGS = {'contract', 'arcp', 'reassoc', 'afn'}
+
+
+if HAVE_NUMBA:
+
+    @njit(inline='always')
+    def _norm_diff(a, b):
+        """(a - b) / (a + b)，分母为0时为0，结果限制在[-1, 1]（无分支，编译为select）"""
+        den = a + b
+        zero = den == 0
+        value = (a - b) / (np.float32(1.0) if zero else den)
+        value = min(max(value, np.float32(-1.0)), np.float32(1.0))
+        return np.float32(0.0) if zero else value
+
+    # error_model='numpy'：除零不再生成Python异常检查分支，内层循环才能被LLVM向量化。
+    # Numba在运行时按本机CPU特性（AVX2/AVX-512等）生成代码，无需预编译多个SIMD版本
+    @njit(parallel=True, fastmath=_FASTMATH_FLAGS, error_model='numpy', cache=True)
+    def fused_indices(bands, tc_coeffs, out):
+        """
+        一次遍历计算NDVI/NDWI/NDBI/NDSI和全部Tasseled Cap分量
+
+        按行并行；每行内各输出平面分别用无分支的连续内层循环计算，便于SIMD向量化，
+        一行的6个波段在多次内层循环间保持在缓存中
+
+        Args:
+            bands: (>=6, H, W) 波段数组，顺序 blue, green, red, nir, swir1, swir2
+            tc_coeffs: (K, 6) float32 Tasseled Cap系数
+            out: (4 + K, H, W) float32 输出数组
+        """
+        n_tc = tc_coeffs.shape[0]
+        width = bands.shape[2]
+        for i in prange(bands.shape[1]):
+            blue = bands[0, i]
+            green = bands[1, i]
+            red = bands[2, i]
+            nir = bands[3, i]
+            swir1 = bands[4, i]
+            swir2 = bands[5, i]
+
+            for j in range(width):
+                out[0, i, j] = _norm_diff(np.float32(nir[j]), np.float32(red[j]))  # NDVI
+            for j in range(width):
+                out[1, i, j] = _norm_diff(np.float32(green[j]), np.float32(nir[j]))  # NDWI
+            for j in range(width):
+                out[2, i, j] = _norm_diff(np.float32(swir1[j]), np.float32(nir[j]))  # NDBI
+            for j in range(width):
+                out[3, i, j] = _norm_diff(np.float32(green[j]), np.float32(swir1[j]))  # NDSI
+
+            for k in range(n_tc):
+                # 系数提升为标量，内层循环为6次乘加
+                c0 = tc_coeffs[k, 0]
+                c1 = tc_coeffs[k, 1]
+                c2 = tc_coeffs[k, 2]
+                c3 = tc_coeffs[k, 3]
+                c4 = tc_coeffs[k, 4]
+                c5 = tc_coeffs[k, 5]
+                row = out[4 + k, i]
+                for j in range(width):
+                    row[j] = (
+                        c0 * np.float32(blue[j]) + c1 * np.float32(green[j]) +
+                        c2 * np.float32(red[j]) + c3 * np.float32(nir[j]) +
+                        c4 * np.float32(swir1[j]) + c5 * np.float32(swir2[j])
+                    )
+
+    @njit(cache=True)
+    def accumulate_moments(X):
+        """
+        一次遍历累积各行的和与两两乘积和（float64累加）
+
+        Args:
+            X: (K, N) 数组
+
+        Returns:
+            tuple: (N, 和 (K,), 乘积和 (K, K))
+        """
+        k, n = X.shape
+        sums = np.zeros(k)
+        cross = np.zeros((k, k))
+        for i in range(n):
+            for a in range(k):
+                xa = np.float64(X[a, i])
+                sums[a] += xa
+                for b in range(a, k):
+                    cross[a, b] += xa * X[b, i]
+        for a in range(k):
+            for b in range(a):
+                cross[a, b] = cross[b, a]
+        return n, sums, cross
+
+    @njit(parallel=True, cache=True)
+    def nan_stats(a):
+        """
+        一次并行遍历统计非NaN元素的个数、最小值、最大值、和与平方和
+
+        Returns:
+            tuple: (n, min, max, sum, sum_sq)
+        """
+        flat = a.ravel()
+        n = 0
+        lo = np.inf
+        hi = -np.inf
+        total = 0.0
+        total_sq = 0.0
+        for i in prange(flat.size):
+            v = np.float64(flat[i])
+            if v == v:
+                n += 1
+                total += v
+                total_sq += v * v
+                lo = min(lo, v)
+                hi = max(hi, v)
+        return n, lo, hi, total, total_sq
+
+    @njit(parallel=True, cache=True)
+    def masked_moments4(a0, a1, a2, a3, valid):
+        """
+        对四个一维分量中valid为True的像素，一次并行遍历累积个数、和与两两乘积和
+
+        Returns:
+            tuple: (N, 和 (4,), 乘积和 (4, 4))
+        """
+        n = 0
+        s0 = s1 = s2 = s3 = 0.0
+        q00 = q01 = q02 = q03 = q11 = q12 = q13 = q22 = q23 = q33 = 0.0
+        for i in prange(a0.size):
+            if valid[i]:
+                x0 = np.float64(a0[i])
+                x1 = np.float64(a1[i])
+                x2 = np.float64(a2[i])
+                x3 = np.float64(a3[i])
+                n += 1
+                s0 += x0
+                s1 += x1
+                s2 += x2
+                s3 += x3
+                q00 += x0 * x0
+                q01 += x0 * x1
+                q02 += x0 * x2
+                q03 += x0 * x3
+                q11 += x1 * x1
+                q12 += x1 * x2
+                q13 += x1 * x3
+                q22 += x2 * x2
+                q23 += x2 * x3
+                q33 += x3 * x3
+        sums = np.array([s0, s1, s2, s3])
+        cross = np.array([
+            [q00, q01, q02, q03],
+            [q01, q11, q12, q13],
+            [q02, q12, q22, q23],
+            [q03, q13, q23, q33],
+        ])
+        return n, sums, cross
+
+    @njit(parallel=True, fastmath=_FASTMATH_FLAGS, error_model='numpy', cache=True)
+    def project4(a0, a1, a2, a3, weights, offset, valid, out):
+        """
+        一次并行遍历计算 out = Σ weights[k] * a_k - offset，valid为False的像素写为NaN
+
+        Returns:
+            tuple: 有效像素结果的 (min, max)
+        """
+        w0 = np.float32(weights[0])
+        w1 = np.float32(weights[1])
+        w2 = np.float32(weights[2])
+        w3 = np.float32(weights[3])
+        c = np.float32(offset)
+        lo = np.inf
+        hi = -np.inf
+        for i in prange(a0.size):
+            if valid[i]:
+                v = w0 * a0[i] + w1 * a1[i] + w2 * a2[i] + w3 * a3[i] - c
+                out[i] = v
+                lo = min(lo, np.float64(v))
+                hi = max(hi, np.float64(v))
+            else:
+                out[i] = np.nan
+        return lo, hi
+
+    @njit(parallel=True, fastmath=_FASTMATH_FLAGS, cache=True)
+    def quantize_uint8(a, vmin, scale, levels, out):
+        """
+        一次并行遍历将浮点数组线性量化为uint8
+
+        有效值映射到 [0, levels - 1]，NaN写为 levels（颜色查找表中的无效值颜色）
+        """
+        flat = a.ravel()
+        flat_out = out.ravel()
+        top = np.float32(levels - 1)
+        for i in prange(flat.size):
+            v = np.float32(flat[i])
+            if v == v:
+                q = (v - vmin) * scale
+                flat_out[i] = np.uint8(min(max(q, np.float32(0.0)), top))
+            else:
+                flat_out[i] = levels
+
+    @njit(parallel=True, cache=True)
+    def class_counts(a, edges):
+        """
+        一次并行遍历按升序阈值分箱统计 (H, W) 数组的像素数，NaN不计入
+
+        分箱规则与np.digitize一致：第k箱为 edges[k-1] <= v < edges[k]；
+        不生成逐像素的分箱序号数组，每行使用独立的直方图，并行结束后再合并
+
+        Returns:
+            np.ndarray: (len(edges) + 1,) int64 各箱像素数
+        """
+        n_edges = edges.size
+        row_counts = np.zeros((a.shape[0], n_edges + 1), dtype=np.int64)
+        for i in prange(a.shape[0]):
+            hist = row_counts[i]
+            for j in range(a.shape[1]):
+                v = a[i, j]
+                if v == v:
+                    c = 0
+                    while c < n_edges and v >= edges[c]:
+                        c += 1
+                    hist[c] += 1
+        counts = np.zeros(n_edges + 1, dtype=np.int64)
+        for i in range(a.shape[0]):
+            counts += row_counts[i]
+        return counts
+
+    @njit(parallel=True, cache=True)
+    def clip_classes(raw, nodata, has_nodata, nodata_class, out, counts):
+        """
+        一次并行遍历将原始分类值转换为uint8并累积各类别像素数
+
+        无效值写为nodata_class，其余限制到 [0, nodata_class - 1]；每行使用独立的直方图，
+        并行结束后再合并，避免线程间竞争
+
+        Args:
+            raw: (H, W) 原始整型分类值
+            nodata: 原始无效值（has_nodata为False时忽略）
+            has_nodata: 是否存在无效值
+            nodata_class: 无效值对应的类别值
+            out: (H, W) uint8 输出数组
+            counts: (>= nodata_class + 1,) int64 类别计数，结果累加到其中（含无效值类别）
+        """
+        top = nodata_class - 1
+        n_bins = counts.shape[0]
+        row_counts = np.zeros((raw.shape[0], n_bins), dtype=np.int64)
+        for i in prange(raw.shape[0]):
+            hist = row_counts[i]
+            for j in range(raw.shape[1]):
+                v = raw[i, j]
+                if has_nodata and v == nodata:
+                    c = nodata_class
+                else:
+                    c = min(max(v, 0), top)
+                out[i, j] = c
+                hist[c] += 1
+        for i in range(raw.shape[0]):
+            counts += row_counts[i]
+
+    @njit(inline='always')
+    def _find_root(parent, k):
+        """并查集查找根节点（路径减半）"""
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    @njit(nogil=True, cache=True)
+    def count_class_patches(data, nodata, n_bins):
+        """
+        一次扫描统计每个分类的4连通斑块数（同类相邻像素属于同一斑块）
+
+        两行滚动的临时标记加并查集，只保留上一行和当前行的标记，不生成整幅标记数组
+
+        Args:
+            data: (H, W) 分类数组
+            nodata: 无效值
+            n_bins: 分类箱数，分类值限制在 [0, n_bins - 1]
+
+        Returns:
+            ndarray: (n_bins,) 各分类斑块数
+        """
+        height, width = data.shape
+        prev = np.zeros(width, dtype=np.int64)
+        cur = np.zeros(width, dtype=np.int64)
+        capacity = max(1024, width * 4)
+        parent = np.empty(capacity, dtype=np.int64)
+        label_class = np.empty(capacity, dtype=np.int64)
+        n = 0
+        for i in range(height):
+            for j in range(width):
+                v = data[i, j]
+                if v == nodata:
+                    cur[j] = 0
+                    continue
+                up = prev[j] if i > 0 and data[i - 1, j] == v else 0
+                left = cur[j - 1] if j > 0 and data[i, j - 1] == v else 0
+                if up == 0 and left == 0:
+                    n += 1
+                    if n >= capacity:
+                        capacity *= 2
+                        grown = np.empty(capacity, dtype=np.int64)
+                        grown[:n] = parent[:n]
+                        parent = grown
+                        grown = np.empty(capacity, dtype=np.int64)
+                        grown[:n] = label_class[:n]
+                        label_class = grown
+                    parent[n] = n
+                    label_class[n] = min(max(np.int64(v), 0), n_bins - 1)
+                    cur[j] = n
+                elif up != 0 and left != 0:
+                    ru = _find_root(parent, up)
+                    rl = _find_root(parent, left)
+                    if ru < rl:
+                        parent[rl] = ru
+                    elif rl < ru:
+                        parent[ru] = rl
+                    cur[j] = min(ru, rl)
+                else:
+                    cur[j] = up if up != 0 else left
+            prev, cur = cur, prev
+        patches = np.zeros(n_bins, dtype=np.int64)
+        for k in range(1, n + 1):
+            if _find_root(parent, k) == k:
+                patches[label_class[k]] += 1
+        return patches
+
+else:
+    fused_indices = None
+    class_counts = None
+    count_class_patches = None
+
+    def nan_stats(a):
+        """nan_stats的NumPy实现（未安装Numba时使用）"""
+        valid = a[~np.isnan(a)].astype(np.float64, copy=False)
+        if valid.size == 0:
+            return 0, np.inf, -np.inf, 0.0, 0.0
+        return valid.size, valid.min(), valid.max(), valid.sum(), np.dot(valid, valid)
+
+    def accumulate_moments(X):
+        """accumulate_moments的NumPy实现（未安装Numba时使用）"""
+        X64 = X.astype(np.float64, copy=False)
+        return X.shape[1], X64.sum(axis=1), X64 @ X64.T
+
+    def masked_moments4(a0, a1, a2, a3, valid):
+        """masked_moments4的NumPy实现（未安装Numba时使用）"""
+        X = np.stack([a[valid] for a in (a0, a1, a2, a3)]).astype(np.float64)
+        return X.shape[1], X.sum(axis=1), X @ X.T
+
+    def project4(a0, a1, a2, a3, weights, offset, valid, out):
+        """project4的NumPy实现（未安装Numba时使用）"""
+        out.fill(np.nan)
+        values = np.float32(-offset)
+        for w, a in zip(weights, (a0, a1, a2, a3)):
+            values = values + np.float32(w) * a[valid]
+        out[valid] = values
+        if values.size == 0:
+            return np.inf, -np.inf
+        return float(values.min()), float(values.max())
+
+    def clip_classes(raw, nodata, has_nodata, nodata_class, out, counts):
+        """clip_classes的NumPy实现（未安装Numba时使用）"""
+        np.clip(raw, 0, nodata_class - 1, out=out, casting='unsafe')
+        if has_nodata:
+            np.putmask(out, raw == nodata, nodata_class)
+        counts += np.bincount(out.ravel(), minlength=counts.shape[0])
+
+    def quantize_uint8(a, vmin, scale, levels, out):
+        """quantize_uint8的NumPy实现（未安装Numba时使用）"""
+        values = np.subtract(a, vmin, dtype=np.float32)
+        values *= scale
+        invalid = np.isnan(values)
+        values[invalid] = 0
+        np.clip(values, 0, levels - 1, out=values)
+        out[...] = values
+        out[invalid] = levels
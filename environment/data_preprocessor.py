@@ -5,6 +5,9 @@
 
 import os
 import sys
+import math
+import re
+import fnmatch
 import numpy as np
 from pathlib import Path
 import logging
@@ -12,6 +15,17 @@ import json
 from datetime import datetime
 import tempfile
 import shutil
+import queue
+import threading
+from functools import lru_cache, wraps
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# orjson为可选依赖，未安装时退回标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # 设置GDAL错误处理
 try:
@@ -23,34 +37,291 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# 预处理使用的GDAL配置：避免打开文件时扫描目录、默认启用多线程。
+# 只在DataPreprocessor方法执行期间按线程设置（见_with_gdal_config），
+# 不改变进程全局配置，同一进程中其他模块打开文件时仍会读取.aux.xml/.ovr/.msk等附属文件
+GDAL_CONFIG_OPTIONS = {
+    'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+    'GDAL_NUM_THREADS': 'ALL_CPUS',
+    'VSI_CACHE': 'TRUE',
+    'CPL_VSIL_CURL_ALLOWED_EXTENSIONS': '.tif,.jp2',
+    # 禁止PROJ联网下载格网文件，避免重投影时偶发阻塞
+    'PROJ_NETWORK': 'OFF',
+    # 内嵌金字塔同样分块压缩
+    'COMPRESS_OVERVIEW': 'DEFLATE',
+    'GDAL_TIFF_OVR_BLOCKSIZE': '512',
+}
+
+# GDAL块缓存大小下限（字节）
+GDAL_CACHE_MIN_BYTES = 1024 * 1024 * 1024
+
+# 输出GeoTIFF的创建选项：分块 + 压缩，便于后续窗口读取
+GTIFF_CREATION_OPTIONS = [
+    'TILED=YES',
+    'BLOCKXSIZE=512',
+    'BLOCKYSIZE=512',
+    'COMPRESS=DEFLATE',
+    'BIGTIFF=IF_SAFER'
+]
+
+# 内嵌金字塔的降采样倍数；小于OVERVIEW_MIN_SIZE的层级不再生成
+OVERVIEW_LEVELS = [2, 4, 8, 16, 32]
+OVERVIEW_MIN_SIZE = 256
+
+# 整型数据使用水平差分预测，浮点数据使用浮点预测
+_FLOAT_DATA_TYPES = (gdal.GDT_Float32, gdal.GDT_Float64)
+
+
+@contextmanager
+def _gdal_config(options=GDAL_CONFIG_OPTIONS):
+    """在当前线程内临时设置GDAL配置项，退出时恢复原值"""
+    previous = {key: gdal.GetThreadLocalConfigOption(key, None) for key in options}
+    for key, value in options.items():
+        gdal.SetThreadLocalConfigOption(key, value)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            gdal.SetThreadLocalConfigOption(key, value)
+
+
+def _with_gdal_config(method):
+    """装饰器：方法执行期间应用GDAL_CONFIG_OPTIONS"""
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with _gdal_config():
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def _gtiff_creation_options(data_type):
+    """根据数据类型生成分块、压缩、带预测器的GeoTIFF创建选项"""
+    predictor = '3' if data_type in _FLOAT_DATA_TYPES else '2'
+    return GTIFF_CREATION_OPTIONS + [
+        f'PREDICTOR={predictor}',
+        'NUM_THREADS=ALL_CPUS',
+        'INTERLEAVE=BAND'
+    ]
+
+
+@lru_cache(maxsize=None)
+def _get_dst_wkt(target_epsg):
+    """获取目标EPSG的WKT（缓存，避免重复构建PROJ坐标系统）"""
+    dst_srs = osr.SpatialReference()
+    dst_srs.ImportFromEPSG(target_epsg)
+    return dst_srs.ExportToWkt()
+
+
+@lru_cache(maxsize=256)
+def _is_same_srs(src_wkt, target_epsg):
+    """判断源坐标系统与目标EPSG是否相同（缓存）"""
+    src_srs = osr.SpatialReference()
+    src_srs.ImportFromWkt(src_wkt)
+    dst_srs = osr.SpatialReference()
+    dst_srs.ImportFromWkt(_get_dst_wkt(target_epsg))
+    return bool(src_srs.IsSame(dst_srs))
+
+
+def _describe_dataset(dataset, data_path):
+    """读取已打开数据集的尺寸、坐标系统和波段信息"""
+    projection = dataset.GetProjection()
+    
+    # 检查坐标系统
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(projection)
+    
+    # 检查波段信息
+    bands_info = []
+    for i in range(1, dataset.RasterCount + 1):
+        band = dataset.GetRasterBand(i)
+        band_info = {
+            'band_number': i,
+            'description': band.GetDescription(),
+            'data_type': gdal.GetDataTypeName(band.DataType),
+            'no_data_value': band.GetNoDataValue(),
+            'scale': band.GetScale(),
+            'offset': band.GetOffset(),
+            'unit_type': band.GetUnitType()
+        }
+        bands_info.append(band_info)
+    
+    return {
+        'valid': True,
+        'file_path': str(data_path),
+        'width': dataset.RasterXSize,
+        'height': dataset.RasterYSize,
+        'band_count': dataset.RasterCount,
+        'geotransform': dataset.GetGeoTransform(),
+        'projection': projection,
+        'coordinate_system': srs.GetName(),
+        'epsg_code': srs.GetAuthorityCode('PROJCS'),
+        'bands_info': bands_info
+    }
+
+
+@lru_cache(maxsize=256)
+def _read_raster_info(data_path, mtime_ns):
+    """打开文件读取元数据（按路径和修改时间缓存）"""
+    dataset = gdal.Open(data_path, gdal.GA_ReadOnly)
+    if dataset is None:
+        raise ValueError(f"无法打开文件: {data_path}")
+    return _describe_dataset(dataset, data_path)
+
+
+def _find_band_files(directory, band_patterns):
+    """
+    单次扫描目录，按通配符模式查找各波段文件
+    
+    Args:
+        directory: 数据目录
+        band_patterns: {波段名: 通配符模式或模式列表}，列表按优先级排列
+        
+    Returns:
+        dict: {波段名: 文件路径}
+    """
+    with os.scandir(directory) as entries:
+        file_names = sorted(entry.name for entry in entries if entry.is_file())
+    
+    band_files = {}
+    for band_name, patterns in band_patterns.items():
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        for pattern in patterns:
+            regex = re.compile(fnmatch.translate(pattern))
+            match = next((name for name in file_names if regex.match(name)), None)
+            if match is not None:
+                band_files[band_name] = os.path.join(directory, match)
+                break
+    return band_files
+
+
+def _aligned_chunk_size(src_block, dst_block, desired=2048):
+    """
+    计算同时与源、目标分块对齐的读写步长，避免写入时对目标分块读-改-写
+    
+    Args:
+        src_block: 源分块边长
+        dst_block: 目标分块边长
+        desired: 期望的步长上限
+        
+    Returns:
+        int: 步长（目标分块大小的整数倍）
+    """
+    base = math.lcm(src_block, dst_block)
+    if base > desired:
+        # 源、目标分块无法在期望范围内对齐时，只保证与目标分块对齐
+        base = dst_block
+    return max(base, math.floor(desired / base) * base)
+
+
+def _remove_path(entry):
+    """删除目录项（目录递归删除）"""
+    if entry.is_dir(follow_symlinks=False):
+        shutil.rmtree(entry.path, ignore_errors=True)
+    else:
+        os.unlink(entry.path)
+
 
 class DataPreprocessor:
     """数据预处理器"""
     
-    def __init__(self, output_dir="preprocessed_data"):
+    # Landsat波段文件模式（按输出波段顺序）
+    LANDSAT_BAND_PATTERNS = {
+        'B2': '*_SR_B2.TIF',  # 蓝波段
+        'B3': '*_SR_B3.TIF',  # 绿波段
+        'B4': '*_SR_B4.TIF',  # 红波段
+        'B5': '*_SR_B5.TIF',  # 近红外波段
+        'B6': '*_SR_B6.TIF',  # 短波红外1
+        'B7': '*_SR_B7.TIF'   # 短波红外2
+    }
+    
+    # Sentinel-2波段文件模式 - 支持多种命名格式
+    SENTINEL_BAND_PATTERNS = {
+        'B02': ['*_B02_10m.jp2', '*_B02.jp2'],  # 蓝波段
+        'B03': ['*_B03_10m.jp2', '*_B03.jp2'],  # 绿波段
+        'B04': ['*_B04_10m.jp2', '*_B04.jp2'],  # 红波段
+        'B08': ['*_B08_10m.jp2', '*_B08.jp2'],  # 近红外波段
+        'B11': ['*_B11_20m.jp2', '*_B11.jp2'],  # 短波红外1
+        'B12': ['*_B12_20m.jp2', '*_B12.jp2']   # 短波红外2
+    }
+    
+    BAND_NAMES = ['Blue', 'Green', 'Red', 'NIR', 'SWIR1', 'SWIR2']
+    
+    def __init__(self, output_dir="preprocessed_data", target_epsg=32650, use_vsimem=False):
         """
         初始化数据预处理器
         
+        建议通过 with 语句使用，退出时立即清理临时文件
+        
         Args:
             output_dir: 输出目录
+            target_epsg: 预加载的目标EPSG代码
+            use_vsimem: 中间栅格是否写入GDAL内存文件系统(/vsimem)
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
-        self.temp_dir = Path(tempfile.mkdtemp())
         self.metadata = {}
         
-    def __del__(self):
-        """清理临时文件"""
+        # 临时目录优先放在内存盘上，减少磁盘I/O
+        shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        self._temp_dir_obj = tempfile.TemporaryDirectory(dir=shm_dir)
+        self.temp_dir = Path(self._temp_dir_obj.name)
+        
+        self.use_vsimem = use_vsimem
+        self.temp_prefix = f"/vsimem/dp_{os.getpid()}_{id(self)}/"
+        
+        # 加大GDAL块缓存，减少分块数据的重复解码（进程级设置，只增不减）
+        if gdal.GetCacheMax() < GDAL_CACHE_MIN_BYTES:
+            gdal.SetCacheMax(GDAL_CACHE_MIN_BYTES)
+        
+        # 预加载PROJ数据库，后续坐标转换直接命中缓存
+        _get_dst_wkt(target_epsg)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+        return False
+    
+    def temp_path(self, name):
+        """
+        获取中间文件路径
+        
+        Args:
+            name: 文件名
+            
+        Returns:
+            str: 位于/vsimem或临时目录下的路径
+        """
+        if self.use_vsimem:
+            return f"{self.temp_prefix}{name}"
+        return str(self.temp_dir / name)
+    
+    def cleanup(self):
+        """清理临时文件（并行删除各子项）"""
         try:
+            if self.use_vsimem:
+                for name in gdal.ReadDirRecursive(self.temp_prefix) or []:
+                    if not name.endswith('/'):
+                        gdal.Unlink(f"{self.temp_prefix}{name}")
+            
             if self.temp_dir.exists():
-                shutil.rmtree(self.temp_dir)
+                entries = list(os.scandir(self.temp_dir))
+                if entries:
+                    with ThreadPoolExecutor(max_workers=min(len(entries), os.cpu_count() or 1)) as executor:
+                        list(executor.map(_remove_path, entries))
+            self._temp_dir_obj.cleanup()
         except Exception as e:
             logger.warning(f"清理临时文件失败: {e}")
     
+    @_with_gdal_config
     def validate_input_data(self, data_path):
         """
         验证输入数据
         
+        同一文件（路径和修改时间不变）的元数据只读取一次
+        
         Args:
             data_path: 数据文件路径
             
@@ -58,59 +329,23 @@ class DataPreprocessor:
             dict: 验证结果
         """
         try:
-            dataset = gdal.Open(str(data_path), gdal.GA_ReadOnly)
-            if dataset is None:
-                return {
-                    'valid': False,
-                    'error': f"无法打开文件: {data_path}"
-                }
-            
-            # 获取基本信息
-            width = dataset.RasterXSize
-            height = dataset.RasterYSize
-            band_count = dataset.RasterCount
-            geotransform = dataset.GetGeoTransform()
-            projection = dataset.GetProjection()
-            
-            # 检查坐标系统
-            srs = osr.SpatialReference()
-            srs.ImportFromWkt(projection)
-            
-            # 检查波段信息
-            bands_info = []
-            for i in range(1, band_count + 1):
-                band = dataset.GetRasterBand(i)
-                band_info = {
-                    'band_number': i,
-                    'description': band.GetDescription(),
-                    'data_type': gdal.GetDataTypeName(band.DataType),
-                    'no_data_value': band.GetNoDataValue(),
-                    'scale': band.GetScale(),
-                    'offset': band.GetOffset(),
-                    'unit_type': band.GetUnitType()
-                }
-                bands_info.append(band_info)
-            
-            dataset = None
-            
-            validation_result = {
-                'valid': True,
-                'file_path': str(data_path),
-                'width': width,
-                'height': height,
-                'band_count': band_count,
-                'geotransform': geotransform,
-                'projection': projection,
-                'coordinate_system': srs.GetName(),
-                'epsg_code': srs.GetAuthorityCode('PROJCS'),
-                'bands_info': bands_info
-            }
+            try:
+                mtime_ns = os.stat(data_path).st_mtime_ns
+            except OSError:
+                # /vsimem等非本地路径不做缓存
+                mtime_ns = None
+            
+            if mtime_ns is None:
+                validation_result = _read_raster_info.__wrapped__(str(data_path), None)
+            else:
+                validation_result = _read_raster_info(str(data_path), mtime_ns)
             
             logger.info(f"数据验证成功: {data_path}")
-            logger.info(f"  尺寸: {width}x{height}, 波段数: {band_count}")
-            logger.info(f"  坐标系统: {srs.GetName()}")
+            logger.info(f"  尺寸: {validation_result['width']}x{validation_result['height']}, "
+                        f"波段数: {validation_result['band_count']}")
+            logger.info(f"  坐标系统: {validation_result['coordinate_system']}")
             
-            return validation_result
+            return dict(validation_result)
             
         except Exception as e:
             logger.error(f"数据验证失败: {e}")
@@ -119,6 +354,7 @@ class DataPreprocessor:
                 'error': str(e)
             }
     
+    @_with_gdal_config
     def convert_coordinate_system(self, input_path, output_path, target_epsg=32650):
         """
         转换坐标系统
@@ -139,23 +375,20 @@ class DataPreprocessor:
             
             # 获取源坐标系统
             src_projection = src_dataset.GetProjection()
-            src_srs = osr.SpatialReference()
-            src_srs.ImportFromWkt(src_projection)
-            
-            # 创建目标坐标系统
-            dst_srs = osr.SpatialReference()
-            dst_srs.ImportFromEPSG(target_epsg)
             
             # 检查是否需要转换
-            if src_srs.IsSame(dst_srs):
+            if _is_same_srs(src_projection, target_epsg):
                 logger.info(f"坐标系统相同，无需转换: {target_epsg}")
-                # 直接复制文件
-                import shutil
-                shutil.copy2(input_path, output_path)
+                src_dataset = None
+                # 优先创建硬链接（零拷贝），跨设备等情况下退回到复制文件
+                try:
+                    os.link(str(input_path), str(output_path))
+                except OSError:
+                    shutil.copy2(input_path, output_path)
                 return True
             
             # 执行重投影 - 使用简化的方法
-            dst_wkt = dst_srs.ExportToWkt()
+            dst_wkt = _get_dst_wkt(target_epsg)
             if dst_wkt is None:
                 # 尝试使用EPSG代码字符串
                 dst_wkt = f"EPSG:{target_epsg}"
@@ -167,12 +400,17 @@ class DataPreprocessor:
             output_path_str = str(output_path)
             dst_wkt_str = str(dst_wkt)
             
-            # 使用简化的Warp调用
+            # 使用近似变换器（误差阈值0.125像素，与gdalwarp默认一致），
+            # 避免对每个像素都调用PROJ精确变换
             result = gdal.Warp(
                 output_path_str,
                 src_dataset,
                 dstSRS=dst_wkt_str,
-                resampleAlg=gdal.GRA_Bilinear
+                resampleAlg=gdal.GRA_Bilinear,
+                errorThreshold=0.125,
+                warpMemoryLimit=1 << 30,
+                multithread=True,
+                warpOptions=['NUM_THREADS=ALL_CPUS']
             )
             if result is None:
                 raise ValueError(f"gdal.Warp失败: {gdal.GetLastErrorMsg()}")
@@ -204,6 +442,72 @@ class DataPreprocessor:
             logger.error(f"坐标系统转换失败: {e}")
             return False
     
+    def _stack_and_warp(self, band_paths, band_names, output_path, target_epsg):
+        """
+        将多个单波段文件堆叠为VRT，并通过一次gdal.Warp完成重投影和波段合并
+        
+        相比逐波段转换到临时文件再合并，只需一次读取和一次写入
+        
+        Args:
+            band_paths: 波段文件路径列表
+            band_names: 波段名称列表
+            output_path: 输出文件路径
+            target_epsg: 目标EPSG代码
+            
+        Returns:
+            dict: 输出文件的验证信息，失败时返回None
+        """
+        try:
+            # 空路径表示仅在内存中构建VRT，无需落盘和清理
+            vrt_dataset = gdal.BuildVRT(
+                '',
+                [str(p) for p in band_paths],
+                separate=True,
+                resolution='highest'
+            )
+            if vrt_dataset is None:
+                raise ValueError(f"构建VRT失败: {gdal.GetLastErrorMsg()}")
+            
+            for i, name in enumerate(band_names):
+                vrt_dataset.GetRasterBand(i + 1).SetDescription(name)
+            
+            result = gdal.Warp(
+                str(output_path),
+                vrt_dataset,
+                dstSRS=_get_dst_wkt(target_epsg),
+                resampleAlg=gdal.GRA_Bilinear,
+                errorThreshold=0.125,
+                warpMemoryLimit=1 << 30,
+                multithread=True,
+                warpOptions=['NUM_THREADS=ALL_CPUS'],
+                creationOptions=_gtiff_creation_options(vrt_dataset.GetRasterBand(1).DataType)
+            )
+            if result is None:
+                raise ValueError(f"gdal.Warp失败: {gdal.GetLastErrorMsg()}")
+            
+            # 确保输出波段描述与输入一致
+            for i, name in enumerate(band_names):
+                result.GetRasterBand(i + 1).SetDescription(name)
+            
+            # 直接使用已打开的输出数据集生成验证信息，无需重新打开
+            output_info = _describe_dataset(result, output_path)
+            result = None  # 释放资源
+            vrt_dataset = None
+            
+            self.build_overviews(output_path)
+            
+            logger.info(f"波段重投影合并完成: {output_path}")
+            logger.info(f"  波段数: {len(band_paths)}")
+            logger.info(f"  目标EPSG: {target_epsg}")
+            logger.info(f"  尺寸: {output_info['width']}x{output_info['height']}")
+            
+            return output_info
+            
+        except Exception as e:
+            logger.error(f"波段重投影合并失败: {e}")
+            return None
+    
+    @_with_gdal_config
     def merge_bands(self, band_files, output_path, band_names=None):
         """
         合并多个单波段文件为多波段文件
@@ -220,80 +524,62 @@ class DataPreprocessor:
             if not band_files:
                 raise ValueError("波段文件列表为空")
             
-            # 验证所有波段文件
-            first_dataset = gdal.Open(str(band_files[0]), gdal.GA_ReadOnly)
-            if first_dataset is None:
-                raise ValueError(f"无法打开第一个波段文件: {band_files[0]}")
+            # 验证所有波段文件（仅读取元数据）
+            band_datasets = []
+            for band_file in band_files:
+                band_dataset = gdal.Open(str(band_file), gdal.GA_ReadOnly)
+                if band_dataset is None:
+                    raise ValueError(f"无法打开波段文件: {band_file}")
+                band_datasets.append(band_dataset)
             
+            first_dataset = band_datasets[0]
             width = first_dataset.RasterXSize
             height = first_dataset.RasterYSize
-            data_type = first_dataset.GetRasterBand(1).DataType
-            geotransform = first_dataset.GetGeoTransform()
-            projection = first_dataset.GetProjection()
-            
-            first_dataset = None
             
-            # 创建输出数据集
-            driver = gdal.GetDriverByName('GTiff')
-            output_dataset = driver.Create(
-                str(output_path),
-                width,
-                height,
-                len(band_files),
-                data_type
-            )
+            # 每个波段对象只获取一次，后续元数据查询和读取都复用
+            src_bands = [ds.GetRasterBand(1) for ds in band_datasets]
             
-            # 设置地理信息
-            output_dataset.SetGeoTransform(geotransform)
-            output_dataset.SetProjection(projection)
+            # 输出数据类型取能容纳所有波段的最小类型，避免截断或隐式提升
+            band_types = [band.DataType for band in src_bands]
+            data_type = band_types[0]
+            for band_type in band_types[1:]:
+                data_type = gdal.DataTypeUnion(data_type, band_type)
             
-            # 复制波段数据
-            for i, band_file in enumerate(band_files):
-                band_dataset = gdal.Open(str(band_file), gdal.GA_ReadOnly)
-                if band_dataset is None:
-                    raise ValueError(f"无法打开波段文件: {band_file}")
-                
+            for band_file, band_dataset in zip(band_files, band_datasets):
                 # 验证尺寸
                 if (band_dataset.RasterXSize != width or 
                     band_dataset.RasterYSize != height):
                     raise ValueError(f"波段文件尺寸不匹配: {band_file}")
-                
-                # 读取波段数据
-                band_data = band_dataset.GetRasterBand(1).ReadAsArray()
-                
-                # 写入输出数据集
-                output_band = output_dataset.GetRasterBand(i + 1)
-                output_band.WriteArray(band_data)
-                
-                # 设置波段描述
-                if band_names and i < len(band_names):
-                    output_band.SetDescription(band_names[i])
-                else:
-                    output_band.SetDescription(f"Band_{i+1}")
-                
-                # 复制元数据
-                src_band = band_dataset.GetRasterBand(1)
-                if src_band.GetNoDataValue() is not None:
-                    output_band.SetNoDataValue(src_band.GetNoDataValue())
-                
-                # 安全地设置比例和偏移
-                try:
-                    scale = src_band.GetScale()
-                    if scale is not None and scale != 1.0:
-                        output_band.SetScale(float(scale))
-                except:
-                    pass
-                
-                try:
-                    offset = src_band.GetOffset()
-                    if offset is not None and offset != 0.0:
-                        output_band.SetOffset(float(offset))
-                except:
-                    pass
-                
-                band_dataset = None
+            
+            if band_names is None:
+                band_names = []
+            descriptions = [
+                band_names[i] if i < len(band_names) else f"Band_{i+1}"
+                for i in range(len(band_files))
+            ]
+            
+            if all(band_type == data_type for band_type in band_types):
+                # 数据类型一致时由GDAL在C层完成块拷贝
+                output_dataset = self._merge_bands_translate(
+                    band_files, output_path, data_type
+                )
+            else:
+                output_dataset = self._merge_bands_copy(
+                    first_dataset, src_bands, output_path, data_type
+                )
+            
+            for i, src_band in enumerate(src_bands):
+                self._copy_band_metadata(
+                    src_band,
+                    output_dataset.GetRasterBand(i + 1),
+                    descriptions[i]
+                )
             
             output_dataset = None
+            src_bands = None
+            band_datasets = None
+            
+            self.build_overviews(output_path)
             
             logger.info(f"波段合并完成: {output_path}")
             logger.info(f"  波段数: {len(band_files)}")
@@ -305,6 +591,151 @@ class DataPreprocessor:
             logger.error(f"波段合并失败: {e}")
             return False
     
+    def _merge_bands_translate(self, band_files, output_path, data_type):
+        """
+        通过VRT堆叠 + gdal.Translate合并波段，不经过Python层的数组
+        
+        Returns:
+            gdal.Dataset: 输出数据集
+        """
+        vrt_dataset = gdal.BuildVRT('', [str(p) for p in band_files], separate=True)
+        if vrt_dataset is None:
+            raise ValueError(f"构建VRT失败: {gdal.GetLastErrorMsg()}")
+        
+        output_dataset = gdal.Translate(
+            str(output_path),
+            vrt_dataset,
+            creationOptions=_gtiff_creation_options(data_type)
+        )
+        if output_dataset is None:
+            raise ValueError(f"gdal.Translate失败: {gdal.GetLastErrorMsg()}")
+        return output_dataset
+    
+    def _merge_bands_copy(self, first_dataset, src_bands, output_path, data_type):
+        """
+        逐块复制波段数据（用于波段数据类型不一致的情况）
+        
+        Returns:
+            gdal.Dataset: 输出数据集
+        """
+        width = first_dataset.RasterXSize
+        height = first_dataset.RasterYSize
+        
+        # 创建输出数据集（分块 + 压缩），读写步长与源、目标分块对齐，避免读-改-写
+        src_block_x, src_block_y = src_bands[0].GetBlockSize()
+        block_x = _aligned_chunk_size(src_block_x, 512)
+        block_y = _aligned_chunk_size(src_block_y, 512)
+        driver = gdal.GetDriverByName('GTiff')
+        output_dataset = driver.Create(
+            str(output_path),
+            width,
+            height,
+            len(src_bands),
+            data_type,
+            options=_gtiff_creation_options(data_type)
+        )
+        
+        # 设置地理信息
+        output_dataset.SetGeoTransform(first_dataset.GetGeoTransform())
+        output_dataset.SetProjection(first_dataset.GetProjection())
+        
+        # 按块读写波段数据，内存占用与分块大小而非影像大小相关
+        windows = [
+            (xoff, yoff, min(block_x, width - xoff), min(block_y, height - yoff))
+            for yoff in range(0, height, block_y)
+            for xoff in range(0, width, block_x)
+        ]
+        
+        # 读线程与写入交替进行：写入第N块时读取第N+1块（GDAL读写均释放GIL）
+        block_queue = queue.Queue(maxsize=2)
+        stop_event = threading.Event()
+        
+        def read_blocks():
+            try:
+                for i, src_band in enumerate(src_bands):
+                    for xoff, yoff, win_x, win_y in windows:
+                        if stop_event.is_set():
+                            return
+                        # 以输出数据类型的原始字节直接传递，不经过numpy数组
+                        block_data = src_band.ReadRaster(
+                            xoff, yoff, win_x, win_y, buf_type=data_type
+                        )
+                        block_queue.put((i, xoff, yoff, win_x, win_y, block_data))
+            finally:
+                block_queue.put(None)
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            reader = executor.submit(read_blocks)
+            try:
+                while True:
+                    item = block_queue.get()
+                    if item is None:
+                        break
+                    i, xoff, yoff, win_x, win_y, block_data = item
+                    output_dataset.GetRasterBand(i + 1).WriteRaster(
+                        xoff, yoff, win_x, win_y, block_data, buf_type=data_type
+                    )
+            except Exception:
+                # 通知读线程停止并清空队列，避免其阻塞
+                stop_event.set()
+                while block_queue.get() is not None:
+                    pass
+                raise
+            reader.result()
+        
+        return output_dataset
+    
+    @staticmethod
+    def _copy_band_metadata(src_band, output_band, description):
+        """复制波段描述、无效值、比例和偏移"""
+        output_band.SetDescription(description)
+        
+        try:
+            no_data = src_band.GetNoDataValue()
+            if no_data is not None:
+                output_band.SetNoDataValue(no_data)
+            
+            scale = src_band.GetScale()
+            if scale is not None and scale != 1.0:
+                output_band.SetScale(float(scale))
+            
+            offset = src_band.GetOffset()
+            if offset is not None and offset != 0.0:
+                output_band.SetOffset(float(offset))
+        except Exception as e:
+            logger.warning(f"复制波段元数据失败({description}): {e}")
+    
+    @_with_gdal_config
+    def build_overviews(self, raster_path, resampling='AVERAGE'):
+        """
+        为栅格文件生成内嵌金字塔，后续低分辨率读取无需解码全分辨率数据
+        
+        Args:
+            raster_path: 栅格文件路径
+            resampling: 重采样方法，分类数据（如土地利用）应使用'NEAREST'
+            
+        Returns:
+            bool: 是否生成成功
+        """
+        try:
+            dataset = gdal.Open(str(raster_path), gdal.GA_Update)
+            if dataset is None:
+                raise ValueError(f"无法打开文件: {raster_path}")
+            
+            min_size = min(dataset.RasterXSize, dataset.RasterYSize)
+            levels = [level for level in OVERVIEW_LEVELS if min_size // level >= OVERVIEW_MIN_SIZE]
+            if levels:
+                dataset.BuildOverviews(resampling, levels)
+            dataset = None
+            
+            logger.info(f"金字塔生成完成: {raster_path}, 层级: {levels}")
+            return True
+            
+        except Exception as e:
+            logger.warning(f"金字塔生成失败: {e}")
+            return False
+    
+    @_with_gdal_config
     def clip_to_region(self, input_path, output_path, region_bounds):
         """
         裁剪到指定区域
@@ -312,19 +743,40 @@ class DataPreprocessor:
         Args:
             input_path: 输入文件路径
             output_path: 输出文件路径
-            region_bounds: 区域边界 [min_x, min_y, max_x, max_y]
+            region_bounds: 区域边界 [min_x, min_y, max_x, max_y]，
+                或裁剪多边形矢量文件路径
             
         Returns:
             bool: 裁剪是否成功
         """
         try:
-            # 使用GDAL Warp进行裁剪
-            gdal.Warp(
-                str(output_path),
-                input_path,
-                outputBounds=region_bounds,
-                cropToCutline=True
-            )
+            src_dataset = gdal.Open(str(input_path), gdal.GA_ReadOnly)
+            if src_dataset is None:
+                raise ValueError(f"无法打开源文件: {input_path}")
+            creation_options = _gtiff_creation_options(src_dataset.GetRasterBand(1).DataType)
+            
+            if isinstance(region_bounds, (str, Path)):
+                # 多边形裁剪需要走Warp流程
+                result = gdal.Warp(
+                    str(output_path),
+                    src_dataset,
+                    cutlineDSName=str(region_bounds),
+                    cropToCutline=True,
+                    creationOptions=creation_options
+                )
+            else:
+                # 矩形裁剪在同一坐标系下只是窗口拷贝，无需坐标变换和重采样
+                min_x, min_y, max_x, max_y = region_bounds
+                result = gdal.Translate(
+                    str(output_path),
+                    src_dataset,
+                    projWin=[min_x, max_y, max_x, min_y],
+                    creationOptions=creation_options
+                )
+            if result is None:
+                raise ValueError(f"裁剪失败: {gdal.GetLastErrorMsg()}")
+            result = None  # 释放资源
+            src_dataset = None
             
             logger.info(f"区域裁剪完成: {input_path} -> {output_path}")
             logger.info(f"  裁剪区域: {region_bounds}")
@@ -335,6 +787,7 @@ class DataPreprocessor:
             logger.error(f"区域裁剪失败: {e}")
             return False
     
+    @_with_gdal_config
     def resample_data(self, input_path, output_path, target_resolution, resample_method='bilinear'):
         """
         重采样数据到指定分辨率
@@ -349,28 +802,48 @@ class DataPreprocessor:
             bool: 重采样是否成功
         """
         try:
-            # 映射重采样方法
+            # 映射重采样方法（Translate与Warp均接受的GDAL名称）
             method_map = {
-                'nearest': gdal.GRA_NearestNeighbour,
-                'bilinear': gdal.GRA_Bilinear,
-                'cubic': gdal.GRA_Cubic,
-                'cubic_spline': gdal.GRA_CubicSpline,
-                'lanczos': gdal.GRA_Lanczos
+                'nearest': 'near',
+                'bilinear': 'bilinear',
+                'cubic': 'cubic',
+                'cubic_spline': 'cubicspline',
+                'lanczos': 'lanczos'
             }
             
-            resample_alg = method_map.get(resample_method, gdal.GRA_Bilinear)
+            resample_alg = method_map.get(resample_method, 'bilinear')
             
-            # 执行重采样
-            result = gdal.Warp(
-                str(output_path),
-                input_path,
-                xRes=target_resolution,
-                yRes=target_resolution,
-                resampleAlg=resample_alg
-            )
+            src_dataset = gdal.Open(str(input_path), gdal.GA_ReadOnly)
+            if src_dataset is None:
+                raise ValueError(f"无法打开源文件: {input_path}")
+            geotransform = src_dataset.GetGeoTransform()
+            creation_options = _gtiff_creation_options(src_dataset.GetRasterBand(1).DataType)
+            
+            # 坐标系不变，北向上的影像只需缩放，走Translate的重采样路径即可，无需Warp
+            if geotransform[2] == 0 and geotransform[4] == 0:
+                result = gdal.Translate(
+                    str(output_path),
+                    src_dataset,
+                    xRes=target_resolution,
+                    yRes=target_resolution,
+                    resampleAlg=resample_alg,
+                    creationOptions=creation_options
+                )
+            else:
+                result = gdal.Warp(
+                    str(output_path),
+                    src_dataset,
+                    xRes=target_resolution,
+                    yRes=target_resolution,
+                    resampleAlg=resample_alg,
+                    warpMemoryLimit=1 << 30,
+                    multithread=True,
+                    creationOptions=creation_options
+                )
             if result is None:
                 raise ValueError(f"重采样失败: {gdal.GetLastErrorMsg()}")
             result = None  # 释放资源
+            src_dataset = None
             
             logger.info(f"数据重采样完成: {input_path} -> {output_path}")
             logger.info(f"  目标分辨率: {target_resolution}米")
@@ -382,6 +855,51 @@ class DataPreprocessor:
             logger.error(f"数据重采样失败: {e}")
             return False
     
+    def _process_bands(self, data_dir, band_patterns, band_names, output_path, target_epsg, sensor):
+        """
+        通用多波段处理流程：查找波段文件 -> 验证 -> VRT堆叠并一次重投影输出
+        
+        Args:
+            data_dir: 数据目录
+            band_patterns: {波段名: 通配符模式或模式列表}，按输出波段顺序排列
+            band_names: 与band_patterns一一对应的输出波段名称
+            output_path: 输出文件路径
+            target_epsg: 目标EPSG代码
+            sensor: 传感器名称（用于日志）
+            
+        Returns:
+            dict: 输出文件的验证信息
+        """
+        band_files = _find_band_files(data_dir, band_patterns)
+        for band_name in band_patterns:
+            if band_name in band_files:
+                logger.info(f"找到{band_name}波段: {os.path.basename(band_files[band_name])}")
+            else:
+                logger.warning(f"未找到{band_name}波段文件")
+        
+        if not band_files:
+            raise ValueError(f"未找到任何{sensor}波段文件")
+        
+        logger.info(f"找到{len(band_files)}个波段文件")
+        
+        # 验证所有波段文件
+        for band_name, file_path in band_files.items():
+            validation = self.validate_input_data(file_path)
+            if not validation['valid']:
+                raise ValueError(f"{band_name}波段文件验证失败: {validation['error']}")
+        
+        # 坐标转换与波段合并一次完成（VRT堆叠 + 单次Warp）
+        band_paths = [band_files[band] for band in band_patterns if band in band_files]
+        output_names = [name for band, name in zip(band_patterns, band_names) if band in band_files]
+        
+        logger.info(f"准备合并{len(band_paths)}个波段")
+        
+        validation = self._stack_and_warp(band_paths, output_names, output_path, target_epsg)
+        if not validation:
+            raise ValueError("波段重投影合并失败")
+        return validation
+    
+    @_with_gdal_config
     def process_landsat_data(self, landsat_dir, output_path, target_epsg=32650):
         """
         处理Landsat数据
@@ -395,59 +913,18 @@ class DataPreprocessor:
             bool: 处理是否成功
         """
         try:
-            landsat_dir = Path(landsat_dir)
-            
-            # 查找Landsat波段文件
-            band_patterns = {
-                'B2': '*_SR_B2.TIF',  # 蓝波段
-                'B3': '*_SR_B3.TIF',  # 绿波段
-                'B4': '*_SR_B4.TIF',  # 红波段
-                'B5': '*_SR_B5.TIF',  # 近红外波段
-                'B6': '*_SR_B6.TIF',  # 短波红外1
-                'B7': '*_SR_B7.TIF'   # 短波红外2
-            }
-            
-            band_files = {}
-            for band_name, pattern in band_patterns.items():
-                files = list(landsat_dir.glob(pattern))
-                if files:
-                    band_files[band_name] = str(files[0])
-                else:
-                    logger.warning(f"未找到{band_name}波段文件")
-            
-            if not band_files:
-                raise ValueError("未找到任何Landsat波段文件")
-            
-            # 验证所有波段文件
-            for band_name, file_path in band_files.items():
-                validation = self.validate_input_data(file_path)
-                if not validation['valid']:
-                    raise ValueError(f"{band_name}波段文件验证失败: {validation['error']}")
-            
-            # 转换坐标系统
-            converted_files = {}
-            for band_name, file_path in band_files.items():
-                converted_path = self.temp_dir / f"{band_name}_converted.tif"
-                if self.convert_coordinate_system(file_path, converted_path, target_epsg):
-                    converted_files[band_name] = str(converted_path)
-                else:
-                    raise ValueError(f"{band_name}波段坐标转换失败")
-            
-            # 合并波段
-            band_order = ['B2', 'B3', 'B4', 'B5', 'B6', 'B7']
-            band_paths = [converted_files[band] for band in band_order if band in converted_files]
-            band_names = ['Blue', 'Green', 'Red', 'NIR', 'SWIR1', 'SWIR2']
-            
-            if self.merge_bands(band_paths, output_path, band_names):
-                logger.info(f"Landsat数据处理完成: {output_path}")
-                return True
-            else:
-                raise ValueError("波段合并失败")
+            self._process_bands(
+                landsat_dir, self.LANDSAT_BAND_PATTERNS, self.BAND_NAMES,
+                output_path, target_epsg, 'Landsat'
+            )
+            logger.info(f"Landsat数据处理完成: {output_path}")
+            return True
                 
         except Exception as e:
             logger.error(f"Landsat数据处理失败: {e}")
             return False
     
+    @_with_gdal_config
     def process_sentinel_data(self, sentinel_dir, output_path, target_epsg=32650):
         """
         处理Sentinel-2数据
@@ -461,79 +938,13 @@ class DataPreprocessor:
             bool: 处理是否成功
         """
         try:
-            sentinel_dir = Path(sentinel_dir)
-            
-            # 查找Sentinel-2波段文件 - 支持多种命名格式
-            band_patterns = {
-                'B02': ['*_B02_10m.jp2', '*_B02.jp2'],  # 蓝波段
-                'B03': ['*_B03_10m.jp2', '*_B03.jp2'],  # 绿波段
-                'B04': ['*_B04_10m.jp2', '*_B04.jp2'],  # 红波段
-                'B08': ['*_B08_10m.jp2', '*_B08.jp2'],  # 近红外波段
-                'B11': ['*_B11_20m.jp2', '*_B11.jp2'],  # 短波红外1
-                'B12': ['*_B12_20m.jp2', '*_B12.jp2']   # 短波红外2
-            }
-            
-            band_files = {}
-            for band_name, patterns in band_patterns.items():
-                found = False
-                for pattern in patterns:
-                    files = list(sentinel_dir.glob(pattern))
-                    if files:
-                        band_files[band_name] = str(files[0])
-                        logger.info(f"找到{band_name}波段: {files[0].name}")
-                        found = True
-                        break
-                if not found:
-                    logger.warning(f"未找到{band_name}波段文件")
-            
-            if not band_files:
-                raise ValueError("未找到任何Sentinel-2波段文件")
-            
-            logger.info(f"找到{len(band_files)}个波段文件")
-            
-            # 验证所有波段文件
-            for band_name, file_path in band_files.items():
-                logger.info(f"验证{band_name}波段文件...")
-                validation = self.validate_input_data(file_path)
-                if not validation['valid']:
-                    raise ValueError(f"{band_name}波段文件验证失败: {validation['error']}")
-                logger.info(f"{band_name}波段验证通过")
-            
-            # 转换坐标系统
-            logger.info("开始坐标系统转换...")
-            converted_files = {}
-            for band_name, file_path in band_files.items():
-                logger.info(f"转换{band_name}波段坐标系统...")
-                converted_path = self.temp_dir / f"{band_name}_converted.tif"
-                
-                success = self.convert_coordinate_system(file_path, converted_path, target_epsg)
-                if success and converted_path.exists():
-                    converted_files[band_name] = str(converted_path)
-                    logger.info(f"{band_name}波段坐标转换成功")
-                else:
-                    raise ValueError(f"{band_name}波段坐标转换失败")
-            
-            # 合并波段（跳过重采样，直接使用转换后的文件）
-            logger.info("开始波段合并...")
-            band_order = ['B02', 'B03', 'B04', 'B08', 'B11', 'B12']
-            band_paths = [converted_files[band] for band in band_order if band in converted_files]
-            band_names = ['Blue', 'Green', 'Red', 'NIR', 'SWIR1', 'SWIR2']
-            
-            logger.info(f"准备合并{len(band_paths)}个波段")
-            
-            success = self.merge_bands(band_paths, output_path, band_names)
-            if success and Path(output_path).exists():
-                logger.info(f"Sentinel-2数据处理完成: {output_path}")
-                
-                # 验证输出文件
-                validation = self.validate_input_data(output_path)
-                if validation['valid']:
-                    logger.info(f"输出文件验证通过: {validation['width']}x{validation['height']}, {validation['band_count']}波段")
-                    return True
-                else:
-                    raise ValueError(f"输出文件验证失败: {validation['error']}")
-            else:
-                raise ValueError("波段合并失败")
+            validation = self._process_bands(
+                sentinel_dir, self.SENTINEL_BAND_PATTERNS, self.BAND_NAMES,
+                output_path, target_epsg, 'Sentinel-2'
+            )
+            logger.info(f"Sentinel-2数据处理完成: {output_path}")
+            logger.info(f"输出文件验证通过: {validation['width']}x{validation['height']}, {validation['band_count']}波段")
+            return True
                 
         except Exception as e:
             logger.error(f"Sentinel-2数据处理失败: {e}")
@@ -541,6 +952,7 @@ class DataPreprocessor:
             logger.error(f"详细错误信息: {traceback.format_exc()}")
             return False
     
+    @_with_gdal_config
     def process_landuse_data(self, landuse_path, output_path, target_epsg=32650):
         """
         处理土地利用数据
@@ -590,8 +1002,14 @@ class DataPreprocessor:
             }
             
             report_path = self.output_dir / output_path
-            with open(report_path, 'w', encoding='utf-8') as f:
-                json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+            if orjson is not None:
+                report_path.write_bytes(orjson.dumps(
+                    report,
+                    option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+                ))
+            else:
+                with open(report_path, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, indent=2, ensure_ascii=False, default=str)
             
             logger.info(f"处理报告已生成: {report_path}")
             
@@ -614,45 +1032,47 @@ def main():
     args = parser.parse_args()
     
     # 创建预处理器
-    preprocessor = DataPreprocessor(args.output_dir)
-    
-    try:
-        if args.data_type == 'landsat':
-            output_path = Path(args.output_dir) / "landsat_processed.tif"
-            success = preprocessor.process_landsat_data(args.input_dir, output_path, args.target_epsg)
-        elif args.data_type == 'sentinel':
-            output_path = Path(args.output_dir) / "sentinel_processed.tif"
-            success = preprocessor.process_sentinel_data(args.input_dir, output_path, args.target_epsg)
-        elif args.data_type == 'landuse':
-            output_path = Path(args.output_dir) / "landuse_processed.tif"
-            success = preprocessor.process_landuse_data(args.input_dir, output_path, args.target_epsg)
-        
-        if success:
-            # 可选的裁剪
-            if args.clip_region:
-                clipped_path = output_path.parent / f"{output_path.stem}_clipped.tif"
-                preprocessor.clip_to_region(output_path, clipped_path, args.clip_region)
-                output_path = clipped_path
-            
-            # 可选的重采样
-            if args.resample_resolution:
-                resampled_path = output_path.parent / f"{output_path.stem}_resampled.tif"
-                preprocessor.resample_data(output_path, resampled_path, args.resample_resolution)
-                output_path = resampled_path
-            
-            print(f"✅ 数据处理完成: {output_path}")
-        else:
-            print("❌ 数据处理失败")
+    with DataPreprocessor(args.output_dir) as preprocessor:
+        try:
+            if args.data_type == 'landsat':
+                output_path = Path(args.output_dir) / "landsat_processed.tif"
+                success = preprocessor.process_landsat_data(args.input_dir, output_path, args.target_epsg)
+            elif args.data_type == 'sentinel':
+                output_path = Path(args.output_dir) / "sentinel_processed.tif"
+                success = preprocessor.process_sentinel_data(args.input_dir, output_path, args.target_epsg)
+            elif args.data_type == 'landuse':
+                output_path = Path(args.output_dir) / "landuse_processed.tif"
+                success = preprocessor.process_landuse_data(args.input_dir, output_path, args.target_epsg)
+            
+            if success:
+                # 可选的裁剪（随后还要重采样时，裁剪结果只作为中间文件）
+                if args.clip_region:
+                    if args.resample_resolution:
+                        clipped_path = preprocessor.temp_path(f"{output_path.stem}_clipped.tif")
+                    else:
+                        clipped_path = output_path.parent / f"{output_path.stem}_clipped.tif"
+                    preprocessor.clip_to_region(output_path, clipped_path, args.clip_region)
+                    output_path = Path(clipped_path)
+                
+                # 可选的重采样
+                if args.resample_resolution:
+                    resampled_path = Path(args.output_dir) / f"{output_path.stem}_resampled.tif"
+                    preprocessor.resample_data(output_path, resampled_path, args.resample_resolution)
+                    output_path = resampled_path
+                
+                print(f"✅ 数据处理完成: {output_path}")
+            else:
+                print("❌ 数据处理失败")
+                return 1
+            
+            # 生成处理报告
+            preprocessor.create_processing_report()
+            
+            return 0
+            
+        except Exception as e:
+            print(f"❌ 处理过程中发生错误: {e}")
             return 1
-        
-        # 生成处理报告
-        preprocessor.create_processing_report()
-        
-        return 0
-        
-    except Exception as e:
-        print(f"❌ 处理过程中发生错误: {e}")
-        return 1
 
 
 if __name__ == "__main__":
@@ -1,24 +1,308 @@
 import numpy as np
 import rasterio
-from rasterio.mask import mask
-from rasterio.warp import calculate_default_transform, reproject, Resampling
-import matplotlib.pyplot as plt
-import matplotlib.colors as colors
-from matplotlib.colors import LinearSegmentedColormap
+from affine import Affine
+from rasterio.enums import Resampling
+from rasterio.windows import Window
 import os
-import tempfile
-from PIL import Image
-import pandas as pd
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
+import functools
 import logging
+import threading
+from collections import deque
+from contextlib import ExitStack, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from ._kernels import (
+    HAVE_NUMBA, NORM_DIFF_INDEX_NAMES, accumulate_moments, class_counts, fused_indices,
+    nan_stats, quantize_uint8
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _norm_diff(a, b, out=None):
+    """
+    计算归一化差值 (a - b) / (a + b)，结果为float32并限制在[-1, 1]
+    
+    分母为0的像素结果为0
+    
+    Args:
+        a: 被减波段
+        b: 减数波段
+        out: 可选的输出数组
+        
+    Returns:
+        np.ndarray: 归一化差值
+    """
+    num = np.subtract(a, b, out=out, dtype=np.float32)
+    den = np.add(a, b, dtype=np.float32)
+    zero = den == 0
+    np.divide(num, den, out=num, where=~zero)
+    num[zero] = 0
+    np.clip(num, -1, 1, out=num)
+    return num
+
+
+# Tasseled Cap变换系数（Landsat 8），列顺序: blue, green, red, nir, swir1, swir2
+# 这些系数需要根据具体的传感器调整
+_TC_NAMES = ('greenness', 'wetness', 'dryness', 'heat')
+_TC_COEFFS = np.array([
+    [-0.2941, -0.2430, -0.5424, 0.7276, 0.0713, -0.1608],
+    [0.1511, 0.1973, 0.3283, 0.3407, -0.7117, -0.4559],
+    [-0.2936, -0.2434, -0.5424, 0.7276, 0.0713, -0.1608],
+    [0.0315, 0.2021, 0.3102, 0.1594, -0.6806, -0.6109],
+], dtype=np.float32)
+_TC_COEFFS.setflags(write=False)
+
+
+def _tasseled_cap(bands, coeffs):
+    """
+    Tasseled Cap变换: (K, 6) 系数矩阵乘以 (6, H, W) 波段，得到 (K, H, W)
+    """
+    n_bands, height, width = bands[:6].shape
+    bands_2d = bands[:6].reshape(n_bands, -1).astype(np.float32, copy=False)
+    return (coeffs @ bands_2d).reshape(coeffs.shape[0], height, width)
+
+
+# 输出GeoTIFF的金字塔级别
+OVERVIEW_FACTORS = [2, 4, 8, 16, 32]
+
+# 输出GeoTIFF的分块边长；流式计算按同一网格划分窗口，每个输出分块只写一次
+RESULT_BLOCK_SIZE = 512
+
+# 有界指数（归一化差值指数取值[-1, 1]，RSEI取值[0, 1]）按int16定点存储：指数值 = 存储值 * RESULT_SCALE
+RESULT_SCALE = 1e-4
+RESULT_INT16_NODATA = -32768
+
+
+def _to_scaled_int16(index_data):
+    """将有界指数量化为int16定点值，NaN写为RESULT_INT16_NODATA"""
+    values = np.multiply(index_data, np.float32(1 / RESULT_SCALE), dtype=np.float32)
+    invalid = np.isnan(values)
+    np.rint(values, out=values)
+    np.clip(values, -32767, 32767, out=values)
+    out = values.astype(np.int16)
+    out[invalid] = RESULT_INT16_NODATA
+    return out
+
+
+def _read_result_band(src, **kwargs):
+    """
+    读取结果GeoTIFF的第1波段为float32，无效值为NaN，int16定点存储的结果按波段scale还原
+    
+    Args:
+        src: rasterio数据集
+        **kwargs: 传给src.read的参数（window、out_shape、resampling等）
+    """
+    values = src.read(1, masked=True, out_dtype='float32', **kwargs).filled(np.nan)
+    scale = src.scales[0]
+    if scale != 1:
+        values *= np.float32(scale)
+    return values
+
+
+# 可视化配色（由低到高）
+VISUALIZATION_COLORS = ['#8B0000', '#FF0000', '#FFA500', '#FFFF00', '#00FF00', '#006400']
+
+
+def _build_colormap_lut(colors_hex, n=256):
+    """在颜色节点间线性插值，生成 (n, 3) uint8 颜色查找表"""
+    nodes = np.array(
+        [[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in colors_hex],
+        dtype=np.float64
+    )
+    node_positions = np.linspace(0, 1, len(colors_hex))
+    positions = np.linspace(0, 1, n)
+    lut = np.stack(
+        [np.interp(positions, node_positions, nodes[:, c]) for c in range(3)],
+        axis=1
+    )
+    return np.round(lut).astype(np.uint8)
+
+
+# 前255个颜色为指数配色，最后一个（索引255）为无效值颜色（白色）
+_COLORMAP_LEVELS = 255
+_COLORMAP_LUT = np.vstack([
+    _build_colormap_lut(VISUALIZATION_COLORS, n=_COLORMAP_LEVELS),
+    np.array([[255, 255, 255]], dtype=np.uint8)
+])
+
+
+def _to_uint8(data, vmin=None, vmax=None):
+    """
+    将指数数组线性量化为uint8颜色索引，NaN映射为无效值颜色索引
+    
+    Args:
+        data: 指数数组
+        vmin: 拉伸下限，为None时取2%分位数
+        vmax: 拉伸上限，为None时取98%分位数
+        
+    Returns:
+        tuple: (uint8数组, vmin, vmax)
+    """
+    if vmin is None or vmax is None:
+        vmin, vmax = np.nanpercentile(data, [2, 98])
+    scale = (_COLORMAP_LEVELS - 1) / (vmax - vmin) if vmax > vmin else 0.0
+    out = np.empty(data.shape, dtype=np.uint8)
+    quantize_uint8(data, np.float32(vmin), np.float32(scale), _COLORMAP_LEVELS, out)
+    return out, vmin, vmax
+
+
+def _downsample(data, max_size):
+    """
+    按整数倍块均值降采样，使最长边不超过max_size（NaN不参与平均）
+    
+    Args:
+        data: 二维数组
+        max_size: 最长边像素数
+        
+    Returns:
+        np.ndarray: float32数组，无需降采样时返回原数组
+    """
+    factor = -(-max(data.shape) // max_size)
+    if factor <= 1:
+        return data
+    
+    height, width = data.shape[0] // factor, data.shape[1] // factor
+    blocks = data[:height * factor, :width * factor].reshape(height, factor, width, factor)
+    valid = np.isfinite(blocks)
+    sums = np.where(valid, blocks, 0).sum(axis=(1, 3), dtype=np.float32)
+    counts = valid.sum(axis=(1, 3))
+    result = np.full((height, width), np.nan, dtype=np.float32)
+    np.divide(sums, counts, out=result, where=counts > 0)
+    return result
+
+
+def _append_colorbar(image, vmin, vmax, label, bar_width=20, margin=70):
+    """在图片右侧拼接颜色条及最小/最大值标注"""
+    from PIL import Image, ImageDraw
+    
+    height = image.height
+    gradient = _COLORMAP_LUT[np.linspace(_COLORMAP_LEVELS - 1, 0, height).astype(np.uint8)]
+    bar = np.repeat(gradient[:, np.newaxis, :], bar_width, axis=1)
+    
+    canvas = Image.new('RGB', (image.width + bar_width + margin, height), 'white')
+    canvas.paste(image, (0, 0))
+    canvas.paste(Image.fromarray(bar, 'RGB'), (image.width + 5, 0))
+    
+    draw = ImageDraw.Draw(canvas)
+    text_x = image.width + bar_width + 10
+    draw.text((text_x, 0), f"{vmax:.3g}", fill='black')
+    draw.text((text_x, max(height // 2 - 5, 0)), str(label), fill='black')
+    draw.text((text_x, max(height - 12, 0)), f"{vmin:.3g}", fill='black')
+    return canvas
+
+
+# 分级统计的五个等级（按分箱序号由低到高）
+_CLASS_NAMES = ('bad', 'poor', 'moderate', 'good', 'excellent')
+
+# 每个像素的面积（km²），假设30米分辨率
+_AREA_PER_PIXEL = 30 * 30 / 1000000
+
+
+def _base_statistics(n_valid, min_val, max_val, total, total_sq):
+    """
+    由有效像素数、最值、和与平方和得到基础统计量
+    
+    Returns:
+        dict: min/max/mean/std统计量，无有效像素时返回None
+    """
+    if n_valid == 0:
+        return None
+    
+    mean_val = total / n_valid
+    std_val = np.sqrt(max(total_sq / n_valid - mean_val * mean_val, 0.0))
+    return {
+        'min_value': float(min_val),
+        'max_value': float(max_val),
+        'mean_value': float(mean_val),
+        'std_value': float(std_val),
+    }
+
+
+def _class_edges(stats, dtype):
+    """基于均值和标准差的分级阈值：poor, moderate, good, excellent"""
+    mean_val = stats['mean_value']
+    std_val = stats['std_value']
+    return np.array([
+        mean_val - 1.5 * std_val,
+        mean_val - 0.5 * std_val,
+        mean_val + 0.5 * std_val,
+        mean_val + 1.5 * std_val,
+    ], dtype=dtype)
+
+
+def _class_counts(index_data, edges, n_valid):
+    """
+    一次分箱统计五个等级的像素数：0=bad, 1=poor, 2=moderate, 3=good, 4=excellent
+    
+    有Numba时由class_counts内核直接计数，不生成逐像素的分箱序号数组
+    
+    Args:
+        index_data: 二维指数数组
+        edges: 分级阈值
+        n_valid: index_data中的非NaN像素数
+    """
+    if class_counts is not None:
+        return class_counts(index_data, edges)
+    counts = np.bincount(np.digitize(index_data.ravel(), edges), minlength=5)
+    # NaN被分到最高一档，扣除无效像素
+    counts[4] -= index_data.size - n_valid
+    return counts
+
+
+def _class_areas(counts, area_per_pixel=_AREA_PER_PIXEL):
+    """各等级像素数换算为面积（km²）"""
+    return {
+        f'{name}_area': float(count * area_per_pixel)
+        for name, count in zip(_CLASS_NAMES, counts)
+    }
+
+
+def _safe(action):
+    """
+    装饰器：捕获方法中的异常，记录"{action}失败"日志并返回None
+    
+    Args:
+        action: 日志中描述的操作名称
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            except Exception as e:
+                logger.error(f"{action}失败: {e}")
+                return None
+        return wrapper
+    return decorator
+
+
 class EcologicalIndexCalculator:
     """生态指数计算器"""
     
+    # Tasseled Cap分量名 -> _TC_COEFFS中的行号
+    TASSELED_CAP_COEFFICIENTS = {name: k for k, name in enumerate(_TC_NAMES)}
+    
+    # 归一化差值指数所用波段索引 (a, b)，指数 = (a - b) / (a + b)
+    NORM_DIFF_BANDS = {
+        'ndvi': (3, 2),
+        'ndwi': (1, 3),
+        'ndbi': (4, 3),
+        'ndsi': (1, 4),
+    }
+    
+    # 取值有界、结果按int16定点存储的指数
+    SCALED_INDEX_TYPES = frozenset(NORM_DIFF_BANDS) | {'rsei'}
+    
+    # RSEI主成分分析拟合所用的最大抽样像素数
+    RSEI_PCA_SAMPLE_SIZE = 200_000
+    
+    # 像素数超过该值时，逐像素指数改为分块流式计算（见run_streaming_indices）
+    STREAMING_PIXEL_THRESHOLD = 100_000_000
+    
+    # 可视化预览图的最大边长（像素）
+    PREVIEW_MAX_SIZE = 2000
+    
     def __init__(self, image_path):
         """
         初始化计算器
@@ -29,375 +313,552 @@ class EcologicalIndexCalculator:
         self.image_path = image_path
         self.dataset = None
         self.bands = None
+        # float32波段缓存，供各指数计算共享；调用方不得原地修改
+        self._bands_f32 = None
         self.metadata = None
+        # 已计算指数的缓存 {指数名: 数组}，重新加载影像时清空
+        self._cache = {}
+        # RSEI计算结果（含主成分分析结果）缓存，重新加载影像时清空
+        self._rsei_result = None
+        # 当前读取分辨率下每个像素对应的地面面积（km²），降采样读取时按倍数放大
+        self._area_per_pixel = _AREA_PER_PIXEL
+        
+    def load_image(self, read_bands=True, overview_factor=1, use_memmap=False):
+        """
+        加载遥感影像
         
-    def load_image(self):
-        """加载遥感影像"""
+        Args:
+            read_bands: 是否将全部波段读入内存；分块流式处理(run_streaming_indices)时可设为False
+            overview_factor: 降采样倍数，大于1时按均值重采样读取 (H/k, W/k) 的影像，
+                像素数减少为1/k²；此时各指数及统计量均基于降采样后的影像，
+                分级面积按每个像素对应的原始像素数换算，仍为实际地面面积
+            use_memmap: 影像为未压缩GeoTIFF时设为True，全分辨率读取通过内存映射
+                (GTIFF_VIRTUAL_MEM_IO) 直接从页缓存拷贝，不经过GDAL块缓存
+        """
         try:
             self.dataset = rasterio.open(self.image_path)
-            self.bands = self.dataset.read()
-            self.metadata = self.dataset.meta
+            self.metadata = self.dataset.meta.copy()
+            self._area_per_pixel = _AREA_PER_PIXEL
+            if read_bands:
+                if overview_factor > 1:
+                    height = max(self.dataset.height // overview_factor, 1)
+                    width = max(self.dataset.width // overview_factor, 1)
+                    # 有内部金字塔时GDAL会直接读取对应级别
+                    self.bands = self.dataset.read(
+                        out_shape=(self.dataset.count, height, width),
+                        out_dtype='float32',
+                        resampling=Resampling.average
+                    )
+                    self.metadata.update({
+                        'height': height,
+                        'width': width,
+                        'transform': self.dataset.transform * Affine.scale(
+                            self.dataset.width / width, self.dataset.height / height
+                        )
+                    })
+                    self._area_per_pixel = _AREA_PER_PIXEL * (
+                        self.dataset.width * self.dataset.height / (width * height)
+                    )
+                else:
+                    # 直接按float32读取，后续转换为零拷贝
+                    env = rasterio.Env(GTIFF_VIRTUAL_MEM_IO='YES') if use_memmap else nullcontext()
+                    with env:
+                        self.bands = self.dataset.read(out_dtype='float32')
+                self._bands_f32 = self.bands.astype(np.float32, copy=False)
+            else:
+                self.bands = None
+                self._bands_f32 = None
+            self._cache = {}
+            self._rsei_result = None
             logger.info(f"成功加载影像: {self.image_path}")
             return True
         except Exception as e:
             logger.error(f"加载影像失败: {e}")
             return False
     
+    def _fused_indices_all(self):
+        """
+        使用Numba融合内核一次遍历计算全部归一化差值指数和Tasseled Cap分量
+        
+        Returns:
+            dict: {指数名: 二维数组}
+        """
+        tc_names = list(_TC_NAMES)
+        _, height, width = self._bands_f32.shape
+        names = list(NORM_DIFF_INDEX_NAMES) + tc_names
+        out = np.empty((len(names), height, width), dtype=np.float32)
+        fused_indices(self._bands_f32, _TC_COEFFS, out)
+        return dict(zip(names, out))
+    
+    def _norm_diff(self, a_idx, b_idx, out=None):
+        """计算当前影像两个波段的归一化差值"""
+        return _norm_diff(self._bands_f32[a_idx], self._bands_f32[b_idx], out=out)
+    
+    def _index(self, name):
+        """
+        获取逐像素指数，结果缓存在self._cache中，各方法（包括RSEI）共享
+        
+        有Numba且影像至少6个波段时一次融合遍历填充全部指数（融合内核不做越界检查）；
+        否则归一化差值指数逐个计算，Tasseled Cap四个分量由一次矩阵乘法（4x6 · 6x(H*W)）同时填充，
+        波段不足时抛出的异常由_safe捕获
+        
+        Args:
+            name: 指数名
+            
+        Returns:
+            np.ndarray: float32二维数组
+        """
+        if name not in self._cache:
+            if HAVE_NUMBA and self._bands_f32.shape[0] >= 6:
+                self._cache.update(self._fused_indices_all())
+            elif name in self.NORM_DIFF_BANDS:
+                self._cache[name] = self._norm_diff(*self.NORM_DIFF_BANDS[name])
+            else:
+                components = _tasseled_cap(self._bands_f32, _TC_COEFFS)
+                self._cache.update(zip(_TC_NAMES, components))
+        return self._cache[name]
+    
+    @_safe("计算NDVI")
     def calculate_ndvi(self):
         """计算NDVI（归一化植被指数）"""
-        try:
-            # 假设红波段和近红外波段分别为第3和第4波段
-            red_band = self.bands[2].astype(float)  # 红波段
-            nir_band = self.bands[3].astype(float)  # 近红外波段
-            
-            # 避免除零错误
-            denominator = nir_band + red_band
-            denominator[denominator == 0] = 1e-10
-            
-            ndvi = (nir_band - red_band) / denominator
-            
-            # 限制值范围在[-1, 1]
-            ndvi = np.clip(ndvi, -1, 1)
-            
-            return ndvi
-        except Exception as e:
-            logger.error(f"计算NDVI失败: {e}")
-            return None
+        # 假设红波段和近红外波段分别为第3和第4波段
+        return self._index('ndvi')
     
+    @_safe("计算NDWI")
     def calculate_ndwi(self):
         """计算NDWI（归一化水体指数）"""
-        try:
-            # 假设绿波段和近红外波段分别为第2和第4波段
-            green_band = self.bands[1].astype(float)  # 绿波段
-            nir_band = self.bands[3].astype(float)  # 近红外波段
-            
-            denominator = green_band + nir_band
-            denominator[denominator == 0] = 1e-10
-            
-            ndwi = (green_band - nir_band) / denominator
-            ndwi = np.clip(ndwi, -1, 1)
-            
-            return ndwi
-        except Exception as e:
-            logger.error(f"计算NDWI失败: {e}")
-            return None
+        # 假设绿波段和近红外波段分别为第2和第4波段
+        return self._index('ndwi')
     
+    @_safe("计算NDBI")
     def calculate_ndbi(self):
         """计算NDBI（归一化建筑指数）"""
-        try:
-            # 假设近红外波段和中红外波段分别为第4和第5波段
-            nir_band = self.bands[3].astype(float)  # 近红外波段
-            swir_band = self.bands[4].astype(float)  # 中红外波段
-            
-            denominator = nir_band + swir_band
-            denominator[denominator == 0] = 1e-10
-            
-            ndbi = (swir_band - nir_band) / denominator
-            ndbi = np.clip(ndbi, -1, 1)
-            
-            return ndbi
-        except Exception as e:
-            logger.error(f"计算NDBI失败: {e}")
-            return None
+        # 假设近红外波段和中红外波段分别为第4和第5波段
+        return self._index('ndbi')
     
+    @_safe("计算NDSI")
     def calculate_ndsi(self):
         """计算NDSI（归一化积雪指数）"""
-        try:
-            # 假设绿波段和中红外波段分别为第2和第5波段
-            green_band = self.bands[1].astype(float)  # 绿波段
-            swir_band = self.bands[4].astype(float)  # 中红外波段
-            
-            denominator = green_band + swir_band
-            denominator[denominator == 0] = 1e-10
-            
-            ndsi = (green_band - swir_band) / denominator
-            ndsi = np.clip(ndsi, -1, 1)
-            
-            return ndsi
-        except Exception as e:
-            logger.error(f"计算NDSI失败: {e}")
-            return None
+        # 假设绿波段和中红外波段分别为第2和第5波段
+        return self._index('ndsi')
+    
+    def _tasseled_cap_matrix(self, names):
+        """按给定分量顺序从_TC_COEFFS中取出 (K, 6) float32 系数矩阵"""
+        return _TC_COEFFS[[self.TASSELED_CAP_COEFFICIENTS[name] for name in names]]
     
+    @_safe("计算湿度指数")
     def calculate_wetness(self):
         """计算湿度指数（基于Tasseled Cap变换）"""
-        try:
-            # Tasseled Cap变换系数（Landsat 8）
-            # 这些系数需要根据具体的传感器调整
-            coefficients = {
-                'blue': 0.1511,
-                'green': 0.1973,
-                'red': 0.3283,
-                'nir': 0.3407,
-                'swir1': -0.7117,
-                'swir2': -0.4559
-            }
-            
-            wetness = (
-                coefficients['blue'] * self.bands[0] +
-                coefficients['green'] * self.bands[1] +
-                coefficients['red'] * self.bands[2] +
-                coefficients['nir'] * self.bands[3] +
-                coefficients['swir1'] * self.bands[4] +
-                coefficients['swir2'] * self.bands[5]
-            )
-            
-            return wetness
-        except Exception as e:
-            logger.error(f"计算湿度指数失败: {e}")
-            return None
+        return self._index('wetness')
     
+    @_safe("计算干度指数")
     def calculate_dryness(self):
         """计算干度指数（基于Tasseled Cap变换）"""
-        try:
-            # Tasseled Cap变换系数（Landsat 8）
-            coefficients = {
-                'blue': -0.2936,
-                'green': -0.2434,
-                'red': -0.5424,
-                'nir': 0.7276,
-                'swir1': 0.0713,
-                'swir2': -0.1608
-            }
-            
-            dryness = (
-                coefficients['blue'] * self.bands[0] +
-                coefficients['green'] * self.bands[1] +
-                coefficients['red'] * self.bands[2] +
-                coefficients['nir'] * self.bands[3] +
-                coefficients['swir1'] * self.bands[4] +
-                coefficients['swir2'] * self.bands[5]
-            )
-            
-            return dryness
-        except Exception as e:
-            logger.error(f"计算干度指数失败: {e}")
-            return None
+        return self._index('dryness')
     
+    @_safe("计算热度指数")
     def calculate_heat(self):
         """计算热度指数（基于Tasseled Cap变换）"""
-        try:
-            # Tasseled Cap变换系数（Landsat 8）
-            coefficients = {
-                'blue': 0.0315,
-                'green': 0.2021,
-                'red': 0.3102,
-                'nir': 0.1594,
-                'swir1': -0.6806,
-                'swir2': -0.6109
-            }
-            
-            heat = (
-                coefficients['blue'] * self.bands[0] +
-                coefficients['green'] * self.bands[1] +
-                coefficients['red'] * self.bands[2] +
-                coefficients['nir'] * self.bands[3] +
-                coefficients['swir1'] * self.bands[4] +
-                coefficients['swir2'] * self.bands[5]
-            )
-            
-            return heat
-        except Exception as e:
-            logger.error(f"计算热度指数失败: {e}")
-            return None
+        return self._index('heat')
     
+    @_safe("计算绿度指数")
     def calculate_greenness(self):
         """计算绿度指数（基于Tasseled Cap变换）"""
-        try:
-            # Tasseled Cap变换系数（Landsat 8）
-            coefficients = {
-                'blue': -0.2941,
-                'green': -0.2430,
-                'red': -0.5424,
-                'nir': 0.7276,
-                'swir1': 0.0713,
-                'swir2': -0.1608
-            }
-            
-            greenness = (
-                coefficients['blue'] * self.bands[0] +
-                coefficients['green'] * self.bands[1] +
-                coefficients['red'] * self.bands[2] +
-                coefficients['nir'] * self.bands[3] +
-                coefficients['swir1'] * self.bands[4] +
-                coefficients['swir2'] * self.bands[5]
-            )
-            
-            return greenness
-        except Exception as e:
-            logger.error(f"计算绿度指数失败: {e}")
-            return None
+        return self._index('greenness')
     
+    @_safe("计算RSEI")
     def calculate_rsei(self):
-        """计算RSEI（遥感生态指数）"""
-        try:
-            # 计算各分量指数
-            greenness = self.calculate_greenness()
-            wetness = self.calculate_wetness()
-            dryness = self.calculate_dryness()
-            heat = self.calculate_heat()
-            
-            if greenness is None or wetness is None or dryness is None or heat is None:
-                return None
-            
-            # 标准化处理
-            scaler = StandardScaler()
-            indices = np.stack([greenness.flatten(), wetness.flatten(), 
-                              dryness.flatten(), heat.flatten()], axis=1)
-            
-            # 去除无效值
-            valid_mask = ~np.isnan(indices).any(axis=1)
-            indices_valid = indices[valid_mask]
-            
-            if len(indices_valid) == 0:
-                return None
-            
-            # 标准化
-            indices_scaled = scaler.fit_transform(indices_valid)
-            
-            # 主成分分析
-            pca = PCA(n_components=4)
-            pca_result = pca.fit_transform(indices_scaled)
-            
-            # 第一主成分作为RSEI
-            pc1 = pca_result[:, 0]
-            
-            # 重建完整图像
-            rsei = np.full(indices.shape[0], np.nan)
-            rsei[valid_mask] = pc1
-            
-            # 重塑为原始形状
-            rsei = rsei.reshape(greenness.shape)
-            
-            # 归一化到[0, 1]
-            rsei = (rsei - np.nanmin(rsei)) / (np.nanmax(rsei) - np.nanmin(rsei))
-            
-            return {
-                'rsei': rsei,
-                'greenness': greenness,
-                'wetness': wetness,
-                'dryness': dryness,
-                'heat': heat,
-                'pca_variance': pca.explained_variance_ratio_,
-                'pca_components': pca.components_
-            }
-        except Exception as e:
-            logger.error(f"计算RSEI失败: {e}")
-            return None
-    
-    def calculate_statistics(self, index_data):
-        """计算指数统计信息"""
-        if index_data is None:
+        """
+        计算RSEI（遥感生态指数）
+        
+        四个分量直接取自self._cache（已单独计算过的分量不会重新计算），
+        主成分分析结果缓存在self._rsei_result中，同一影像重复调用不会重新计算
+        """
+        if self._rsei_result is not None:
+            return self._rsei_result
+        
+        # 计算各分量指数
+        components = (
+            self.calculate_greenness(),
+            self.calculate_wetness(),
+            self.calculate_dryness(),
+            self.calculate_heat(),
+        )
+        if any(component is None for component in components):
             return None
+        greenness, wetness, dryness, heat = components
+        height, width = greenness.shape
         
-        # 去除无效值
-        valid_data = index_data[~np.isnan(index_data)]
+        # 去除无效值：逐分量原地累积有效掩膜，不构建(N, 4)的中间矩阵
+        valid_mask = ~np.isnan(greenness.ravel())
+        for component in components[1:]:
+            valid_mask &= ~np.isnan(component.ravel())
+        n_valid = int(np.count_nonzero(valid_mask))
         
-        if len(valid_data) == 0:
+        if n_valid == 0:
             return None
         
-        stats = {
-            'min_value': float(np.nanmin(valid_data)),
-            'max_value': float(np.nanmax(valid_data)),
-            'mean_value': float(np.nanmean(valid_data)),
-            'std_value': float(np.nanstd(valid_data)),
-        }
+        # 按分量连续存储的有效像素矩阵 (4, n_valid)
+        X = np.empty((len(components), n_valid), dtype=np.float32)
+        for k, component in enumerate(components):
+            X[k] = component.ravel()[valid_mask]
+        
+        # 4x4相关系数矩阵由随机抽样像素即可稳定估计；固定随机种子，结果可复现
+        n_sample = min(self.RSEI_PCA_SAMPLE_SIZE, n_valid)
+        if n_sample < n_valid:
+            sample_idx = np.random.default_rng(0).choice(n_valid, n_sample, replace=False)
+            sample_idx.sort()
+            sample = X[:, sample_idx]
+        else:
+            sample = X
+        
+        # 一次遍历得到均值和协方差，标准化后的协方差即相关系数矩阵
+        n, sums, cross = accumulate_moments(sample)
+        mean = sums / n
+        cov = (cross - n * np.outer(mean, mean)) / max(n - 1, 1)
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        std[std == 0] = 1.0
+        corr = cov / np.outer(std, std)
         
-        # 分类统计（基于标准差）
-        mean_val = stats['mean_value']
-        std_val = stats['std_value']
+        # 主成分分析：直接对4x4相关系数矩阵做特征分解，按特征值降序排列
+        eigenvalues, eigenvectors = np.linalg.eigh(corr)
+        eigenvalues = eigenvalues[::-1]
+        eigenvectors = eigenvectors[:, ::-1]
         
-        # 定义分类阈值
-        thresholds = {
-            'excellent': mean_val + 1.5 * std_val,
-            'good': mean_val + 0.5 * std_val,
-            'moderate': mean_val - 0.5 * std_val,
-            'poor': mean_val - 1.5 * std_val,
+        # 特征向量符号不唯一，约定第一主成分中绿度权重为正
+        if eigenvectors[0, 0] < 0:
+            eigenvectors[:, 0] *= -1
+        
+        pca_variance = eigenvalues / eigenvalues.sum()
+        pca_components = eigenvectors.T
+        
+        # 第一主成分作为RSEI：标准化并入投影权重，对全部有效像素做一次矩阵-向量乘
+        weights = eigenvectors[:, 0] / std
+        pc1 = weights.astype(np.float32) @ X
+        pc1 -= np.float32(weights @ mean)
+        
+        # 直接在有效像素上归一化到[0, 1]
+        pc1_min = pc1.min()
+        pc1_range = pc1.max() - pc1_min
+        pc1 -= pc1_min
+        if pc1_range > 0:
+            pc1 /= pc1_range
+        
+        # 将结果写回完整图像
+        rsei = np.full(height * width, np.nan, dtype=np.float32)
+        rsei[valid_mask] = pc1
+        rsei = rsei.reshape(height, width)
+        
+        self._rsei_result = {
+            'rsei': rsei,
+            'greenness': greenness,
+            'wetness': wetness,
+            'dryness': dryness,
+            'heat': heat,
+            'pca_variance': pca_variance,
+            'pca_components': pca_components
         }
+        return self._rsei_result
+    
+    def calculate_statistics(self, index_data):
+        """计算指数统计信息"""
+        if index_data is None:
+            return None
         
-        # 计算各等级像素数量
-        pixel_size = 30  # 假设30米分辨率
-        area_per_pixel = pixel_size * pixel_size / 1000000  # km²
-        
-        excellent_pixels = np.sum(valid_data >= thresholds['excellent'])
-        good_pixels = np.sum((valid_data >= thresholds['good']) & (valid_data < thresholds['excellent']))
-        moderate_pixels = np.sum((valid_data >= thresholds['moderate']) & (valid_data < thresholds['good']))
-        poor_pixels = np.sum((valid_data >= thresholds['poor']) & (valid_data < thresholds['moderate']))
-        bad_pixels = np.sum(valid_data < thresholds['poor'])
-        
-        stats.update({
-            'excellent_area': float(excellent_pixels * area_per_pixel),
-            'good_area': float(good_pixels * area_per_pixel),
-            'moderate_area': float(moderate_pixels * area_per_pixel),
-            'poor_area': float(poor_pixels * area_per_pixel),
-            'bad_area': float(bad_pixels * area_per_pixel),
-        })
+        # 一次遍历得到有效像素数、最值、均值和标准差
+        n_valid, min_val, max_val, total, total_sq = nan_stats(index_data)
+        stats = _base_statistics(n_valid, min_val, max_val, total, total_sq)
+        if stats is None:
+            return None
+        
+        # 分类统计（基于标准差），一次分箱得到各等级像素数量
+        counts = _class_counts(index_data, _class_edges(stats, index_data.dtype), n_valid)
+        stats.update(_class_areas(counts, self._area_per_pixel))
         
         return stats
     
-    def create_visualization(self, index_data, index_name, output_path):
-        """创建可视化图片"""
+    def render_visualization(self, index_data, index_name):
+        """
+        生成可视化图片（不编码）
+        
+        直接用颜色查找表将指数映射为RGB，右侧附带颜色条；
+        全分辨率数组先按块均值降采样，图片最长边不超过PREVIEW_MAX_SIZE
+        
+        Returns:
+            PIL.Image.Image: RGB图片，无有效像素或失败时返回None
+        """
         try:
             if index_data is None:
-                return False
-            
-            # 创建自定义颜色映射
-            colors_list = ['#8B0000', '#FF0000', '#FFA500', '#FFFF00', '#00FF00', '#006400']
-            n_bins = 256
-            cmap = LinearSegmentedColormap.from_list('custom', colors_list, N=n_bins)
-            
-            # 创建图形
-            fig, ax = plt.subplots(figsize=(12, 8))
-            
-            # 绘制指数图
-            im = ax.imshow(index_data, cmap=cmap, aspect='auto')
+                return None
             
-            # 添加颜色条
-            cbar = plt.colorbar(im, ax=ax, shrink=0.8)
-            cbar.set_label(f'{index_name} 值', fontsize=12)
+            if np.isnan(index_data).all():
+                return None
             
-            # 设置标题和标签
-            ax.set_title(f'{index_name} 分布图', fontsize=16, fontweight='bold')
-            ax.set_xlabel('像素列', fontsize=12)
-            ax.set_ylabel('像素行', fontsize=12)
+            from PIL import Image
             
-            # 去除坐标轴刻度
-            ax.set_xticks([])
-            ax.set_yticks([])
+            # 按2%-98%分位数拉伸并量化为uint8颜色索引，无效值显示为白色
+            color_index, vmin, vmax = _to_uint8(_downsample(index_data, self.PREVIEW_MAX_SIZE))
+            rgb = _COLORMAP_LUT[color_index]
             
-            # 保存图片
-            plt.tight_layout()
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            plt.close()
+            return _append_colorbar(Image.fromarray(rgb, 'RGB'), vmin, vmax, index_name)
+        except Exception as e:
+            logger.error(f"创建可视化失败: {e}")
+            return None
+    
+    def save_visualization(self, image, output_path):
+        """将render_visualization生成的图片编码为PNG"""
+        try:
+            if image is None:
+                return False
             
+            image.save(output_path)
             return True
         except Exception as e:
             logger.error(f"创建可视化失败: {e}")
             return False
     
-    def save_result(self, index_data, output_path):
-        """保存计算结果为GeoTIFF文件"""
+    def create_visualization(self, index_data, index_name, output_path):
+        """创建可视化图片并保存为PNG"""
+        return self.save_visualization(self.render_visualization(index_data, index_name), output_path)
+    
+    def _result_meta(self, scaled=False):
+        """
+        结果GeoTIFF的输出元数据：512分块、DEFLATE压缩的单波段float32
+        
+        Args:
+            scaled: 是否按int16定点存储（见RESULT_SCALE）
+        """
+        output_meta = self.metadata.copy()
+        output_meta.update({
+            'driver': 'GTiff',
+            'count': 1,
+            'dtype': 'float32',
+            'nodata': np.nan,
+            'tiled': True,
+            'blockxsize': RESULT_BLOCK_SIZE,
+            'blockysize': RESULT_BLOCK_SIZE,
+            'compress': 'deflate',
+            'predictor': 3,  # 浮点数据使用浮点预测器
+            'num_threads': 'all_cpus',
+            'bigtiff': 'if_safer'
+        })
+        if scaled:
+            output_meta.update({
+                'dtype': 'int16',
+                'nodata': RESULT_INT16_NODATA,
+                'predictor': 2,  # 整型数据使用水平差分预测器
+            })
+        return output_meta
+    
+    def _write_result(self, dst, index_data, scaled, window=None):
+        """将指数数组写入结果GeoTIFF（scaled为True时量化为int16定点值）"""
+        if scaled:
+            dst.write(_to_scaled_int16(index_data), 1, window=window)
+        else:
+            dst.write(index_data.astype('float32', copy=False), 1, window=window)
+    
+    def save_result(self, index_data, output_path, scaled=False):
+        """
+        保存计算结果为GeoTIFF文件
+        
+        输出为512分块、DEFLATE压缩并带内部金字塔的GeoTIFF，
+        下游可视化和Web地图可以按窗口/按级别读取，无需解码整幅影像；
+        有界指数可按int16定点存储，文件大小和读取带宽约减半，波段scale记录还原系数
+        
+        Args:
+            index_data: 指数数组
+            output_path: 输出文件路径
+            scaled: 是否按int16定点存储，仅用于SCALED_INDEX_TYPES中的有界指数
+        """
         try:
             if index_data is None:
                 return False
             
-            # 创建输出元数据
-            output_meta = self.metadata.copy()
-            output_meta.update({
-                'count': 1,
-                'dtype': 'float32',
-                'nodata': np.nan
-            })
-            
-            # 保存文件
-            with rasterio.open(output_path, 'w', **output_meta) as dst:
-                dst.write(index_data.astype('float32'), 1)
+            # 保存文件并构建金字塔
+            with rasterio.open(output_path, 'w', **self._result_meta(scaled)) as dst:
+                self._write_result(dst, index_data, scaled)
+                if scaled:
+                    dst.scales = (RESULT_SCALE,)
+                dst.build_overviews(OVERVIEW_FACTORS, Resampling.average)
+                dst.update_tags(ns='rio_overview', resampling='average')
             
             return True
         except Exception as e:
             logger.error(f"保存结果失败: {e}")
             return False
     
+    def compute_block(self, index_type, bands):
+        """
+        对单个数据块计算逐像素指数（RSEI需要全图主成分分析，不支持分块计算）
+        
+        Args:
+            index_type: 指数类型
+            bands: 波段数组 (count, h, w)
+            
+        Returns:
+            np.ndarray: float32指数数组 (h, w)
+        """
+        if index_type in self.NORM_DIFF_BANDS:
+            a_idx, b_idx = self.NORM_DIFF_BANDS[index_type]
+            return _norm_diff(bands[a_idx], bands[b_idx])
+        if index_type in self.TASSELED_CAP_COEFFICIENTS:
+            return _tasseled_cap(bands, self._tasseled_cap_matrix([index_type]))[0]
+        raise ValueError(f"不支持分块计算的指数类型: {index_type}")
+    
+    def should_stream(self):
+        """影像像素数是否超过流式计算阈值（需先打开数据集）"""
+        return self.dataset.width * self.dataset.height > self.STREAMING_PIXEL_THRESHOLD
+    
+    def run_streaming_indices(self, index_types, output_paths):
+        """
+        分块流式计算多个逐像素指数并写出GeoTIFF，同时累积统计信息
+        
+        每个数据块只读取一次，依次计算全部指数并写入各自的输出文件，
+        峰值内存与分块大小相关而非影像大小；分块的读取和计算由线程池并行执行，
+        写入和统计累积保持在当前线程按分块顺序进行；分级阈值依赖全图均值和标准差，
+        因此分级面积在第二遍按块回读输出文件统计
+        
+        Args:
+            index_types: 指数类型列表（仅支持逐像素指数，不含RSEI）
+            output_paths: {指数类型: 输出文件路径}
+            
+        Returns:
+            dict: {指数类型: 统计信息}，失败返回None
+        """
+        try:
+            if self.dataset is None and not self.load_image(read_bands=False):
+                return None
+            
+            scaled = {index_type: index_type in self.SCALED_INDEX_TYPES for index_type in index_types}
+            # 按输出分块网格（而非源文件分块）划分窗口，每个输出分块一次写完，避免反复读-改-写压缩分块
+            width, height = self.dataset.width, self.dataset.height
+            windows = [
+                Window(col, row, min(RESULT_BLOCK_SIZE, width - col), min(RESULT_BLOCK_SIZE, height - row))
+                for row in range(0, height, RESULT_BLOCK_SIZE)
+                for col in range(0, width, RESULT_BLOCK_SIZE)
+            ]
+            # 各指数的 [有效像素数, 最小值, 最大值, 和, 平方和] 及逐块有效像素数
+            moments = {index_type: [0, np.inf, -np.inf, 0.0, 0.0] for index_type in index_types}
+            block_valid = {index_type: [] for index_type in index_types}
+            
+            # 无Numba时统计也在工作线程中进行；有Numba时nan_stats为并行内核，
+            # 工作线程只读取和计算指数，统计在当前线程进行，避免多个线程同时启动并行内核
+            stats_in_workers = not HAVE_NUMBA
+            
+            # rasterio数据集句柄不是线程安全的，每个工作线程使用独立的只读句柄
+            thread_local = threading.local()
+            handles = []
+            
+            def process_block(window):
+                dataset = getattr(thread_local, 'dataset', None)
+                if dataset is None:
+                    dataset = rasterio.open(self.image_path)
+                    thread_local.dataset = dataset
+                    handles.append(dataset)
+                bands = dataset.read(window=window, out_dtype='float32')
+                blocks = {}
+                for index_type in index_types:
+                    block = self.compute_block(index_type, bands)
+                    blocks[index_type] = (block, nan_stats(block) if stats_in_workers else None)
+                return blocks
+            
+            def close_handles():
+                for dataset in handles:
+                    dataset.close()
+            
+            max_workers = min(os.cpu_count() or 1, 8)
+            
+            def write_block(window, blocks):
+                for index_type, (block, block_stats) in blocks.items():
+                    self._write_result(outputs[index_type], block, scaled[index_type], window=window)
+                    
+                    if block_stats is None:
+                        block_stats = nan_stats(block)
+                    n, lo, hi, total, total_sq = block_stats
+                    acc = moments[index_type]
+                    acc[0] += n
+                    acc[1] = min(acc[1], lo)
+                    acc[2] = max(acc[2], hi)
+                    acc[3] += total
+                    acc[4] += total_sq
+                    block_valid[index_type].append(n)
+            
+            with ExitStack() as stack:
+                # 回调最先注册、最后执行：线程池退出后再关闭各线程的只读句柄
+                stack.callback(close_handles)
+                outputs = {
+                    index_type: stack.enter_context(
+                        rasterio.open(output_paths[index_type], 'w', **self._result_meta(scaled[index_type]))
+                    )
+                    for index_type in index_types
+                }
+                for index_type, dst in outputs.items():
+                    if scaled[index_type]:
+                        dst.scales = (RESULT_SCALE,)
+                
+                # 读取与计算在线程池中并行（GDAL和NumPy均释放GIL），最多2倍线程数的分块在途，
+                # 写入和统计累积在当前线程按分块顺序进行
+                executor = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+                pending = deque()
+                for window in windows:
+                    pending.append((window, executor.submit(process_block, window)))
+                    if len(pending) >= 2 * max_workers:
+                        done_window, future = pending.popleft()
+                        write_block(done_window, future.result())
+                while pending:
+                    done_window, future = pending.popleft()
+                    write_block(done_window, future.result())
+                
+                for dst in outputs.values():
+                    dst.build_overviews(OVERVIEW_FACTORS, Resampling.average)
+                    dst.update_tags(ns='rio_overview', resampling='average')
+            
+            results = {}
+            for index_type in index_types:
+                stats = _base_statistics(*moments[index_type])
+                if stats is not None:
+                    edges = _class_edges(stats, np.float32)
+                    counts = np.zeros(5, dtype=np.int64)
+                    with rasterio.open(output_paths[index_type]) as src:
+                        for window, n_valid in zip(windows, block_valid[index_type]):
+                            counts += _class_counts(_read_result_band(src, window=window), edges, n_valid)
+                    stats.update(_class_areas(counts))
+                results[index_type] = stats
+            
+            return results
+        except Exception as e:
+            logger.error(f"分块计算指数失败: {e}")
+            return None
+    
+    def read_preview(self, result_path):
+        """
+        按降采样读取结果GeoTIFF，供create_visualization使用
+        
+        最长边不超过PREVIEW_MAX_SIZE，优先使用文件内部金字塔
+        
+        Args:
+            result_path: 结果GeoTIFF路径
+            
+        Returns:
+            np.ndarray: float32二维数组，失败返回None
+        """
+        try:
+            with rasterio.open(result_path) as src:
+                factor = max(1, -(-max(src.width, src.height) // self.PREVIEW_MAX_SIZE))
+                return _read_result_band(
+                    src,
+                    out_shape=(max(src.height // factor, 1), max(src.width // factor, 1)),
+                    resampling=Resampling.average
+                )
+        except Exception as e:
+            logger.error(f"读取预览失败: {e}")
+            return None
+    
     def close(self):
-        """关闭数据集"""
+        """关闭数据集并释放波段缓存"""
         if self.dataset:
-            self.dataset.close() 
\ No newline at end of file
+            self.dataset.close()
+        self.bands = None
+        self._bands_f32 = None
+        self._cache = {}
+        self._rsei_result = None 
\ No newline at end of file
@@ -10,18 +10,339 @@ import matplotlib.colors as colors
 from matplotlib.colors import LinearSegmentedColormap
 import os
 import tempfile
+import mmap
 from PIL import Image
 import pandas as pd
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
 import logging
 import json
+import threading
+from functools import lru_cache
+from xml.sax.saxutils import escape
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ._kernels import HAVE_NUMBA, fused_indices, masked_moments4, nan_stats, project4
 
 # 设置GDAL错误处理
 gdal.UseExceptions()
 
 logger = logging.getLogger(__name__)
 
+# 分块处理的默认瓦片大小 (列, 行)
+TILE_SIZE = (512, 512)
+
+# 输出GeoTIFF的无效值；用固定值代替NaN，浮点预测器和压缩效果更好
+NODATA_VALUE = -9999.0
+
+
+def _gtiff_creation_options():
+    """输出GeoTIFF的创建选项：512分块、多线程压缩，GDAL未编译ZSTD时使用DEFLATE"""
+    driver = gdal.GetDriverByName('GTiff')
+    option_list = driver.GetMetadataItem('DMD_CREATIONOPTIONLIST') or ''
+    if 'ZSTD' in option_list:
+        compression = ['COMPRESS=ZSTD', 'ZSTD_LEVEL=1']
+    else:
+        compression = ['COMPRESS=DEFLATE']
+    return [
+        'TILED=YES',
+        'BLOCKXSIZE=512',
+        'BLOCKYSIZE=512',
+        *compression,
+        'PREDICTOR=3',
+        'NUM_THREADS=ALL_CPUS',
+        'BIGTIFF=IF_SAFER',
+        'SPARSE_OK=TRUE',
+    ]
+
+
+GTIFF_CREATION_OPTIONS = _gtiff_creation_options()
+
+
+# int8快速浏览输出的比例系数和无效值
+QUICKLOOK_SCALE = 127
+QUICKLOOK_NODATA = -128
+
+
+def _fill_nodata(data):
+    """返回将非有限值替换为NODATA_VALUE的float32副本"""
+    data = np.array(data, dtype=np.float32)
+    data[~np.isfinite(data)] = NODATA_VALUE
+    return data
+
+
+# 五级分类阈值（第i级为 [阈值i, 阈值i+1)）及名称，适用于NDVI等取值在[-1, 1]的指数
+CLASS_THRESHOLDS = [-1, -0.2, 0, 0.2, 0.4, 1]
+CLASS_LABELS = ['很差', '差', '中等', '良好', '优秀']
+
+# 分块统计直方图的分箱数
+HISTOGRAM_BINS = 256
+
+
+class _BandStatistics:
+    """
+    分块写入时顺带累积波段统计量，写完后一次性设置到GDAL波段，无需再遍历整幅数据
+    
+    给定取值范围时，同时把每块量化为uint8累积256箱直方图，五级分类计数由直方图得到
+    """
+    
+    def __init__(self, value_range=None):
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.total_pixels = 0
+        self.value_range = value_range
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64) if value_range else None
+    
+    def update(self, data):
+        """累积一个数据块（NaN不计入）"""
+        n, lo, hi, total, total_sq = nan_stats(data)
+        self.n += n
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+        self.total += total
+        self.total_sq += total_sq
+        self.total_pixels += data.size
+        
+        if self.histogram is not None:
+            range_lo, range_hi = self.value_range
+            scaled = np.subtract(data, np.float32(range_lo), dtype=np.float32)
+            scaled *= np.float32(HISTOGRAM_BINS / (range_hi - range_lo))
+            valid = np.isfinite(scaled)
+            np.clip(scaled, 0, HISTOGRAM_BINS - 1, out=scaled)
+            self.histogram += np.bincount(
+                scaled[valid].astype(np.uint8), minlength=HISTOGRAM_BINS
+            )
+    
+    def apply(self, band):
+        """将统计量写入GDAL波段"""
+        if self.n == 0:
+            return
+        mean = self.total / self.n
+        std = np.sqrt(max(self.total_sq / self.n - mean * mean, 0.0))
+        band.SetStatistics(float(self.min), float(self.max), float(mean), float(std))
+    
+    def summary(self):
+        """
+        汇总统计信息，字段与calculate_statistics一致（不含分位数）
+        
+        五级分类计数由直方图求和得到，分级边界精度为一个直方图箱宽
+        """
+        if self.n == 0:
+            return None
+        mean = self.total / self.n
+        stats = {
+            'min': float(self.min),
+            'max': float(self.max),
+            'mean': float(mean),
+            'std': float(np.sqrt(max(self.total_sq / self.n - mean * mean, 0.0))),
+            'valid_pixels': int(self.n),
+            'total_pixels': int(self.total_pixels),
+            'valid_ratio': float(self.n / self.total_pixels)
+        }
+        
+        if self.histogram is not None and stats['min'] >= -1 and stats['max'] <= 1:
+            range_lo, range_hi = self.value_range
+            edges = [
+                int(round((t - range_lo) * HISTOGRAM_BINS / (range_hi - range_lo)))
+                for t in CLASS_THRESHOLDS
+            ]
+            for i, label in enumerate(CLASS_LABELS):
+                count = int(self.histogram[edges[i]:edges[i + 1]].sum())
+                stats[f'{label}_pixels'] = count
+                stats[f'{label}_ratio'] = float(count / self.n)
+        return stats
+
+
+# 归一化差值指数及其波段编号 (a, b)，指数 = (a - b) / (a + b)
+# 顺序与_kernels.fused_indices的输出平面顺序一致
+NORM_DIFF_BANDS = {
+    'NDVI': (4, 3),
+    'NDWI': (2, 4),
+    'NDBI': (5, 4),
+    'NDSI': (2, 5),
+}
+
+
+# Landsat 8 缨帽变换系数
+# 假设波段顺序：Blue, Green, Red, NIR, SWIR1, SWIR2
+TC_COEFFICIENTS = {
+    'brightness': [0.3029, 0.2786, 0.4733, 0.5599, 0.5080, 0.1872],
+    'greenness': [-0.2941, -0.2430, -0.5424, 0.7276, 0.0713, -0.1608],
+    'wetness': [0.1511, 0.1973, 0.3283, 0.3407, -0.7117, -0.4559],
+    'fourth': [-0.8239, 0.0849, 0.4396, -0.0580, 0.2013, -0.2773],
+    'fifth': [-0.3294, 0.0557, 0.1056, 0.1855, -0.4349, 0.8085],
+    'sixth': [0.1079, -0.9023, 0.4119, 0.0575, -0.0259, 0.0252]
+}
+_TC_MATRIX = np.array(list(TC_COEFFICIENTS.values()), dtype=np.float32)
+
+
+def _norm_diff(a, b, scratch=None, valid_mask=None):
+    """
+    计算归一化差值 (a - b) / (a + b)
+    
+    分母为0的像素结果为0
+    
+    Args:
+        a: 被减波段
+        b: 减数波段
+        scratch: 可选的float32临时缓冲区（与a同形状），用于存放分母，可在多次调用间复用
+        valid_mask: 可选的预先计算的有效像素掩膜（a、b均为有限值），为None时现场计算
+        
+    Returns:
+        np.ndarray: float32数组，无效像素为NaN，结果限制在[-1, 1]
+    """
+    result = np.subtract(a, b, dtype=np.float32)
+    denominator = np.add(a, b, out=scratch, dtype=np.float32)
+    
+    # 任一波段为NaN/Inf时分母也非有限值，用一个掩膜即可判断有效像素
+    if valid_mask is None:
+        valid_mask = np.isfinite(denominator)
+    # 分母为0的像素结果为0，与_kernels.fused_indices及ecological_indices一致
+    zero = denominator == 0
+    np.divide(result, denominator, out=result, where=valid_mask & ~zero)
+    result[zero] = 0
+    result[~valid_mask] = np.nan
+    
+    # 限制值范围
+    np.clip(result, -1, 1, out=result)
+    return result
+
+
+def tile_index_names(band_count):
+    """
+    compute_all_indices_tile对给定波段数输出的指数名称（按输出顺序）
+    
+    Args:
+        band_count: 波段数
+        
+    Returns:
+        list: 指数名称列表
+    """
+    names = [
+        index_name for index_name, (a, b) in NORM_DIFF_BANDS.items()
+        if max(a, b) <= band_count
+    ]
+    if band_count >= 6:
+        names += [f'TC_{name.upper()}' for name in TC_COEFFICIENTS]
+    return names
+
+
+def compute_all_indices_tile(stack):
+    """
+    对一个瓦片一次计算全部归一化差值指数和缨帽变换分量
+    
+    安装Numba且波段数不少于6时使用融合内核，瓦片只遍历一次；否则逐个指数用NumPy计算
+    
+    Args:
+        stack: (波段数, 行, 列) float32数组，波段顺序同TC_COEFFICIENTS
+        
+    Returns:
+        dict: {指数名称: float32数组}，缨帽变换分量名称为 TC_<分量>
+    """
+    band_count = stack.shape[0]
+    names = tile_index_names(band_count)
+    
+    if HAVE_NUMBA and band_count >= 6:
+        out = np.empty((len(names),) + stack.shape[1:], dtype=np.float32)
+        fused_indices(stack, _TC_MATRIX, out)
+        return dict(zip(names, out))
+    
+    results = {
+        index_name: _norm_diff(stack[a - 1], stack[b - 1])
+        for index_name, (a, b) in NORM_DIFF_BANDS.items()
+        if index_name in names
+    }
+    if band_count >= 6:
+        tc_names = names[len(results):]
+        tc = _TC_MATRIX @ stack[:6].reshape(6, -1)
+        results.update(zip(tc_names, tc.reshape((len(tc_names),) + stack.shape[1:])))
+    return results
+
+
+def _quantiles(values, qs):
+    """
+    通过一次np.partition计算多个分位数（线性插值，与np.percentile一致）
+    
+    Args:
+        values: 一维数组，会被原地重排
+        qs: 分位数序列，取值范围[0, 1]
+        
+    Returns:
+        list: 各分位数的值
+    """
+    n = values.size
+    positions = [q * (n - 1) for q in qs]
+    lower = [int(np.floor(p)) for p in positions]
+    kth = sorted(set(lower) | {min(k + 1, n - 1) for k in lower})
+    values.partition(kth)
+    
+    results = []
+    for position, k in zip(positions, lower):
+        lo = float(values[k])
+        hi = float(values[min(k + 1, n - 1)])
+        results.append(lo + (position - k) * (hi - lo))
+    return results
+
+
+# 可视化分布图的最长边像素数
+PREVIEW_MAX_SIZE = 2048
+
+
+@lru_cache(maxsize=None)
+def _colormap_lut(colormap):
+    """matplotlib颜色映射的 (256, 3) uint8 颜色查找表"""
+    return (plt.get_cmap(colormap)(np.arange(256))[:, :3] * 255).round().astype(np.uint8)
+
+
+def _downsample(data, max_size):
+    """
+    按整数倍块均值降采样，使最长边不超过max_size（NaN不参与平均）
+    
+    Args:
+        data: 二维数组
+        max_size: 最长边像素数
+        
+    Returns:
+        np.ndarray: float32数组，无需降采样时返回原数组
+    """
+    factor = -(-max(data.shape) // max_size)
+    if factor <= 1:
+        return data
+    
+    height, width = data.shape[0] // factor, data.shape[1] // factor
+    blocks = data[:height * factor, :width * factor].reshape(height, factor, width, factor)
+    valid = np.isfinite(blocks)
+    sums = np.where(valid, blocks, 0).sum(axis=(1, 3), dtype=np.float32)
+    counts = valid.sum(axis=(1, 3))
+    result = np.full((height, width), np.nan, dtype=np.float32)
+    np.divide(sums, counts, out=result, where=counts > 0)
+    return result
+
+
+@lru_cache(maxsize=None)
+def _tc_coefficient_matrix(band_count):
+    """
+    给定波段数下可计算的缨帽变换分量及其 (分量数, 波段数) float32 系数矩阵
+    
+    只保留系数个数不超过可用波段数（最多6个）的分量
+    
+    Returns:
+        tuple: (分量名称元组, 只读系数矩阵)
+    """
+    nb = min(6, band_count)
+    components = tuple(
+        component for component, coefficients in TC_COEFFICIENTS.items()
+        if len(coefficients) <= nb
+    )
+    coef_matrix = np.array(
+        [TC_COEFFICIENTS[component][:nb] for component in components],
+        dtype=np.float32
+    ).reshape(len(components), nb)
+    coef_matrix.setflags(write=False)
+    return components, coef_matrix
+
 
 class GDALEcologicalIndexCalculator:
     """基于GDAL的生态指数计算器"""
@@ -35,13 +356,32 @@ class GDALEcologicalIndexCalculator:
         """
         self.image_path = image_path
         self.dataset = None
-        self.bands = {}
+        # 全部波段 (波段数, 行, 列) float32，第n波段为 band_stack[n - 1]
+        self.band_stack = None
+        # band_stack为磁盘映射数组时对应的临时文件路径
+        self._memmap_path = None
+        # GDAL波段句柄，分块处理时按窗口读取
+        self.band_refs = []
         self.metadata = {}
         self.geotransform = None
         self.projection = None
+        # 各指数计算共用的临时缓冲区
+        self._scratch = None
+        # 全部波段均为有限值的像素掩膜（加载时计算一次），以及按波段对缓存的掩膜
+        self.valid_mask = None
+        self._valid_masks = {}
+        # 缨帽变换结果缓存
+        self._tc_cache = None
+        
+    def load_image(self, read_bands=True, use_memmap=False):
+        """
+        使用GDAL加载遥感影像
         
-    def load_image(self):
-        """使用GDAL加载遥感影像"""
+        Args:
+            read_bands: 是否将全部波段读入内存；分块处理(calculate_indices_tiled)时可设为False
+            use_memmap: 是否将band_stack放在临时文件的内存映射中，超出内存的影像由操作系统按页调度，
+                临时文件在close()时删除
+        """
         try:
             # 打开数据集
             self.dataset = gdal.Open(self.image_path, gdal.GA_ReadOnly)
@@ -57,10 +397,29 @@ class GDALEcologicalIndexCalculator:
             self.height = self.dataset.RasterYSize
             self.band_count = self.dataset.RasterCount
             
-            # 读取所有波段
+            # 读取所有波段：连续存放在 (波段数, 行, 列) 数组中
+            self.band_refs = []
+            self.valid_mask = None
+            self._valid_masks = {}
+            self._tc_cache = None
+            self._release_band_stack()
+            if read_bands:
+                shape = (self.band_count, self.height, self.width)
+                if use_memmap:
+                    self.band_stack = self._create_memmap(shape)
+                else:
+                    self.band_stack = np.empty(shape, dtype=np.float32)
             for i in range(1, self.band_count + 1):
                 band = self.dataset.GetRasterBand(i)
-                self.bands[i] = band.ReadAsArray().astype(np.float32)
+                self.band_refs.append(band)
+                if read_bands:
+                    # GDAL读取时直接转换为float32写入预分配缓冲区，避免astype再复制一次
+                    band.ReadAsArray(buf_obj=self.band_stack[i - 1], buf_type=gdal.GDT_Float32)
+                    # 逐波段累积有效像素掩膜
+                    if self.valid_mask is None:
+                        self.valid_mask = np.isfinite(self.band_stack[i - 1])
+                    else:
+                        self.valid_mask &= np.isfinite(self.band_stack[i - 1])
                 
                 # 获取波段元数据
                 self.metadata[f'band_{i}'] = {
@@ -79,6 +438,34 @@ class GDALEcologicalIndexCalculator:
             logger.error(f"加载影像失败: {e}")
             return False
     
+    def _create_memmap(self, shape):
+        """
+        在临时文件中创建 float32 内存映射数组，并提示内核按顺序访问（预读、及时回收已读页）
+        
+        Args:
+            shape: 数组形状
+        """
+        nbytes = int(np.prod(shape)) * np.dtype(np.float32).itemsize
+        with tempfile.NamedTemporaryFile(suffix='.f32', delete=False) as tmp:
+            self._memmap_path = tmp.name
+            tmp.truncate(nbytes)
+            # mmap复制了文件描述符，关闭临时文件后映射仍然有效
+            buffer = mmap.mmap(tmp.fileno(), nbytes)
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            buffer.madvise(mmap.MADV_SEQUENTIAL)
+        # 数组持有映射的引用，数组释放后映射随之关闭
+        return np.ndarray(shape, dtype=np.float32, buffer=buffer)
+    
+    def _release_band_stack(self):
+        """释放band_stack，若为内存映射则删除对应的临时文件"""
+        self.band_stack = None
+        if self._memmap_path is not None:
+            try:
+                os.remove(self._memmap_path)
+            except OSError as e:
+                logger.warning(f"删除临时文件失败: {e}")
+            self._memmap_path = None
+    
     def get_band_info(self):
         """获取波段信息"""
         info = {
@@ -90,7 +477,8 @@ class GDALEcologicalIndexCalculator:
             'bands': {}
         }
         
-        for band_num, band_data in self.bands.items():
+        band_stack = self.band_stack if self.band_stack is not None else []
+        for band_num, band_data in enumerate(band_stack, start=1):
             info['bands'][band_num] = {
                 'shape': band_data.shape,
                 'dtype': str(band_data.dtype),
@@ -103,40 +491,268 @@ class GDALEcologicalIndexCalculator:
         
         return info
     
-    def calculate_ndvi(self, red_band=3, nir_band=4):
+    def iter_blocks(self, tile=TILE_SIZE):
         """
-        计算NDVI（归一化植被指数）
+        按固定瓦片网格遍历影像
         
         Args:
-            red_band: 红波段编号
-            nir_band: 近红外波段编号
+            tile: 瓦片大小 (列, 行)
+            
+        Yields:
+            tuple: (xoff, yoff, xsize, ysize)
+        """
+        tile_x, tile_y = tile
+        for yoff in range(0, self.height, tile_y):
+            ysize = min(tile_y, self.height - yoff)
+            for xoff in range(0, self.width, tile_x):
+                yield xoff, yoff, min(tile_x, self.width - xoff), ysize
+    
+    def read_block(self, xoff, yoff, xsize, ysize):
+        """
+        读取一个瓦片窗口内的全部波段（GDAL直接输出float32）
+        
+        Returns:
+            np.ndarray: (波段数, ysize, xsize) float32数组
+        """
+        block = self.dataset.ReadAsArray(xoff, yoff, xsize, ysize, buf_type=gdal.GDT_Float32)
+        # 单波段影像返回二维数组，统一为三维
+        return block.reshape((-1, ysize, xsize))
+    
+    def calculate_indices_tiled(self, output_dir, tile=TILE_SIZE):
+        """
+        分块计算归一化差值指数和缨帽变换分量并写入一个多波段GeoTIFF（indices.tif）
+        
+        每个瓦片只读取一次，所有指数在一次遍历中算出后立即写出，
+        内存占用与瓦片大小相关而非影像大小；每个指数为一个波段，波段描述为指数名称
+        
+        瓦片的读取（及无Numba时的计算）由线程池并行执行，写入保持在当前线程按顺序进行
+        
+        Args:
+            output_dir: 输出目录
+            tile: 瓦片大小 (列, 行)
+            
+        Returns:
+            dict: {'path': 输出文件路径, 'bands': {指数名称: 波段编号},
+                   'statistics': {指数名称: 统计信息}}，失败时返回None
         """
         try:
-            if red_band not in self.bands or nir_band not in self.bands:
-                raise ValueError(f"波段 {red_band} 或 {nir_band} 不存在")
+            if not self.band_refs:
+                raise ValueError("影像未加载")
+            
+            os.makedirs(output_dir, exist_ok=True)
+            
+            # 所有指数写入同一个输出文件，只创建一次
+            index_names = tile_index_names(self.band_count)
+            if not index_names:
+                raise ValueError("波段数不足，无法计算指数")
+            output_path = os.path.join(output_dir, 'indices.tif')
+            out_dataset = self._create_output(output_path, index_names)
+            out_bands = {
+                index_name: out_dataset.GetRasterBand(i)
+                for i, index_name in enumerate(index_names, start=1)
+            }
+            # 归一化差值指数取值在[-1, 1]，同时累积直方图
+            out_stats = {
+                index_name: _BandStatistics((-1, 1) if index_name in NORM_DIFF_BANDS else None)
+                for index_name in index_names
+            }
+            
+            # 无Numba时NumPy计算释放GIL，读取和计算都放在工作线程中；
+            # 有Numba时融合内核本身已多线程并行，工作线程只预读瓦片，计算在当前线程进行，
+            # 避免多个线程同时启动并行内核
+            compute_in_workers = not HAVE_NUMBA
+            
+            # GDAL数据集句柄不是线程安全的，每个工作线程使用独立的只读句柄
+            thread_local = threading.local()
+            handles = []
+            handles_lock = threading.Lock()
+            
+            def process_tile(window):
+                dataset = getattr(thread_local, 'dataset', None)
+                if dataset is None:
+                    # 工作线程之间已经并行，单个线程内的GDAL解码不再开多线程
+                    gdal.SetThreadLocalConfigOption('GDAL_NUM_THREADS', '1')
+                    dataset = gdal.Open(self.image_path, gdal.GA_ReadOnly)
+                    thread_local.dataset = dataset
+                    with handles_lock:
+                        handles.append(dataset)
+                xoff, yoff, xsize, ysize = window
+                block = dataset.ReadAsArray(
+                    xoff, yoff, xsize, ysize, buf_type=gdal.GDT_Float32
+                ).reshape((-1, ysize, xsize))
+                if compute_in_workers:
+                    return window, compute_all_indices_tile(block)
+                return window, block
+            
+            def write_tile(window, payload):
+                xoff, yoff = window[:2]
+                tile_results = payload if compute_in_workers else compute_all_indices_tile(payload)
+                for index_name, data in tile_results.items():
+                    out_bands[index_name].WriteArray(_fill_nodata(data), xoff, yoff)
+                    out_stats[index_name].update(data)
+            
+            max_workers = min(os.cpu_count() or 1, 8)
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    # 按顺序写出，同时最多有2倍线程数的瓦片在读取/计算中
+                    pending = deque()
+                    for window in self.iter_blocks(tile):
+                        pending.append(executor.submit(process_tile, window))
+                        if len(pending) >= 2 * max_workers:
+                            write_tile(*pending.popleft().result())
+                    while pending:
+                        write_tile(*pending.popleft().result())
+            finally:
+                handles.clear()
+            
+            # 设置统计信息并关闭文件
+            for index_name, out_band in out_bands.items():
+                out_stats[index_name].apply(out_band)
+            out_dataset.FlushCache()
+            out_bands = None
+            out_dataset = None
             
-            red = self.bands[red_band]
-            nir = self.bands[nir_band]
+            logger.info(f"分块指数计算完成，结果保存在: {output_path}")
+            return {
+                'path': output_path,
+                'bands': {name: i for i, name in enumerate(index_names, start=1)},
+                'statistics': {name: acc.summary() for name, acc in out_stats.items()}
+            }
+            
+        except Exception as e:
+            logger.error(f"分块计算指数失败: {e}")
+            return None
+    
+    def _has_bands(self, *band_nums):
+        """检查给定编号（从1开始）的波段是否已读入内存"""
+        return self.band_stack is not None and all(
+            1 <= n <= self.band_stack.shape[0] for n in band_nums
+        )
+    
+    def _pair_valid_mask(self, band_a, band_b):
+        """
+        两个波段均为有限值的像素掩膜，按波段对缓存
+        
+        全部波段都有效时（整型数据源的常见情况）直接复用self.valid_mask
+        """
+        key = (min(band_a, band_b), max(band_a, band_b))
+        if key not in self._valid_masks:
+            if self.valid_mask.all():
+                mask = self.valid_mask
+            else:
+                mask = np.isfinite(self.band_stack[band_a - 1])
+                mask &= np.isfinite(self.band_stack[band_b - 1])
+            self._valid_masks[key] = mask
+        return self._valid_masks[key]
+    
+    def _tc_valid_mask(self):
+        """
+        缨帽变换所用波段（前6个）均为有限值的像素掩膜
+        
+        波段数不超过6或全部波段都有效时直接复用加载时得到的self.valid_mask，不再重新扫描
+        """
+        nb = min(self.band_count, 6)
+        if nb == self.band_count or self.valid_mask.all():
+            return self.valid_mask
+        key = tuple(range(1, nb + 1))
+        if key not in self._valid_masks:
+            self._valid_masks[key] = np.isfinite(self.band_stack[:nb]).all(axis=0)
+        return self._valid_masks[key]
+    
+    def calculate_norm_diff_gdal(self, index_name, output_path):
+        """
+        纯GDAL计算归一化差值指数：构建带norm_diff像素函数的内存VRT，直接转换为COG
+        
+        GDAL按块在C代码中即时求值，Python端不分配任何影像数组；
+        需要GDAL 3.8及以上（内置norm_diff像素函数），失败时返回False，调用方可改用Python计算路径；
+        注意GDAL内置像素函数将分母为0的像素输出为NoData，而其余计算路径输出0
+        
+        Args:
+            index_name: 指数名称，NORM_DIFF_BANDS中的键（NDVI/NDWI/NDBI/NDSI）
+            output_path: 输出COG文件路径
             
-            # 处理无效值
-            red_valid = np.isfinite(red)
-            nir_valid = np.isfinite(nir)
-            valid_mask = red_valid & nir_valid
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            if index_name not in NORM_DIFF_BANDS:
+                raise ValueError(f"不支持的指数: {index_name}")
+            if self.dataset is None:
+                raise ValueError("影像未加载")
+            
+            band_a, band_b = NORM_DIFF_BANDS[index_name]
+            source = escape(os.path.abspath(self.image_path))
+            sources = ''.join(
+                f'<SimpleSource><SourceFilename relativeToVRT="0">{source}</SourceFilename>'
+                f'<SourceBand>{band}</SourceBand></SimpleSource>'
+                for band in (band_a, band_b)
+            )
+            geotransform = ', '.join(repr(v) for v in self.geotransform)
+            vrt_xml = (
+                f'<VRTDataset rasterXSize="{self.width}" rasterYSize="{self.height}">'
+                f'<SRS>{escape(self.projection)}</SRS>'
+                f'<GeoTransform>{geotransform}</GeoTransform>'
+                f'<VRTRasterBand dataType="Float32" band="1" subClass="VRTDerivedRasterBand">'
+                f'<Description>{index_name}</Description>'
+                f'<NoDataValue>{NODATA_VALUE}</NoDataValue>'
+                f'<PixelFunctionType>norm_diff</PixelFunctionType>'
+                f'<SourceTransferType>Float32</SourceTransferType>'
+                f'{sources}'
+                f'</VRTRasterBand>'
+                f'</VRTDataset>'
+            )
             
-            # 初始化结果数组
-            ndvi = np.full(red.shape, np.nan, dtype=np.float32)
+            vrt_dataset = gdal.Open(vrt_xml)
+            compression = 'ZSTD' if 'COMPRESS=ZSTD' in GTIFF_CREATION_OPTIONS else 'DEFLATE'
+            out_dataset = gdal.Translate(
+                output_path,
+                vrt_dataset,
+                format='COG',
+                creationOptions=[
+                    f'COMPRESS={compression}',
+                    'PREDICTOR=YES',
+                    'BLOCKSIZE=512',
+                    'NUM_THREADS=ALL_CPUS',
+                    'BIGTIFF=IF_SAFER'
+                ]
+            )
+            if out_dataset is None:
+                raise ValueError(f"无法创建输出文件: {output_path}")
+            out_dataset = None
+            vrt_dataset = None
             
-            # 计算NDVI
-            denominator = nir + red
-            valid_denominator = denominator[valid_mask]
+            logger.info(f"{index_name}（GDAL像素函数）已保存到: {output_path}")
+            return True
             
-            # 避免除零错误
-            valid_denominator[valid_denominator == 0] = 1e-10
+        except Exception as e:
+            logger.error(f"GDAL像素函数计算{index_name}失败: {e}")
+            return False
+    
+    def _get_scratch(self, shape):
+        """获取与影像同形状的float32临时缓冲区（惰性分配，各指数间复用）"""
+        if self._scratch is None or self._scratch.shape != shape:
+            self._scratch = np.empty(shape, dtype=np.float32)
+        return self._scratch
+    
+    def calculate_ndvi(self, red_band=3, nir_band=4):
+        """
+        计算NDVI（归一化植被指数）
+        
+        Args:
+            red_band: 红波段编号
+            nir_band: 近红外波段编号
+        """
+        try:
+            if not self._has_bands(red_band, nir_band):
+                raise ValueError(f"波段 {red_band} 或 {nir_band} 不存在")
             
-            ndvi[valid_mask] = (nir[valid_mask] - red[valid_mask]) / valid_denominator
+            red = self.band_stack[red_band - 1]
+            nir = self.band_stack[nir_band - 1]
             
-            # 限制值范围
-            ndvi = np.clip(ndvi, -1, 1)
+            ndvi = _norm_diff(
+                nir, red, scratch=self._get_scratch(nir.shape),
+                valid_mask=self._pair_valid_mask(nir_band, red_band)
+            )
             
             logger.info("NDVI计算完成")
             return ndvi
@@ -154,31 +770,16 @@ class GDALEcologicalIndexCalculator:
             nir_band: 近红外波段编号
         """
         try:
-            if green_band not in self.bands or nir_band not in self.bands:
+            if not self._has_bands(green_band, nir_band):
                 raise ValueError(f"波段 {green_band} 或 {nir_band} 不存在")
             
-            green = self.bands[green_band]
-            nir = self.bands[nir_band]
+            green = self.band_stack[green_band - 1]
+            nir = self.band_stack[nir_band - 1]
             
-            # 处理无效值
-            green_valid = np.isfinite(green)
-            nir_valid = np.isfinite(nir)
-            valid_mask = green_valid & nir_valid
-            
-            # 初始化结果数组
-            ndwi = np.full(green.shape, np.nan, dtype=np.float32)
-            
-            # 计算NDWI
-            denominator = green + nir
-            valid_denominator = denominator[valid_mask]
-            
-            # 避免除零错误
-            valid_denominator[valid_denominator == 0] = 1e-10
-            
-            ndwi[valid_mask] = (green[valid_mask] - nir[valid_mask]) / valid_denominator
-            
-            # 限制值范围
-            ndwi = np.clip(ndwi, -1, 1)
+            ndwi = _norm_diff(
+                green, nir, scratch=self._get_scratch(green.shape),
+                valid_mask=self._pair_valid_mask(green_band, nir_band)
+            )
             
             logger.info("NDWI计算完成")
             return ndwi
@@ -196,31 +797,16 @@ class GDALEcologicalIndexCalculator:
             swir_band: 短波红外波段编号
         """
         try:
-            if nir_band not in self.bands or swir_band not in self.bands:
+            if not self._has_bands(nir_band, swir_band):
                 raise ValueError(f"波段 {nir_band} 或 {swir_band} 不存在")
             
-            nir = self.bands[nir_band]
-            swir = self.bands[swir_band]
-            
-            # 处理无效值
-            nir_valid = np.isfinite(nir)
-            swir_valid = np.isfinite(swir)
-            valid_mask = nir_valid & swir_valid
-            
-            # 初始化结果数组
-            ndbi = np.full(nir.shape, np.nan, dtype=np.float32)
+            nir = self.band_stack[nir_band - 1]
+            swir = self.band_stack[swir_band - 1]
             
-            # 计算NDBI
-            denominator = nir + swir
-            valid_denominator = denominator[valid_mask]
-            
-            # 避免除零错误
-            valid_denominator[valid_denominator == 0] = 1e-10
-            
-            ndbi[valid_mask] = (swir[valid_mask] - nir[valid_mask]) / valid_denominator
-            
-            # 限制值范围
-            ndbi = np.clip(ndbi, -1, 1)
+            ndbi = _norm_diff(
+                swir, nir, scratch=self._get_scratch(swir.shape),
+                valid_mask=self._pair_valid_mask(swir_band, nir_band)
+            )
             
             logger.info("NDBI计算完成")
             return ndbi
@@ -238,31 +824,16 @@ class GDALEcologicalIndexCalculator:
             swir_band: 短波红外波段编号
         """
         try:
-            if green_band not in self.bands or swir_band not in self.bands:
+            if not self._has_bands(green_band, swir_band):
                 raise ValueError(f"波段 {green_band} 或 {swir_band} 不存在")
             
-            green = self.bands[green_band]
-            swir = self.bands[swir_band]
-            
-            # 处理无效值
-            green_valid = np.isfinite(green)
-            swir_valid = np.isfinite(swir)
-            valid_mask = green_valid & swir_valid
-            
-            # 初始化结果数组
-            ndsi = np.full(green.shape, np.nan, dtype=np.float32)
-            
-            # 计算NDSI
-            denominator = green + swir
-            valid_denominator = denominator[valid_mask]
-            
-            # 避免除零错误
-            valid_denominator[valid_denominator == 0] = 1e-10
-            
-            ndsi[valid_mask] = (green[valid_mask] - swir[valid_mask]) / valid_denominator
+            green = self.band_stack[green_band - 1]
+            swir = self.band_stack[swir_band - 1]
             
-            # 限制值范围
-            ndsi = np.clip(ndsi, -1, 1)
+            ndsi = _norm_diff(
+                green, swir, scratch=self._get_scratch(green.shape),
+                valid_mask=self._pair_valid_mask(green_band, swir_band)
+            )
             
             logger.info("NDSI计算完成")
             return ndsi
@@ -277,32 +848,23 @@ class GDALEcologicalIndexCalculator:
         用于提取绿度、亮度、湿度等特征
         """
         try:
-            # Landsat 8 缨帽变换系数
-            # 假设波段顺序：Blue, Green, Red, NIR, SWIR1, SWIR2
-            tc_coefficients = {
-                'brightness': [0.3029, 0.2786, 0.4733, 0.5599, 0.5080, 0.1872],
-                'greenness': [-0.2941, -0.2430, -0.5424, 0.7276, 0.0713, -0.1608],
-                'wetness': [0.1511, 0.1973, 0.3283, 0.3407, -0.7117, -0.4559],
-                'fourth': [-0.8239, 0.0849, 0.4396, -0.0580, 0.2013, -0.2773],
-                'fifth': [-0.3294, 0.0557, 0.1056, 0.1855, -0.4349, 0.8085],
-                'sixth': [0.1079, -0.9023, 0.4119, 0.0575, -0.0259, 0.0252]
-            }
-            
-            # 准备波段数据
-            band_data = []
-            for i in range(1, min(7, self.band_count + 1)):  # 最多6个波段
-                band_data.append(self.bands[i].flatten())
+            # 同一影像只计算一次（RSEI等方法复用）
+            if self._tc_cache is not None:
+                return self._tc_cache
             
-            band_matrix = np.column_stack(band_data)
+            # 准备波段数据：最多6个波段，(波段数, 像素数) 为band_stack的视图，不复制
+            components, coef_matrix = _tc_coefficient_matrix(self.band_count)
+            nb = coef_matrix.shape[1]
+            band_matrix = self.band_stack[:nb].reshape(nb, -1)
             
-            # 计算缨帽变换
+            # 所有分量合并为一次矩阵乘法 (分量数, 波段数) @ (波段数, 像素数)，直接写入结果缓冲区
             tc_results = {}
-            for component, coefficients in tc_coefficients.items():
-                if len(coefficients) <= len(band_data):
-                    # 只使用可用的波段
-                    coef_array = np.array(coefficients[:len(band_data)])
-                    tc_value = np.dot(band_matrix, coef_array)
-                    tc_results[component] = tc_value.reshape(self.height, self.width)
+            if components:
+                tc_values = np.empty((len(components), band_matrix.shape[1]), dtype=np.float32)
+                np.matmul(coef_matrix, band_matrix, out=tc_values)
+                tc_values = tc_values.reshape(len(components), self.height, self.width)
+                tc_results = dict(zip(components, tc_values))
+            self._tc_cache = tc_results
             
             logger.info("缨帽变换计算完成")
             return tc_results
@@ -331,38 +893,46 @@ class GDALEcologicalIndexCalculator:
             if any(x is None for x in [greenness, wetness, brightness, fourth]):
                 raise ValueError("无法获取所有缨帽变换分量")
             
-            # 准备数据矩阵
-            valid_mask = np.isfinite(greenness) & np.isfinite(wetness) & \
-                        np.isfinite(brightness) & np.isfinite(fourth)
-            
-            data_matrix = np.column_stack([
-                greenness[valid_mask],
-                wetness[valid_mask],
-                brightness[valid_mask],
-                fourth[valid_mask]
-            ])
-            
-            # 标准化
-            scaler = StandardScaler()
-            data_scaled = scaler.fit_transform(data_matrix)
-            
-            # 主成分分析
-            pca = PCA(n_components=4)
-            pca_result = pca.fit_transform(data_scaled)
-            
-            # 第一主成分作为RSEI
-            pc1 = pca_result[:, 0]
-            
-            # 重构RSEI图像
-            rsei = np.full(greenness.shape, np.nan, dtype=np.float32)
-            rsei[valid_mask] = pc1
-            
-            # 标准化到[0, 1]范围
-            rsei_valid = rsei[valid_mask]
-            rsei[valid_mask] = (rsei_valid - np.min(rsei_valid)) / (np.max(rsei_valid) - np.min(rsei_valid))
+            # 四个分量的一维视图；所有遍历均在原数组上进行，不构建 (N, 4) 数据矩阵
+            components = [c.reshape(-1) for c in (greenness, wetness, brightness, fourth)]
+            
+            # 分量为有限值当且仅当参与计算的波段均为有限值，直接复用加载时的掩膜
+            valid = self._tc_valid_mask().reshape(-1)
+            if logger.isEnabledFor(logging.DEBUG):
+                for name, c in zip(('greenness', 'wetness', 'brightness', 'fourth'), components):
+                    if not np.isfinite(c[valid]).all():
+                        logger.warning(f"缨帽变换分量{name}在有效掩膜内存在非有限值")
+            
+            # 一次遍历得到有效像素数、均值和协方差
+            n, sums, cross = masked_moments4(*components, valid)
+            if n == 0:
+                raise ValueError("没有有效像素")
+            mean = sums / n
+            std = np.sqrt(np.clip(np.diag(cross) / n - mean * mean, 0, None))
+            std[std == 0] = 1
+            
+            # 主成分分析：标准化后的4x4协方差矩阵特征分解，按特征值降序排列
+            cov = (cross - n * np.outer(mean, mean)) / max(n - 1, 1) / np.outer(std, std)
+            eigenvalues, eigenvectors = np.linalg.eigh(cov)
+            eigenvalues = eigenvalues[::-1]
+            eigenvectors = eigenvectors[:, ::-1]
+            
+            # 特征向量符号不唯一，约定第一主成分中绿度权重为正
+            if eigenvectors[0, 0] < 0:
+                eigenvectors[:, 0] *= -1
+            
+            # 第一主成分作为RSEI：标准化并入投影权重，一次并行遍历直接写出结果
+            weights = eigenvectors[:, 0]
+            rsei = np.empty(greenness.shape, dtype=np.float32)
+            pc1_min, pc1_max = project4(
+                *components, weights / std, float((weights / std) @ mean), valid, rsei.reshape(-1)
+            )
             
-            # 计算权重
-            weights = pca.components_[0]
+            # 标准化到[0, 1]范围（第一主成分为常数时全部为0）
+            pc1_range = pc1_max - pc1_min
+            rsei -= np.float32(pc1_min)
+            if pc1_range > 0:
+                rsei /= np.float32(pc1_range)
             
             logger.info("RSEI计算完成")
             return {
@@ -372,7 +942,7 @@ class GDALEcologicalIndexCalculator:
                 'dryness': -brightness,  # 干度指数为亮度的负值
                 'heat': fourth,
                 'weights': weights,
-                'explained_variance': pca.explained_variance_ratio_
+                'explained_variance': eigenvalues / eigenvalues.sum()
             }
             
         except Exception as e:
@@ -390,35 +960,45 @@ class GDALEcologicalIndexCalculator:
             if index_data is None:
                 return None
             
-            # 移除无效值
+            # 移除无效值（分位数计算需要一份可原地重排的有效值副本）
             valid_data = index_data[np.isfinite(index_data)]
+            n_valid = valid_data.size
             
-            if len(valid_data) == 0:
+            if n_valid == 0:
                 return None
             
+            # 一次遍历得到最值、和与平方和
+            _, min_val, max_val, total, total_sq = nan_stats(valid_data)
+            mean_val = total / n_valid
+            std_val = np.sqrt(max(total_sq / n_valid - mean_val * mean_val, 0.0))
+            
+            # 一次部分排序得到全部分位数（与np.percentile的线性插值结果一致）
+            percentile_25, median, percentile_75 = _quantiles(valid_data, (0.25, 0.5, 0.75))
+            
             stats = {
-                'min': float(np.min(valid_data)),
-                'max': float(np.max(valid_data)),
-                'mean': float(np.mean(valid_data)),
-                'std': float(np.std(valid_data)),
-                'median': float(np.median(valid_data)),
-                'percentile_25': float(np.percentile(valid_data, 25)),
-                'percentile_75': float(np.percentile(valid_data, 75)),
-                'valid_pixels': int(len(valid_data)),
+                'min': float(min_val),
+                'max': float(max_val),
+                'mean': float(mean_val),
+                'std': float(std_val),
+                'median': float(median),
+                'percentile_25': float(percentile_25),
+                'percentile_75': float(percentile_75),
+                'valid_pixels': int(n_valid),
                 'total_pixels': int(index_data.size),
-                'valid_ratio': float(len(valid_data) / index_data.size)
+                'valid_ratio': float(n_valid / index_data.size)
             }
             
             # 分类统计（适用于NDVI等指数）
             if stats['min'] >= -1 and stats['max'] <= 1:
-                # 五级分类
-                thresholds = [-1, -0.2, 0, 0.2, 0.4, 1]
-                labels = ['很差', '差', '中等', '良好', '优秀']
+                # 五级分类：一次digitize + bincount，第i级为 [thresholds[i], thresholds[i+1])
+                thresholds = np.array(CLASS_THRESHOLDS, dtype=valid_data.dtype)
+                counts = np.bincount(
+                    np.digitize(valid_data, thresholds), minlength=len(thresholds) + 1
+                )
                 
-                for i, (threshold, label) in enumerate(zip(thresholds[:-1], labels)):
-                    mask = (valid_data >= threshold) & (valid_data < thresholds[i+1])
-                    stats[f'{label}_pixels'] = int(np.sum(mask))
-                    stats[f'{label}_ratio'] = float(np.sum(mask) / len(valid_data))
+                for i, label in enumerate(CLASS_LABELS, start=1):
+                    stats[f'{label}_pixels'] = int(counts[i])
+                    stats[f'{label}_ratio'] = float(counts[i] / n_valid)
             
             return stats
             
@@ -426,56 +1006,84 @@ class GDALEcologicalIndexCalculator:
             logger.error(f"计算统计信息失败: {e}")
             return None
     
+    def _create_output(self, output_path, index_names, data_type=gdal.GDT_Float32,
+                       nodata=NODATA_VALUE, extra_options=()):
+        """
+        创建输出GeoTIFF（分块压缩），每个指数一个波段，并设置地理参考、描述和无效值
+        
+        Args:
+            output_path: 输出文件路径
+            index_names: 指数名称或指数名称列表
+            data_type: GDAL数据类型，默认float32
+            nodata: 无效值
+            extra_options: 额外的创建选项
+            
+        Returns:
+            gdal.Dataset: 输出数据集
+        """
+        if isinstance(index_names, str):
+            index_names = [index_names]
+        
+        options = list(GTIFF_CREATION_OPTIONS)
+        if data_type != gdal.GDT_Float32:
+            # 浮点预测器只适用于浮点数据，整型数据使用水平差分预测器
+            options = ['PREDICTOR=2' if o == 'PREDICTOR=3' else o for o in options]
+        if len(index_names) > 1:
+            options.append('INTERLEAVE=BAND')
+        options.extend(extra_options)
+        
+        driver = gdal.GetDriverByName('GTiff')
+        out_dataset = driver.Create(
+            output_path,
+            self.width,
+            self.height,
+            len(index_names),
+            data_type,
+            options=options
+        )
+        
+        if out_dataset is None:
+            raise ValueError(f"无法创建输出文件: {output_path}")
+        
+        # 设置地理变换参数
+        out_dataset.SetGeoTransform(self.geotransform)
+        out_dataset.SetProjection(self.projection)
+        
+        # 设置元数据
+        for i, index_name in enumerate(index_names, start=1):
+            out_band = out_dataset.GetRasterBand(i)
+            out_band.SetDescription(f"{index_name} Index")
+            out_band.SetNoDataValue(nodata)
+        return out_dataset
+    
     def save_result(self, index_data, output_path, index_name="index"):
         """
         保存计算结果为GeoTIFF文件
         
         Args:
             index_data: 指数数据数组
-            output_path: 输出文件路径
+            output_path: 输出文件路径，所在目录需由调用方预先创建
             index_name: 指数名称
         """
         try:
             if index_data is None:
                 raise ValueError("指数数据为空")
             
-            # 创建输出目录
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
             # 创建GeoTIFF文件
-            driver = gdal.GetDriverByName('GTiff')
-            out_dataset = driver.Create(
-                output_path,
-                self.width,
-                self.height,
-                1,  # 单波段
-                gdal.GDT_Float32
-            )
+            out_dataset = self._create_output(output_path, index_name)
             
-            if out_dataset is None:
-                raise ValueError("无法创建输出文件")
-            
-            # 设置地理变换参数
-            out_dataset.SetGeoTransform(self.geotransform)
-            out_dataset.SetProjection(self.projection)
-            
-            # 写入数据
+            # 按行条带写入数据，NaN在写入时替换为NODATA_VALUE，不复制整幅数组；
+            # 统计信息在写入的同时累积
             out_band = out_dataset.GetRasterBand(1)
-            out_band.WriteArray(index_data)
-            
-            # 设置元数据
-            out_band.SetDescription(f"{index_name} Index")
-            out_band.SetNoDataValue(np.nan)
+            band_stats = _BandStatistics()
+            strip = TILE_SIZE[1]
+            for yoff in range(0, self.height, strip):
+                strip_data = index_data[yoff:yoff + strip]
+                out_band.WriteArray(_fill_nodata(strip_data), 0, yoff)
+                band_stats.update(strip_data)
             
-            # 计算统计信息
-            valid_data = index_data[np.isfinite(index_data)]
-            if len(valid_data) > 0:
-                out_band.SetStatistics(
-                    float(np.min(valid_data)),
-                    float(np.max(valid_data)),
-                    float(np.mean(valid_data)),
-                    float(np.std(valid_data))
-                )
+            # 设置统计信息
+            band_stats.apply(out_band)
             
             # 刷新缓存
             out_band.FlushCache()
@@ -491,62 +1099,165 @@ class GDALEcologicalIndexCalculator:
             logger.error(f"保存结果失败: {e}")
             return False
     
+    def save_quicklook_int8(self, source_path, band_num, output_path, index_name="index"):
+        """
+        将已输出的取值在[-1, 1]的指数波段量化为int8保存（快速浏览用，文件约为float32的1/4）
+        
+        像素值 = round(指数 * 127)，波段比例系数为1/127，无效值为-128；
+        按行条带从源文件读取，内存占用与条带大小相关
+        
+        Args:
+            source_path: 指数GeoTIFF路径（calculate_indices_tiled或calculate_norm_diff_gdal的输出）
+            band_num: 源文件中的波段编号（从1开始）
+            output_path: 输出文件路径
+            index_name: 指数名称
+        """
+        try:
+            source = gdal.Open(source_path, gdal.GA_ReadOnly)
+            source_band = source.GetRasterBand(band_num)
+            source_nodata = source_band.GetNoDataValue()
+            
+            # GDAL 3.7起支持Int8类型，更早的版本用带符号标记的Byte
+            data_type = getattr(gdal, 'GDT_Int8', None)
+            extra_options = []
+            if data_type is None:
+                data_type = gdal.GDT_Byte
+                extra_options.append('PIXELTYPE=SIGNEDBYTE')
+            
+            out_dataset = self._create_output(
+                output_path, index_name, data_type=data_type,
+                nodata=QUICKLOOK_NODATA, extra_options=extra_options
+            )
+            out_band = out_dataset.GetRasterBand(1)
+            out_band.SetScale(1 / QUICKLOOK_SCALE)
+            out_band.SetOffset(0)
+            
+            # 按行条带读取、量化写入
+            strip = TILE_SIZE[1]
+            for yoff in range(0, self.height, strip):
+                ysize = min(strip, self.height - yoff)
+                data = source_band.ReadAsArray(0, yoff, self.width, ysize, buf_type=gdal.GDT_Float32)
+                scaled = np.multiply(data, QUICKLOOK_SCALE, dtype=np.float32)
+                valid = np.isfinite(scaled)
+                if source_nodata is not None:
+                    valid &= data != source_nodata
+                np.clip(scaled, -QUICKLOOK_SCALE, QUICKLOOK_SCALE, out=scaled)
+                quantized = np.rint(scaled, out=scaled).astype(np.int8)
+                quantized[~valid] = QUICKLOOK_NODATA
+                out_band.WriteArray(quantized, 0, yoff)
+            
+            out_dataset.FlushCache()
+            out_dataset = None
+            source = None
+            
+            logger.info(f"快速浏览结果已保存到: {output_path}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"保存快速浏览结果失败: {e}")
+            return False
+    
+    def read_preview(self, path, band_num=1):
+        """
+        按块均值降采样读取输出GeoTIFF的一个波段，供create_visualization使用
+        
+        最长边不超过PREVIEW_MAX_SIZE，无效值不参与平均，读出后为NaN
+        
+        Args:
+            path: GeoTIFF文件路径
+            band_num: 波段编号（从1开始）
+            
+        Returns:
+            np.ndarray: float32二维数组，失败返回None
+        """
+        try:
+            dataset = gdal.Open(path, gdal.GA_ReadOnly)
+            band = dataset.GetRasterBand(band_num)
+            width, height = dataset.RasterXSize, dataset.RasterYSize
+            factor = max(1, -(-max(width, height) // PREVIEW_MAX_SIZE))
+            data = band.ReadAsArray(
+                buf_xsize=max(width // factor, 1),
+                buf_ysize=max(height // factor, 1),
+                buf_type=gdal.GDT_Float32,
+                resample_alg=gdal.GRIORA_Average
+            )
+            nodata = band.GetNoDataValue()
+            if nodata is not None:
+                data[data == nodata] = np.nan
+            return data
+        except Exception as e:
+            logger.error(f"读取预览失败: {e}")
+            return None
+    
     def create_visualization(self, index_data, index_name, output_path, colormap='RdYlGn'):
         """
         创建可视化图片
         
+        分布图用颜色查找表直接映射为RGB并由Pillow编码为PNG（最长边不超过PREVIEW_MAX_SIZE）；
+        直方图、颜色条和统计信息用matplotlib绘制，保存为同目录下的 <文件名>_histogram.png
+        
         Args:
             index_data: 指数数据数组
             index_name: 指数名称
-            output_path: 输出图片路径
+            output_path: 输出图片路径，所在目录需由调用方预先创建
             colormap: 颜色映射
         """
         try:
             if index_data is None:
                 raise ValueError("指数数据为空")
             
-            # 创建输出目录
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
-            # 准备数据
-            valid_data = index_data[np.isfinite(index_data)]
-            if len(valid_data) == 0:
+            # 一次遍历得到统计信息
+            n_valid, vmin, vmax, total, total_sq = nan_stats(index_data)
+            if n_valid == 0:
                 raise ValueError("没有有效数据")
-            
-            # 创建图形
-            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
-            
-            # 主图：指数分布
-            im1 = ax1.imshow(index_data, cmap=colormap, vmin=np.min(valid_data), vmax=np.max(valid_data))
-            ax1.set_title(f'{index_name} 分布图')
-            ax1.axis('off')
+            mean_val = total / n_valid
+            std_val = np.sqrt(max(total_sq / n_valid - mean_val * mean_val, 0.0))
+            
+            # 主图：降采样后查表着色，无效值显示为白色
+            preview = _downsample(index_data, PREVIEW_MAX_SIZE)
+            scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+            color_index = np.subtract(preview, np.float32(vmin), dtype=np.float32)
+            color_index *= np.float32(scale)
+            valid = np.isfinite(color_index)
+            color_index[~valid] = 0
+            np.clip(color_index, 0, 255, out=color_index)
+            
+            rgb = _colormap_lut(colormap)[color_index.astype(np.uint8)]
+            rgb[~valid] = 255
+            Image.fromarray(rgb, 'RGB').save(output_path, optimize=False)
+            
+            # 直方图：先用NumPy分箱，只把50个柱子交给matplotlib绘制
+            counts, edges = np.histogram(index_data, bins=50, range=(vmin, vmax))
+            fig, ax = plt.subplots(figsize=(8, 6))
+            ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge',
+                   alpha=0.7, color='skyblue', edgecolor='black')
+            ax.set_title(f'{index_name} 值分布直方图')
+            ax.set_xlabel(f'{index_name} 值')
+            ax.set_ylabel('像素数量')
+            ax.grid(True, alpha=0.3)
             
             # 添加颜色条
-            cbar1 = plt.colorbar(im1, ax=ax1, shrink=0.8)
-            cbar1.set_label(f'{index_name} 值')
-            
-            # 子图：直方图
-            ax2.hist(valid_data, bins=50, alpha=0.7, color='skyblue', edgecolor='black')
-            ax2.set_title(f'{index_name} 值分布直方图')
-            ax2.set_xlabel(f'{index_name} 值')
-            ax2.set_ylabel('像素数量')
-            ax2.grid(True, alpha=0.3)
+            mappable = plt.cm.ScalarMappable(
+                norm=colors.Normalize(vmin=vmin, vmax=vmax), cmap=colormap
+            )
+            cbar = fig.colorbar(mappable, ax=ax, orientation='horizontal', pad=0.15)
+            cbar.set_label(f'{index_name} 值')
             
             # 添加统计信息
             stats_text = f"""
             统计信息:
-            最小值: {np.min(valid_data):.4f}
-            最大值: {np.max(valid_data):.4f}
-            平均值: {np.mean(valid_data):.4f}
-            标准差: {np.std(valid_data):.4f}
-            有效像素: {len(valid_data):,}
+            最小值: {vmin:.4f}
+            最大值: {vmax:.4f}
+            平均值: {mean_val:.4f}
+            标准差: {std_val:.4f}
+            有效像素: {n_valid:,}
             """
-            ax2.text(0.02, 0.98, stats_text, transform=ax2.transAxes, 
+            ax.text(0.02, 0.98, stats_text, transform=ax.transAxes,
                     verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
             
-            plt.tight_layout()
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            plt.close()
+            histogram_path = os.path.splitext(output_path)[0] + '_histogram.png'
+            fig.savefig(histogram_path, dpi=100, bbox_inches='tight')
+            plt.close(fig)
             
             logger.info(f"可视化图片已保存到: {output_path}")
             return True
@@ -557,104 +1268,117 @@ class GDALEcologicalIndexCalculator:
     
     def close(self):
         """关闭数据集"""
+        self._scratch = None
+        self.valid_mask = None
+        self._valid_masks = {}
+        self._tc_cache = None
+        self._release_band_stack()
         if self.dataset is not None:
             self.dataset = None
             logger.info("数据集已关闭")
 
 
-def calculate_all_indices(image_path, output_dir):
+# 各归一化差值指数可视化使用的颜色映射
+NORM_DIFF_COLORMAPS = {
+    'NDVI': 'RdYlGn',
+    'NDWI': 'Blues',
+    'NDBI': 'Reds',
+    'NDSI': 'Blues',
+}
+
+
+def calculate_all_indices(image_path, output_dir, include_rsei=True, use_gdal_pixel_functions=False,
+                          quicklook=False):
     """
     计算所有生态指数的便捷函数
     
+    归一化差值指数和缨帽变换分量由calculate_indices_tiled分块计算并写入indices.tif，
+    内存占用与瓦片大小相关；只有计算RSEI（全图主成分分析）时才把全部波段读入内存
+    
     Args:
         image_path: 输入影像路径
-        output_dir: 输出目录
+        output_dir: 输出目录（不存在时创建）
+        include_rsei: 是否计算RSEI
+        use_gdal_pixel_functions: 归一化差值指数改用calculate_norm_diff_gdal（纯GDAL像素函数）
+            逐个输出 <指数>.tif，不计算缨帽变换分量；任一指数失败时回退到分块计算
+        quicklook: 是否为归一化差值指数额外输出int8快速浏览文件 <指数>_quicklook.tif
     """
     try:
-        # 创建计算器
-        calculator = GDALEcologicalIndexCalculator(image_path)
+        # 一次性创建输出目录，各保存方法不再各自创建
+        os.makedirs(output_dir, exist_ok=True)
         
-        # 加载影像
-        if not calculator.load_image():
+        # 创建计算器，分块计算只需打开数据集
+        calculator = GDALEcologicalIndexCalculator(image_path)
+        if not calculator.load_image(read_bands=False):
             raise ValueError("无法加载影像")
         
         # 获取波段信息
         band_info = calculator.get_band_info()
         logger.info(f"波段信息: {json.dumps(band_info, indent=2, default=str)}")
         
-        # 计算各种指数
-        indices = {}
         results = {}
         
-        # NDVI
-        ndvi = calculator.calculate_ndvi()
-        if ndvi is not None:
-            indices['NDVI'] = ndvi
-            results['NDVI'] = calculator.calculate_statistics(ndvi)
-            
-            # 保存结果
-            ndvi_path = os.path.join(output_dir, 'ndvi.tif')
-            calculator.save_result(ndvi, ndvi_path, 'NDVI')
-            
-            # 创建可视化
-            vis_path = os.path.join(output_dir, 'ndvi_visualization.png')
-            calculator.create_visualization(ndvi, 'NDVI', vis_path, 'RdYlGn')
+        # {指数名称: (输出文件路径, 波段编号)}
+        outputs = {}
+        if use_gdal_pixel_functions:
+            for index_name in NORM_DIFF_COLORMAPS:
+                if max(NORM_DIFF_BANDS[index_name]) > calculator.band_count:
+                    continue
+                index_path = os.path.join(output_dir, f'{index_name.lower()}.tif')
+                if not calculator.calculate_norm_diff_gdal(index_name, index_path):
+                    logger.warning("GDAL像素函数计算失败，改用分块计算")
+                    outputs = {}
+                    break
+                outputs[index_name] = (index_path, 1)
+                # 输出由GDAL生成，统计信息由GDAL计算（近似统计关闭）
+                dataset = gdal.Open(index_path, gdal.GA_ReadOnly)
+                min_val, max_val, mean_val, std_val = dataset.GetRasterBand(1).ComputeStatistics(False)
+                dataset = None
+                results[index_name] = {'min': min_val, 'max': max_val, 'mean': mean_val, 'std': std_val}
         
-        # NDWI
-        ndwi = calculator.calculate_ndwi()
-        if ndwi is not None:
-            indices['NDWI'] = ndwi
-            results['NDWI'] = calculator.calculate_statistics(ndwi)
-            
-            ndwi_path = os.path.join(output_dir, 'ndwi.tif')
-            calculator.save_result(ndwi, ndwi_path, 'NDWI')
-            
-            vis_path = os.path.join(output_dir, 'ndwi_visualization.png')
-            calculator.create_visualization(ndwi, 'NDWI', vis_path, 'Blues')
+        # NDVI/NDWI/NDBI/NDSI及缨帽变换分量：分块计算，统计信息在写出时累积
+        if not outputs:
+            results = {}
+            tiled = calculator.calculate_indices_tiled(output_dir)
+            if tiled is None:
+                raise ValueError("分块计算指数失败")
+            for index_name in NORM_DIFF_COLORMAPS:
+                if index_name in tiled['bands']:
+                    outputs[index_name] = (tiled['path'], tiled['bands'][index_name])
+                    results[index_name] = tiled['statistics'][index_name]
         
-        # NDBI
-        ndbi = calculator.calculate_ndbi()
-        if ndbi is not None:
-            indices['NDBI'] = ndbi
-            results['NDBI'] = calculator.calculate_statistics(ndbi)
-            
-            ndbi_path = os.path.join(output_dir, 'ndbi.tif')
-            calculator.save_result(ndbi, ndbi_path, 'NDBI')
-            
-            vis_path = os.path.join(output_dir, 'ndbi_visualization.png')
-            calculator.create_visualization(ndbi, 'NDBI', vis_path, 'Reds')
-        
-        # NDSI
-        ndsi = calculator.calculate_ndsi()
-        if ndsi is not None:
-            indices['NDSI'] = ndsi
-            results['NDSI'] = calculator.calculate_statistics(ndsi)
-            
-            ndsi_path = os.path.join(output_dir, 'ndsi.tif')
-            calculator.save_result(ndsi, ndsi_path, 'NDSI')
-            
-            vis_path = os.path.join(output_dir, 'ndsi_visualization.png')
-            calculator.create_visualization(ndsi, 'NDSI', vis_path, 'Blues')
+        for index_name, (index_path, band_num) in outputs.items():
+            # 可视化使用降采样读取的预览
+            preview = calculator.read_preview(index_path, band_num)
+            colormap = NORM_DIFF_COLORMAPS[index_name]
+            vis_path = os.path.join(output_dir, f'{index_name.lower()}_visualization.png')
+            calculator.create_visualization(preview, index_name, vis_path, colormap)
+            
+            if quicklook:
+                quicklook_path = os.path.join(output_dir, f'{index_name.lower()}_quicklook.tif')
+                calculator.save_quicklook_int8(index_path, band_num, quicklook_path, index_name)
         
         # RSEI
-        rsei_result = calculator.calculate_rsei()
-        if rsei_result is not None:
-            indices['RSEI'] = rsei_result['rsei']
-            results['RSEI'] = calculator.calculate_statistics(rsei_result['rsei'])
-            
-            # 保存RSEI结果
-            rsei_path = os.path.join(output_dir, 'rsei.tif')
-            calculator.save_result(rsei_result['rsei'], rsei_path, 'RSEI')
-            
-            vis_path = os.path.join(output_dir, 'rsei_visualization.png')
-            calculator.create_visualization(rsei_result['rsei'], 'RSEI', vis_path, 'RdYlGn')
-            
-            # 保存分量
-            for component in ['greenness', 'wetness', 'dryness', 'heat']:
-                if component in rsei_result:
-                    comp_data = rsei_result[component]
-                    comp_path = os.path.join(output_dir, f'rsei_{component}.tif')
-                    calculator.save_result(comp_data, comp_path, f'RSEI_{component.upper()}')
+        if include_rsei:
+            if not calculator.load_image():
+                raise ValueError("无法加载影像")
+            rsei_result = calculator.calculate_rsei()
+            if rsei_result is not None:
+                results['RSEI'] = calculator.calculate_statistics(rsei_result['rsei'])
+                
+                # 保存RSEI结果
+                rsei_path = os.path.join(output_dir, 'rsei.tif')
+                calculator.save_result(rsei_result['rsei'], rsei_path, 'RSEI')
+                
+                vis_path = os.path.join(output_dir, 'rsei_visualization.png')
+                calculator.create_visualization(rsei_result['rsei'], 'RSEI', vis_path, 'RdYlGn')
+                
+                # 保存分量
+                for component in ['greenness', 'wetness', 'dryness', 'heat']:
+                    if component in rsei_result:
+                        comp_data = rsei_result[component]
+                        comp_path = os.path.join(output_dir, f'rsei_{component}.tif')
+                        calculator.save_result(comp_data, comp_path, f'RSEI_{component.upper()}')
         
         # 保存统计结果
         stats_path = os.path.join(output_dir, 'statistics.json')
@@ -674,20 +1398,26 @@ def calculate_all_indices(image_path, output_dir):
 
 if __name__ == "__main__":
     # 测试代码
-    import sys
-    
-    if len(sys.argv) != 3:
-        print("用法: python gdal_ecological_indices.py <input_image> <output_dir>")
-        sys.exit(1)
+    import argparse
     
-    input_image = sys.argv[1]
-    output_dir = sys.argv[2]
+    parser = argparse.ArgumentParser(description='GDAL生态指数计算')
+    parser.add_argument('input_image', help='输入影像路径')
+    parser.add_argument('output_dir', help='输出目录')
+    parser.add_argument('--gdal', action='store_true', help='归一化差值指数使用纯GDAL像素函数计算')
+    parser.add_argument('--quicklook', action='store_true', help='额外输出归一化差值指数的int8快速浏览文件')
+    parser.add_argument('--no-rsei', action='store_true', help='不计算RSEI（不把全部波段读入内存）')
+    args = parser.parse_args()
     
     # 设置日志
     logging.basicConfig(level=logging.INFO)
     
     # 计算所有指数
-    results = calculate_all_indices(input_image, output_dir)
+    results = calculate_all_indices(
+        args.input_image, args.output_dir,
+        include_rsei=not args.no_rsei,
+        use_gdal_pixel_functions=args.gdal,
+        quicklook=args.quicklook
+    )
     
     if results:
         print("计算完成！")
@@ -8,18 +8,82 @@ from osgeo import gdal, osr
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from matplotlib.colors import ListedColormap
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import os
+import math
 import json
 import pandas as pd
 from scipy import ndimage
 from sklearn.cluster import KMeans
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# orjson为可选依赖，未安装时退回标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import cc3d  # connected-components-3d，可选：比ndimage.label更快的连通域标记
+except ImportError:
+    cc3d = None
+
+from ._kernels import clip_classes, count_class_patches
 
 # 设置GDAL错误处理
 gdal.UseExceptions()
 
 logger = logging.getLogger(__name__)
 
+# 分类数据以uint8存放：有效分类ID为1-8，越界值限制到 [0, 254]，无效值统一记为255
+NODATA_CLASS = 255
+# 分类计数直方图的箱数（覆盖uint8全部取值，按分类ID直接索引）
+CLASS_BINS = 256
+
+# 分布图的最长边像素数，超过时按整数步长最近邻抽样
+PREVIEW_MAX_SIZE = 2000
+
+# 可视化输出分辨率，以及绘图时的rc设置（不使用LaTeX排版，简化路径）
+VISUALIZATION_DPI = 150
+_PLOT_RC = {
+    'text.usetex': False,
+    'path.simplify': True,
+    'path.simplify_threshold': 1.0,
+}
+
+# 土壤侵蚀敏感性（基于土地利用类型）
+EROSION_SENSITIVITY = {
+    1: 0.3,  # 耕地 - 中等敏感
+    2: 0.1,  # 林地 - 低敏感
+    3: 0.2,  # 草地 - 低敏感
+    4: 0.0,  # 水域 - 无侵蚀
+    5: 0.8,  # 建设用地 - 高敏感
+    6: 0.9,  # 未利用地 - 极高敏感
+    7: 0.1,  # 湿地 - 低敏感
+    8: 0.3   # 园地 - 中等敏感
+}
+
+# 土地退化敏感性权重
+DEGRADATION_SENSITIVITY = {
+    1: 0.4,  # 耕地 - 中等退化风险
+    2: 0.1,  # 林地 - 低退化风险
+    3: 0.2,  # 草地 - 低退化风险
+    4: 0.0,  # 水域 - 无退化
+    5: 0.9,  # 建设用地 - 高退化
+    6: 1.0,  # 未利用地 - 极高退化
+    7: 0.3,  # 湿地 - 中等退化风险
+    8: 0.4   # 园地 - 中等退化风险
+}
+
+# 与分类ID 1-8 对齐的只读权重向量，模块加载时构建一次
+_EROSION_W = np.array([EROSION_SENSITIVITY[c] for c in range(1, 9)], dtype=np.float64)
+_EROSION_W.flags.writeable = False
+_DEGRADATION_W = np.array([DEGRADATION_SENSITIVITY[c] for c in range(1, 9)], dtype=np.float64)
+_DEGRADATION_W.flags.writeable = False
+
+
 
 class LandUseAnalyzer:
     """土地利用分析器"""
@@ -36,6 +100,14 @@ class LandUseAnalyzer:
         self.landuse_data = None
         self.geotransform = None
         self.projection = None
+        # 各分类像素计数（按分类ID索引）和有效像素总数，加载时一次遍历得到
+        self._counts = None
+        self._valid_pixels = 0
+        # 有效像素掩膜缓存，以及有效区域连通斑块标记结果缓存 (标记数组, 斑块数)，破碎度与内聚力计算共用
+        self._valid_mask = None
+        self._valid_labels = None
+        # 各分类斑块数缓存（按分类ID索引）
+        self._class_patches = None
         
         # 土地利用分类定义
         self.landuse_classes = {
@@ -48,11 +120,37 @@ class LandUseAnalyzer:
             7: {'name': '湿地', 'color': '#00FFFF', 'fragility': 0.5},
             8: {'name': '园地', 'color': '#32CD32', 'fragility': 0.2}
         }
+        
+        # 分类ID及与之对齐的权重向量，加权指数直接由分类计数做向量运算；
+        # 侵蚀与退化权重为模块级只读常量，脆弱度随实例的分类定义而定
+        self._class_ids = np.array(list(self.landuse_classes), dtype=np.intp)
+        self._fragility_w = np.array(
+            [self.landuse_classes[c]['fragility'] for c in self._class_ids], dtype=np.float64
+        )
+        self._erosion_w = _EROSION_W
+        self._degradation_w = _DEGRADATION_W
     
-    def load_landuse_data(self):
-        """加载土地利用数据"""
+    def load_landuse_data(self, read_data=True):
+        """
+        加载土地利用数据
+        
+        按波段自然块高度的整行条带读取，读取的同时累积分类计数直方图
+        
+        Args:
+            read_data: 是否保留整幅分类数组；只需要面积类统计（不计算破碎度、内聚力和可视化）时
+                可设为False，此时只用一个条带缓冲区，内存占用与影像大小无关
+        """
         try:
-            self.dataset = gdal.Open(self.landuse_path, gdal.GA_ReadOnly)
+            # 一次条带读取跨越多个压缩块时，由GTiff驱动在多个线程中并行解码；
+            # 打开时不列举所在目录（仅对本次打开、当前线程生效），.aux.xml/.ovr等附属文件仍按文件名探测
+            gdal.SetThreadLocalConfigOption('GDAL_DISABLE_READDIR_ON_OPEN', 'TRUE')
+            try:
+                self.dataset = gdal.OpenEx(
+                    self.landuse_path, gdal.OF_RASTER | gdal.OF_READONLY,
+                    open_options=['NUM_THREADS=ALL_CPUS']
+                )
+            finally:
+                gdal.SetThreadLocalConfigOption('GDAL_DISABLE_READDIR_ON_OPEN', None)
             if self.dataset is None:
                 raise ValueError(f"无法打开土地利用文件: {self.landuse_path}")
             
@@ -64,14 +162,59 @@ class LandUseAnalyzer:
             self.width = self.dataset.RasterXSize
             self.height = self.dataset.RasterYSize
             
-            # 读取土地利用数据
             band = self.dataset.GetRasterBand(1)
-            self.landuse_data = band.ReadAsArray().astype(np.int32)
-            
-            # 获取无效值
             self.no_data_value = band.GetNoDataValue()
-            if self.no_data_value is not None:
-                self.landuse_data[self.landuse_data == self.no_data_value] = -9999
+            
+            # 条带高度取自然块高度，整行读取时每个块只解码一次
+            _, block_rows = band.GetBlockSize()
+            block_rows = max(1, min(block_rows, self.height))
+            # 分类数组为uint8（每像素1字节）；原始值先读入int32条带缓冲区再转换
+            # 保留整幅数组时，有效像素掩膜也在条带仍在缓存中时顺带生成，之后不再单独遍历整幅数组
+            if read_data:
+                self.landuse_data = np.empty((self.height, self.width), dtype=np.uint8)
+                valid_mask = np.empty((self.height, self.width), dtype=bool)
+            else:
+                valid_mask = None
+                self.landuse_data = None
+                class_buffer = np.empty((block_rows, self.width), dtype=np.uint8)
+            raw_buffer = np.empty((block_rows, self.width), dtype=np.int32)
+            has_nodata = self.no_data_value is not None
+            nodata = float(self.no_data_value) if has_nodata else 0.0
+            
+            counts = np.zeros(CLASS_BINS, dtype=np.int64)
+            # 未压缩的GeoTIFF通过内存映射直接读取文件内容，不经过GDAL块缓存，也不额外复制
+            direct_read = (
+                self.dataset.GetDriver().ShortName == 'GTiff'
+                and self.dataset.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE') is None
+            )
+            if direct_read:
+                gdal.SetThreadLocalConfigOption('GTIFF_VIRTUAL_MEM_IO', 'YES')
+            try:
+                for row in range(0, self.height, block_rows):
+                    rows = min(block_rows, self.height - row)
+                    raw = raw_buffer[:rows]
+                    band.ReadAsArray(0, row, self.width, rows, buf_obj=raw)
+                    if read_data:
+                        strip = self.landuse_data[row:row + rows]
+                    else:
+                        strip = class_buffer[:rows]
+                    
+                    # 值域限制、无效值替换、类型转换和分类计数融合为一次遍历；
+                    # 之后各面积类指数均由分类计数向量运算得到，不再访问整幅数组
+                    clip_classes(raw, nodata, has_nodata, NODATA_CLASS, strip, counts)
+                    if read_data:
+                        np.not_equal(strip, NODATA_CLASS, out=valid_mask[row:row + rows])
+            finally:
+                if direct_read:
+                    gdal.SetThreadLocalConfigOption('GTIFF_VIRTUAL_MEM_IO', None)
+            
+            # 无效值箱不计入分类计数
+            counts[NODATA_CLASS] = 0
+            self._counts = counts
+            self._valid_pixels = int(counts.sum())
+            self._valid_mask = valid_mask
+            self._valid_labels = None
+            self._class_patches = None
             
             logger.info(f"成功加载土地利用数据: {self.landuse_path}")
             logger.info(f"数据尺寸: {self.width} x {self.height}")
@@ -84,12 +227,12 @@ class LandUseAnalyzer:
     def get_landuse_statistics(self):
         """获取土地利用统计信息"""
         try:
-            if self.landuse_data is None:
+            if self._counts is None:
                 raise ValueError("土地利用数据未加载")
             
             # 计算各类面积
-            total_pixels = self.landuse_data.size
-            valid_pixels = np.sum(self.landuse_data != -9999)
+            total_pixels = self.width * self.height
+            valid_pixels = self._valid_pixels
             
             # 获取像素面积（平方米）
             pixel_width = abs(self.geotransform[1])
@@ -99,9 +242,10 @@ class LandUseAnalyzer:
             # 统计各类面积
             class_stats = {}
             for class_id, class_info in self.landuse_classes.items():
-                class_pixels = np.sum(self.landuse_data == class_id)
+                class_pixels = int(self._counts[class_id])
                 class_area = class_pixels * pixel_area / 1000000  # 转换为平方公里
-                class_ratio = class_pixels / valid_pixels * 100
+                # 全部为无效值时比例记为0
+                class_ratio = class_pixels / valid_pixels * 100 if valid_pixels > 0 else 0.0
                 
                 class_stats[class_id] = {
                     'name': class_info['name'],
@@ -126,6 +270,88 @@ class LandUseAnalyzer:
             logger.error(f"计算土地利用统计信息失败: {e}")
             return None
     
+    def _get_valid_mask(self):
+        """有效像素掩膜（结果缓存，只计算一次）"""
+        if self._valid_mask is None:
+            self._valid_mask = self.landuse_data != NODATA_CLASS
+        return self._valid_mask
+    
+    def _prepare(self, concurrent_task=None):
+        """
+        一次性准备各指数共用的中间结果：有效像素掩膜和两种连通斑块标记
+        
+        两次标记是仅有的整幅数组遍历，在工作线程中并行执行
+        
+        Args:
+            concurrent_task: 可选，标记进行期间在当前线程执行的无参函数（如绘制可视化）
+        """
+        if self.landuse_data is None:
+            if concurrent_task is not None:
+                concurrent_task()
+            return
+        self._get_valid_mask()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            labeling = [
+                executor.submit(self._label_valid_patches),
+                executor.submit(self._count_class_patches),
+            ]
+            if concurrent_task is not None:
+                concurrent_task()
+            for future in labeling:
+                future.result()
+    
+    def _label_valid_patches(self):
+        """
+        标记有效区域的连通斑块（结果缓存，只计算一次）
+        
+        Returns:
+            tuple: (标记数组, 斑块数)
+        """
+        if self._valid_labels is None:
+            valid_mask = self._get_valid_mask()
+            if cc3d is not None:
+                self._valid_labels = cc3d.connected_components(
+                    valid_mask, connectivity=4, return_N=True
+                )
+            else:
+                self._valid_labels = ndimage.label(valid_mask)
+        return self._valid_labels
+    
+    def _count_class_patches(self):
+        """
+        统计各分类的连通斑块数（结果缓存，只计算一次）
+        
+        安装Numba时一次扫描完成全部分类；否则安装cc3d时一次多标签标记后按斑块所属分类计数；
+        都没有时对存在的分类在其外接矩形内逐类标记
+        
+        Returns:
+            ndarray: 按分类ID索引的斑块数
+        """
+        if self._class_patches is None:
+            if count_class_patches is not None:
+                patches = count_class_patches(self.landuse_data, NODATA_CLASS, CLASS_BINS)
+            elif cc3d is not None:
+                # cc3d对不同取值分别求连通域，0为背景
+                classes = np.where(self._get_valid_mask(), self.landuse_data, 0)
+                labeled, num_patches = cc3d.connected_components(
+                    classes, connectivity=4, return_N=True
+                )
+                patch_class = np.zeros(num_patches + 1, dtype=np.intp)
+                patch_class[labeled.ravel()] = classes.ravel()
+                patches = np.bincount(patch_class[1:], minlength=CLASS_BINS)
+            else:
+                # 一次遍历得到各分类的外接矩形，逐类比较和标记只在其外接矩形内进行
+                patches = np.zeros(CLASS_BINS, dtype=np.int64)
+                bounding_boxes = ndimage.find_objects(
+                    self.landuse_data, max_label=int(self._class_ids.max())
+                )
+                for class_id in self.landuse_classes:
+                    box = bounding_boxes[class_id - 1]
+                    if box is not None:
+                        patches[class_id] = ndimage.label(self.landuse_data[box] == class_id)[1]
+            self._class_patches = patches
+        return self._class_patches
+    
     def calculate_fragmentation_index(self):
         """
         计算破碎度指数
@@ -135,31 +361,28 @@ class LandUseAnalyzer:
             if self.landuse_data is None:
                 raise ValueError("土地利用数据未加载")
             
-            # 创建有效数据掩膜
-            valid_mask = self.landuse_data != -9999
-            
             # 计算斑块数量
-            labeled_array, num_features = ndimage.label(valid_mask)
+            labeled_array, num_features = self._label_valid_patches()
             
             # 计算总面积
-            total_area = np.sum(valid_mask)
+            total_area = self._valid_pixels
             
-            # 计算破碎度指数
+            # 计算破碎度指数：整体面积比为1，(n - 1) / (n - 1 + sqrt(A / A)) 即 (n - 1) / n
             if total_area > 0:
-                fragmentation_index = (num_features - 1) / (num_features - 1 + np.sqrt(total_area / total_area))
+                fragmentation_index = (num_features - 1) / num_features
             else:
                 fragmentation_index = 0
             
             # 按土地利用类型计算破碎度
             class_fragmentation = {}
+            class_patches = self._count_class_patches()
             for class_id, class_info in self.landuse_classes.items():
-                class_mask = self.landuse_data == class_id
-                if np.sum(class_mask) > 0:
-                    labeled_class, num_patches = ndimage.label(class_mask)
-                    class_area = np.sum(class_mask)
+                class_area = int(self._counts[class_id])
+                if class_area > 0:
+                    num_patches = int(class_patches[class_id])
                     
                     if num_patches > 1:
-                        class_fi = (num_patches - 1) / (num_patches - 1 + np.sqrt(class_area / total_area))
+                        class_fi = (num_patches - 1) / (num_patches - 1 + math.sqrt(class_area / total_area))
                     else:
                         class_fi = 0
                     
@@ -190,28 +413,21 @@ class LandUseAnalyzer:
             if self.landuse_data is None:
                 raise ValueError("土地利用数据未加载")
             
-            # 创建有效数据掩膜
-            valid_mask = self.landuse_data != -9999
-            
             # 计算斑块面积
-            labeled_array, num_features = ndimage.label(valid_mask)
+            labeled_array, num_features = self._label_valid_patches()
             
             if num_features == 0:
                 return {'cohesion_index': 0.0}
             
-            # 计算每个斑块的面积
-            patch_areas = []
-            for i in range(1, num_features + 1):
-                patch_area = np.sum(labeled_array == i)
-                patch_areas.append(patch_area)
-            
-            patch_areas = np.array(patch_areas)
-            total_area = np.sum(patch_areas)
+            # 一次遍历计算每个斑块的面积（0号为背景）
+            patch_areas = np.bincount(labeled_array.ravel(), minlength=num_features + 1)[1:]
+            # 斑块面积之和即有效像素数，直接取加载时的计数
+            total_area = self._valid_pixels
             
             # 计算内聚力指数
             if total_area > 0:
-                # 简化的内聚力计算
-                cohesion_index = (1 - np.sum(patch_areas / np.sqrt(patch_areas * total_area))) * 100
+                # 简化的内聚力计算：Σ a_i / sqrt(a_i * A) = Σ sqrt(a_i) / sqrt(A)，只需一次开方遍历
+                cohesion_index = (1 - np.sqrt(patch_areas).sum() / math.sqrt(total_area)) * 100
                 cohesion_index = max(0, min(100, cohesion_index))  # 限制在[0, 100]范围
             else:
                 cohesion_index = 0
@@ -233,49 +449,38 @@ class LandUseAnalyzer:
         反映土地利用类型的多样性
         """
         try:
-            if self.landuse_data is None:
+            if self._counts is None:
                 raise ValueError("土地利用数据未加载")
             
-            # 统计各类面积
-            class_counts = {}
-            valid_pixels = 0
-            
-            for class_id in self.landuse_classes.keys():
-                count = np.sum(self.landuse_data == class_id)
-                if count > 0:
-                    class_counts[class_id] = count
-                    valid_pixels += count
+            # 出现的分类及其面积比例（按分类ID对齐的向量）
+            areas = self._counts[self._class_ids]
+            present = areas > 0
+            class_ids = self._class_ids[present]
+            areas = areas[present]
+            valid_pixels = int(areas.sum())
             
             if valid_pixels == 0:
                 return {'shannon_diversity': 0.0, 'simpson_diversity': 0.0}
             
-            # 计算Shannon多样性指数
-            shannon_diversity = 0.0
-            simpson_diversity = 0.0
-            
-            for class_id, count in class_counts.items():
-                pi = count / valid_pixels
-                if pi > 0:
-                    shannon_diversity -= pi * np.log(pi)
-                    simpson_diversity += pi * pi
-            
-            # Simpson多样性指数
-            simpson_diversity = 1 - simpson_diversity
+            # Shannon与Simpson多样性指数：各为一次向量归约
+            proportions = areas / valid_pixels
+            shannon_diversity = float(-(proportions * np.log(proportions)).sum())
+            simpson_diversity = 1 - float((proportions * proportions).sum())
             
             # 计算Pielou均匀度指数
-            max_shannon = np.log(len(class_counts))
+            max_shannon = math.log(class_ids.size)
             if max_shannon > 0:
                 pielou_evenness = shannon_diversity / max_shannon
             else:
                 pielou_evenness = 0
             
             return {
-                'shannon_diversity': float(shannon_diversity),
-                'simpson_diversity': float(simpson_diversity),
+                'shannon_diversity': shannon_diversity,
+                'simpson_diversity': simpson_diversity,
                 'pielou_evenness': float(pielou_evenness),
-                'class_count': len(class_counts),
-                'total_pixels': int(valid_pixels),
-                'class_proportions': {str(k): float(v/valid_pixels) for k, v in class_counts.items()}
+                'class_count': int(class_ids.size),
+                'total_pixels': valid_pixels,
+                'class_proportions': {str(k): float(p) for k, p in zip(class_ids, proportions)}
             }
             
         except Exception as e:
@@ -288,44 +493,35 @@ class LandUseAnalyzer:
         反映生态系统对环境变化的敏感程度
         """
         try:
-            if self.landuse_data is None:
+            if self._counts is None:
                 raise ValueError("土地利用数据未加载")
             
-            # 统计各类面积
-            class_areas = {}
-            total_valid_area = 0
-            
-            for class_id, class_info in self.landuse_classes.items():
-                area = np.sum(self.landuse_data == class_id)
-                if area > 0:
-                    class_areas[class_id] = {
-                        'area': area,
-                        'fragility': class_info['fragility']
-                    }
-                    total_valid_area += area
-            
+            # 各类面积与脆弱度权重均为按分类ID对齐的向量
+            areas = self._counts[self._class_ids]
+            total_valid_area = int(areas.sum())
             if total_valid_area == 0:
                 return {'fragility_index': 0.0}
             
-            # 计算脆弱度指数
-            fragility_index = 0.0
-            class_fragility = {}
+            proportions = areas / total_valid_area
+            contributions = proportions * self._fragility_w
             
-            for class_id, info in class_areas.items():
-                pi = info['area'] / total_valid_area
-                fragility_index += pi * info['fragility']
-                
-                class_fragility[class_id] = {
+            class_fragility = {
+                int(class_id): {
                     'name': self.landuse_classes[class_id]['name'],
-                    'area': int(info['area']),
+                    'area': int(area),
                     'proportion': float(pi),
-                    'fragility': float(info['fragility']),
-                    'contribution': float(pi * info['fragility'])
+                    'fragility': float(weight),
+                    'contribution': float(contribution)
                 }
+                for class_id, area, pi, weight, contribution in zip(
+                    self._class_ids, areas, proportions, self._fragility_w, contributions
+                )
+                if area > 0
+            }
             
             return {
-                'fragility_index': float(fragility_index),
-                'total_area': int(total_valid_area),
+                'fragility_index': float(contributions.sum()),
+                'total_area': total_valid_area,
                 'class_fragility': class_fragility
             }
             
@@ -343,49 +539,33 @@ class LandUseAnalyzer:
             rainfall_path: 降雨数据路径（可选）
         """
         try:
-            if self.landuse_data is None:
+            if self._counts is None:
                 raise ValueError("土地利用数据未加载")
             
-            # 简化的土壤侵蚀指数计算
-            # 基于土地利用类型的侵蚀敏感性
-            
-            erosion_sensitivity = {
-                1: 0.3,  # 耕地 - 中等敏感
-                2: 0.1,  # 林地 - 低敏感
-                3: 0.2,  # 草地 - 低敏感
-                4: 0.0,  # 水域 - 无侵蚀
-                5: 0.8,  # 建设用地 - 高敏感
-                6: 0.9,  # 未利用地 - 极高敏感
-                7: 0.1,  # 湿地 - 低敏感
-                8: 0.3   # 园地 - 中等敏感
-            }
-            
-            # 计算侵蚀指数
-            total_area = 0
-            erosion_sum = 0
-            class_erosion = {}
-            
-            for class_id, sensitivity in erosion_sensitivity.items():
-                area = np.sum(self.landuse_data == class_id)
-                if area > 0:
-                    total_area += area
-                    erosion_sum += area * sensitivity
-                    
-                    class_erosion[class_id] = {
-                        'name': self.landuse_classes[class_id]['name'],
-                        'area': int(area),
-                        'sensitivity': float(sensitivity),
-                        'erosion_contribution': float(area * sensitivity)
-                    }
-            
+            # 简化的土壤侵蚀指数计算：各类面积按侵蚀敏感性加权平均
+            areas = self._counts[self._class_ids]
+            total_area = int(areas.sum())
             if total_area == 0:
                 return {'soil_erosion_index': 0.0}
             
-            soil_erosion_index = erosion_sum / total_area
+            contributions = areas * self._erosion_w
+            
+            class_erosion = {
+                int(class_id): {
+                    'name': self.landuse_classes[class_id]['name'],
+                    'area': int(area),
+                    'sensitivity': float(sensitivity),
+                    'erosion_contribution': float(contribution)
+                }
+                for class_id, area, sensitivity, contribution in zip(
+                    self._class_ids, areas, self._erosion_w, contributions
+                )
+                if area > 0
+            }
             
             return {
-                'soil_erosion_index': float(soil_erosion_index),
-                'total_area': int(total_area),
+                'soil_erosion_index': float(contributions.sum() / total_area),
+                'total_area': total_area,
                 'class_erosion': class_erosion
             }
             
@@ -396,17 +576,14 @@ class LandUseAnalyzer:
     def calculate_unused_land_ratio(self):
         """计算未利用地面积比例"""
         try:
-            if self.landuse_data is None:
+            if self._counts is None:
                 raise ValueError("土地利用数据未加载")
             
             # 未利用地类别ID
             unused_land_classes = [6]  # 未利用地
             
-            total_valid_area = np.sum(self.landuse_data != -9999)
-            unused_area = 0
-            
-            for class_id in unused_land_classes:
-                unused_area += np.sum(self.landuse_data == class_id)
+            total_valid_area = self._valid_pixels
+            unused_area = int(self._counts[unused_land_classes].sum())
             
             if total_valid_area == 0:
                 return {'unused_land_ratio': 0.0}
@@ -426,7 +603,7 @@ class LandUseAnalyzer:
     def calculate_development_ratio(self):
         """计算耕地、建设用地面积比例"""
         try:
-            if self.landuse_data is None:
+            if self._counts is None:
                 raise ValueError("土地利用数据未加载")
             
             # 开发用地类别
@@ -435,12 +612,12 @@ class LandUseAnalyzer:
                 5: '建设用地'
             }
             
-            total_valid_area = np.sum(self.landuse_data != -9999)
+            total_valid_area = self._valid_pixels
             development_area = 0
             class_development = {}
             
             for class_id, class_name in development_classes.items():
-                area = np.sum(self.landuse_data == class_id)
+                area = int(self._counts[class_id])
                 if area > 0:
                     development_area += area
                     class_development[class_id] = {
@@ -468,46 +645,33 @@ class LandUseAnalyzer:
     def calculate_land_degradation_index(self):
         """计算土地退化指数"""
         try:
-            if self.landuse_data is None:
+            if self._counts is None:
                 raise ValueError("土地利用数据未加载")
             
-            # 土地退化敏感性权重
-            degradation_sensitivity = {
-                1: 0.4,  # 耕地 - 中等退化风险
-                2: 0.1,  # 林地 - 低退化风险
-                3: 0.2,  # 草地 - 低退化风险
-                4: 0.0,  # 水域 - 无退化
-                5: 0.9,  # 建设用地 - 高退化
-                6: 1.0,  # 未利用地 - 极高退化
-                7: 0.3,  # 湿地 - 中等退化风险
-                8: 0.4   # 园地 - 中等退化风险
-            }
-            
-            total_area = 0
-            degradation_sum = 0
-            class_degradation = {}
-            
-            for class_id, sensitivity in degradation_sensitivity.items():
-                area = np.sum(self.landuse_data == class_id)
-                if area > 0:
-                    total_area += area
-                    degradation_sum += area * sensitivity
-                    
-                    class_degradation[class_id] = {
-                        'name': self.landuse_classes[class_id]['name'],
-                        'area': int(area),
-                        'sensitivity': float(sensitivity),
-                        'degradation_contribution': float(area * sensitivity)
-                    }
-            
+            # 各类面积按土地退化敏感性加权平均
+            areas = self._counts[self._class_ids]
+            total_area = int(areas.sum())
             if total_area == 0:
                 return {'land_degradation_index': 0.0}
             
-            land_degradation_index = degradation_sum / total_area
+            contributions = areas * self._degradation_w
+            
+            class_degradation = {
+                int(class_id): {
+                    'name': self.landuse_classes[class_id]['name'],
+                    'area': int(area),
+                    'sensitivity': float(sensitivity),
+                    'degradation_contribution': float(contribution)
+                }
+                for class_id, area, sensitivity, contribution in zip(
+                    self._class_ids, areas, self._degradation_w, contributions
+                )
+                if area > 0
+            }
             
             return {
-                'land_degradation_index': float(land_degradation_index),
-                'total_area': int(total_area),
+                'land_degradation_index': float(contributions.sum() / total_area),
+                'total_area': total_area,
                 'class_degradation': class_degradation
             }
             
@@ -516,7 +680,15 @@ class LandUseAnalyzer:
             return None
     
     def create_landuse_visualization(self, output_path):
-        """创建土地利用可视化图片"""
+        """
+        创建土地利用可视化图片
+        
+        直接使用Agg画布绘制（不经过pyplot的全局状态和交互式后端），子图位置预先固定，
+        保存时不再为计算紧凑边界额外渲染一遍
+        
+        Args:
+            output_path: 输出图片路径
+        """
         try:
             if self.landuse_data is None:
                 raise ValueError("土地利用数据未加载")
@@ -524,9 +696,10 @@ class LandUseAnalyzer:
             # 创建输出目录
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             
-            # 准备数据
-            valid_data = self.landuse_data.copy()
-            valid_data[valid_data == -9999] = 0
+            # 准备数据：分类数据按整数步长最近邻抽样，不复制整幅数组
+            stride = max(1, -(-max(self.landuse_data.shape) // PREVIEW_MAX_SIZE))
+            preview = self.landuse_data[::stride, ::stride]
+            valid_data = np.where(preview == NODATA_CLASS, 0, preview)
             
             # 创建颜色映射
             colors_list = []
@@ -538,39 +711,41 @@ class LandUseAnalyzer:
             
             cmap = ListedColormap(colors_list)
             
-            # 创建图形
-            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
-            
-            # 主图：土地利用分布
-            im1 = ax1.imshow(valid_data, cmap=cmap, vmin=1, vmax=len(self.landuse_classes))
-            ax1.set_title('土地利用分布图')
-            ax1.axis('off')
-            
-            # 添加图例
-            legend_elements = [patches.Patch(color=class_info['color'], label=f"{class_id}: {class_info['name']}")
-                             for class_id, class_info in self.landuse_classes.items()]
-            ax1.legend(handles=legend_elements, loc='upper right', bbox_to_anchor=(1.15, 1))
-            
-            # 子图：面积比例饼图
-            stats = self.get_landuse_statistics()
-            if stats:
-                areas = []
-                labels_pie = []
-                colors_pie = []
+            with plt.rc_context(_PLOT_RC):
+                # 创建图形：子图位置预先固定，两图之间留出图例空间
+                fig = Figure(figsize=(16, 8))
+                FigureCanvasAgg(fig)
+                ax1, ax2 = fig.subplots(1, 2)
+                fig.subplots_adjust(left=0.02, right=0.98, bottom=0.04, top=0.94, wspace=0.3)
                 
-                for class_id, class_info in self.landuse_classes.items():
-                    if class_id in stats['classes']:
-                        areas.append(stats['classes'][class_id]['area_km2'])
-                        labels_pie.append(f"{class_info['name']}\n({stats['classes'][class_id]['ratio_percent']:.1f}%)")
-                        colors_pie.append(class_info['color'])
+                # 主图：土地利用分布
+                ax1.imshow(valid_data, cmap=cmap, vmin=1, vmax=len(self.landuse_classes))
+                ax1.set_title('土地利用分布图')
+                ax1.axis('off')
                 
-                if areas:
-                    ax2.pie(areas, labels=labels_pie, colors=colors_pie, autopct='%1.1f%%', startangle=90)
-                    ax2.set_title('土地利用面积比例')
-            
-            plt.tight_layout()
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            plt.close()
+                # 添加图例
+                legend_elements = [patches.Patch(color=class_info['color'], label=f"{class_id}: {class_info['name']}")
+                                 for class_id, class_info in self.landuse_classes.items()]
+                ax1.legend(handles=legend_elements, loc='upper right', bbox_to_anchor=(1.15, 1))
+                
+                # 子图：面积比例饼图
+                stats = self.get_landuse_statistics()
+                if stats:
+                    areas = []
+                    labels_pie = []
+                    colors_pie = []
+                    
+                    for class_id, class_info in self.landuse_classes.items():
+                        if class_id in stats['classes']:
+                            areas.append(stats['classes'][class_id]['area_km2'])
+                            labels_pie.append(f"{class_info['name']}\n({stats['classes'][class_id]['ratio_percent']:.1f}%)")
+                            colors_pie.append(class_info['color'])
+                    
+                    if areas:
+                        ax2.pie(areas, labels=labels_pie, colors=colors_pie, autopct='%1.1f%%', startangle=90)
+                        ax2.set_title('土地利用面积比例')
+                
+                fig.savefig(output_path, dpi=VISUALIZATION_DPI)
             
             logger.info(f"土地利用可视化图片已保存到: {output_path}")
             return True
@@ -588,6 +763,11 @@ class LandUseAnalyzer:
             # 计算各种指数
             results = {}
             
+            # 共用的掩膜和斑块标记只计算一次，期间在当前线程绘制可视化；
+            # 面积类指数只依赖加载时的分类计数
+            vis_path = os.path.join(output_dir, 'land_use_visualization.png')
+            self._prepare(lambda: self.create_landuse_visualization(vis_path))
+            
             # 基础统计
             landuse_stats = self.get_landuse_statistics()
             if landuse_stats:
@@ -629,12 +809,15 @@ class LandUseAnalyzer:
             
             # 保存结果
             results_path = os.path.join(output_dir, 'land_use_analysis_results.json')
-            with open(results_path, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False, default=str)
-            
-            # 创建可视化
-            vis_path = os.path.join(output_dir, 'land_use_visualization.png')
-            self.create_landuse_visualization(vis_path)
+            if orjson is not None:
+                with open(results_path, 'wb') as f:
+                    f.write(orjson.dumps(
+                        results,
+                        option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+                    ))
+            else:
+                with open(results_path, 'w', encoding='utf-8') as f:
+                    json.dump(results, f, indent=2, ensure_ascii=False, default=str)
             
             logger.info(f"所有指数计算完成，结果保存在: {output_dir}")
             return results
@@ -645,6 +828,9 @@ class LandUseAnalyzer:
     
     def close(self):
         """关闭数据集"""
+        self._valid_mask = None
+        self._valid_labels = None
+        self._class_patches = None
         if self.dataset is not None:
             self.dataset = None
             logger.info("数据集已关闭")
@@ -684,7 +870,7 @@ if __name__ == "__main__":
     import sys
     
     if len(sys.argv) != 3:
-        print("用法: python gdal_land_use_analysis.py <landuse_raster> <output_dir>")
+        print("用法: python -m environment.gdal_land_use_analysis <landuse_raster> <output_dir>")
         sys.exit(1)
     
     landuse_path = sys.argv[1]
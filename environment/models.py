@@ -33,8 +33,9 @@ class RemoteSensingImage(models.Model):
     file_size = models.BigIntegerField(blank=True, null=True, verbose_name='文件大小(字节)')
     
     # 状态
-    is_processed = models.BooleanField(default=False, verbose_name='是否已处理')
-    processing_status = models.CharField(max_length=20, default='pending', verbose_name='处理状态')
+    is_processed = models.BooleanField(default=False, db_index=True, verbose_name='是否已处理')
+    processing_status = models.CharField(max_length=20, default='pending', db_index=True, verbose_name='处理状态')
+    supports_memmap = models.BooleanField(default=False, verbose_name='支持内存映射读取')
     
     # 用户信息
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='上传用户')
@@ -44,6 +45,10 @@ class RemoteSensingImage(models.Model):
         verbose_name_plural = '遥感影像'
         db_table = 'remote_sensing_images'
         ordering = ['-acquisition_date']
+        indexes = [
+            # 普通用户按上传用户过滤并按获取日期倒序排列
+            models.Index(fields=['uploaded_by', '-acquisition_date']),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.acquisition_date})"
@@ -62,10 +67,12 @@ class EcologicalIndex(models.Model):
         ('heat', '热度指数'),
         ('greenness', '绿度指数'),
     ]
+    # 指数类型 -> 显示名称
+    INDEX_TYPE_MAP = dict(INDEX_TYPE_CHOICES)
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     remote_sensing_image = models.ForeignKey(RemoteSensingImage, on_delete=models.CASCADE, verbose_name='遥感影像')
-    index_type = models.CharField(max_length=20, choices=INDEX_TYPE_CHOICES, verbose_name='指数类型')
+    index_type = models.CharField(max_length=20, choices=INDEX_TYPE_CHOICES, db_index=True, verbose_name='指数类型')
     
     # 计算结果
     result_file = models.FileField(upload_to='ecological_indices/', verbose_name='结果文件')
@@ -113,17 +120,11 @@ class RSEIResult(models.Model):
     # RSEI结果
     rsei_result = models.ForeignKey(EcologicalIndex, on_delete=models.CASCADE, related_name='rsei_final', verbose_name='RSEI结果')
     
-    # 主成分分析结果
-    pc1_variance = models.FloatField(verbose_name='第一主成分方差贡献率')
-    pc2_variance = models.FloatField(verbose_name='第二主成分方差贡献率')
-    pc3_variance = models.FloatField(verbose_name='第三主成分方差贡献率')
-    pc4_variance = models.FloatField(verbose_name='第四主成分方差贡献率')
+    # 主成分分析结果：第一至第四主成分方差贡献率
+    pca_variance = models.JSONField(verbose_name='主成分方差贡献率')
     
-    # 权重
-    greenness_weight = models.FloatField(verbose_name='绿度权重')
-    wetness_weight = models.FloatField(verbose_name='湿度权重')
-    dryness_weight = models.FloatField(verbose_name='干度权重')
-    heat_weight = models.FloatField(verbose_name='热度权重')
+    # 权重：按绿度、湿度、干度、热度顺序
+    pca_weights = models.JSONField(verbose_name='分量权重')
     
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     
@@ -149,7 +150,8 @@ class ProcessingTask(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     remote_sensing_image = models.ForeignKey(RemoteSensingImage, on_delete=models.CASCADE, verbose_name='遥感影像')
     task_type = models.CharField(max_length=50, verbose_name='任务类型')
-    status = models.CharField(max_length=20, choices=TASK_STATUS_CHOICES, default='pending', verbose_name='任务状态')
+    status = models.CharField(max_length=20, choices=TASK_STATUS_CHOICES, default='pending', db_index=True, verbose_name='任务状态')
+    celery_task_id = models.CharField(max_length=255, blank=True, null=True, db_index=True, verbose_name='Celery任务ID')
     
     # 进度信息
     progress = models.IntegerField(default=0, verbose_name='进度百分比')
@@ -168,6 +170,10 @@ class ProcessingTask(models.Model):
         verbose_name_plural = '处理任务'
         db_table = 'processing_tasks'
         ordering = ['-created_at']
+        indexes = [
+            # 启动计算任务前按影像、任务类型和状态查找进行中的任务
+            models.Index(fields=['remote_sensing_image', 'task_type', 'status']),
+        ]
     
     def __str__(self):
         return f"{self.task_type} - {self.remote_sensing_image.name} ({self.get_status_display()})" 
\ No newline at end of file
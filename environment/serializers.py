@@ -7,6 +7,9 @@ from .models import (
 )
 from users.serializers import UserSerializer
 
+# 允许上传的遥感影像文件后缀（小写）
+_ALLOWED_SUFFIXES = ('.tif', '.tiff', '.img', '.hdf', '.nc', '.zip')
+
 
 class RemoteSensingImageSerializer(serializers.ModelSerializer):
     """遥感影像序列化器"""
@@ -32,10 +35,28 @@ class RemoteSensingImageSerializer(serializers.ModelSerializer):
         return None
 
 
+class RemoteSensingImageListSerializer(RemoteSensingImageSerializer):
+    """
+    遥感影像列表序列化器（不含描述和文件路径，列表查询不读取这些列）
+    
+    file_size_mb取自查询集的file_size_mb注解
+    """
+    file_size_mb = serializers.FloatField(read_only=True)
+    
+    class Meta(RemoteSensingImageSerializer.Meta):
+        fields = [
+            'id', 'name', 'image_type',
+            'center_lat', 'center_lon', 'acquisition_date', 'processing_date',
+            'resolution', 'bands_count', 'file_size', 'file_size_mb',
+            'is_processed', 'processing_status', 'processing_status_display',
+            'uploaded_by'
+        ]
+
+
 class EcologicalIndexSerializer(serializers.ModelSerializer):
     """生态指数序列化器"""
     remote_sensing_image = RemoteSensingImageSerializer(read_only=True)
-    index_type_display = serializers.CharField(source='get_index_type_display', read_only=True)
+    index_type_display = serializers.SerializerMethodField()
     
     class Meta:
         model = EcologicalIndex
@@ -47,6 +68,10 @@ class EcologicalIndexSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+    
+    def get_index_type_display(self, obj):
+        """获取指数类型显示名称"""
+        return EcologicalIndex.INDEX_TYPE_MAP.get(obj.index_type, obj.index_type)
 
 
 class RSEIResultSerializer(serializers.ModelSerializer):
@@ -62,22 +87,21 @@ class RSEIResultSerializer(serializers.ModelSerializer):
         model = RSEIResult
         fields = [
             'id', 'remote_sensing_image', 'greenness', 'wetness', 'dryness', 'heat',
-            'rsei_result', 'pc1_variance', 'pc2_variance', 'pc3_variance', 'pc4_variance',
-            'greenness_weight', 'wetness_weight', 'dryness_weight', 'heat_weight',
-            'created_at'
+            'rsei_result', 'pca_variance', 'pca_weights', 'created_at'
         ]
         read_only_fields = ['id', 'created_at']
 
 
 class ProcessingTaskSerializer(serializers.ModelSerializer):
-    """处理任务序列化器"""
-    remote_sensing_image = RemoteSensingImageSerializer(read_only=True)
+    """处理任务序列化器（只返回影像ID和名称，不嵌套完整的影像信息）"""
+    remote_sensing_image_id = serializers.UUIDField(read_only=True)
+    remote_sensing_image_name = serializers.CharField(source='remote_sensing_image.name', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     
     class Meta:
         model = ProcessingTask
         fields = [
-            'id', 'remote_sensing_image', 'task_type', 'status', 'status_display',
+            'id', 'remote_sensing_image_id', 'remote_sensing_image_name', 'task_type', 'status', 'status_display',
             'celery_task_id', 'progress', 'current_step', 'error_message',
             'created_at', 'started_at', 'completed_at'
         ]
@@ -92,12 +116,9 @@ class RemoteSensingImageUploadSerializer(serializers.ModelSerializer):
     
     def validate_file_path(self, value):
         """验证文件格式"""
-        allowed_extensions = ['.tif', '.tiff', '.img', '.hdf', '.nc', '.zip']
-        file_extension = value.name.lower()
-        
-        if not any(file_extension.endswith(ext) for ext in allowed_extensions):
+        if not value.name.lower().endswith(_ALLOWED_SUFFIXES):
             raise serializers.ValidationError(
-                f"不支持的文件格式。支持的格式: {', '.join(allowed_extensions)}"
+                f"不支持的文件格式。支持的格式: {', '.join(_ALLOWED_SUFFIXES)}"
             )
         
         # 检查文件大小（50MB限制）
@@ -114,12 +135,14 @@ class EcologicalIndexCalculationSerializer(serializers.Serializer):
         child=serializers.ChoiceField(choices=EcologicalIndex.INDEX_TYPE_CHOICES),
         min_length=1
     )
+    overview_factor = serializers.IntegerField(
+        min_value=1, max_value=32, default=1,
+        help_text='降采样倍数，大于1时按降采样后的影像计算（用于预览和快速分析）'
+    )
     
     def validate_remote_sensing_image_id(self, value):
         """验证遥感影像是否存在"""
-        try:
-            RemoteSensingImage.objects.get(id=value)
-        except RemoteSensingImage.DoesNotExist:
+        if not RemoteSensingImage.objects.filter(id=value).exists():
             raise serializers.ValidationError("指定的遥感影像不存在")
         return value
 
@@ -127,12 +150,14 @@ class EcologicalIndexCalculationSerializer(serializers.Serializer):
 class RSEICalculationSerializer(serializers.Serializer):
     """RSEI计算请求序列化器"""
     remote_sensing_image_id = serializers.UUIDField()
+    overview_factor = serializers.IntegerField(
+        min_value=1, max_value=32, default=1,
+        help_text='降采样倍数，大于1时按降采样后的影像计算（用于预览和快速分析）'
+    )
     
     def validate_remote_sensing_image_id(self, value):
         """验证遥感影像是否存在"""
-        try:
-            RemoteSensingImage.objects.get(id=value)
-        except RemoteSensingImage.DoesNotExist:
+        if not RemoteSensingImage.objects.filter(id=value).exists():
             raise serializers.ValidationError("指定的遥感影像不存在")
         return value
 
@@ -1,8 +1,12 @@
 import os
 import time
 import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from celery import shared_task
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from django.core.files.base import ContentFile
 from .models import (
     RemoteSensingImage, 
@@ -10,140 +14,312 @@ from .models import (
     RSEIResult, 
     ProcessingTask
 )
-from .ecological_indices import EcologicalIndexCalculator
 
 logger = logging.getLogger(__name__)
 
+# 指数类型 -> EcologicalIndexCalculator中的计算方法名
+INDEX_METHODS = {
+    'ndvi': 'calculate_ndvi',
+    'ndwi': 'calculate_ndwi',
+    'ndbi': 'calculate_ndbi',
+    'ndsi': 'calculate_ndsi',
+    'wetness': 'calculate_wetness',
+    'dryness': 'calculate_dryness',
+    'heat': 'calculate_heat',
+    'greenness': 'calculate_greenness',
+}
+
+# 并行处理各指数（统计、保存、可视化）的线程数
+INDEX_WORKERS = 4
+
+# 视为进行中的处理任务状态
+ACTIVE_TASK_STATUSES = ('pending', 'processing')
+
+# 创建超过该时长仍处于进行中状态的任务视为已失效（worker被强制终止时任务记录不会再更新）
+ACTIVE_TASK_TIMEOUT = timedelta(hours=2)
+
+# 两次进度上报之间的最小时间间隔（秒）
+PROGRESS_MIN_INTERVAL = 5.0
+
+
+def get_local_image_path(image):
+    """
+    获取遥感影像的本地文件路径，每个任务只调用一次
+    
+    本地存储直接返回文件路径；远程存储（不支持path）时将文件一次性下载到
+    MEDIA_ROOT/temp下的临时文件，后续计算均读取该本地副本，临时文件由cleanup_temp_files清理
+    
+    Args:
+        image: RemoteSensingImage实例
+        
+    Returns:
+        str: 本地文件路径
+    """
+    try:
+        return image.file_path.path
+    except NotImplementedError:
+        import shutil
+        import tempfile
+        
+        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
+        os.makedirs(temp_dir, exist_ok=True)
+        suffix = os.path.splitext(image.file_path.name)[1]
+        with image.file_path.open('rb') as src, \
+                tempfile.NamedTemporaryFile(dir=temp_dir, suffix=suffix, delete=False) as dst:
+            shutil.copyfileobj(src, dst, length=1024 * 1024)
+        return dst.name
+
+
+class ProgressReporter:
+    """
+    节流的进度上报：进度每跨过10%或距上次上报超过PROGRESS_MIN_INTERVAL秒时，
+    才调用Celery的update_state并更新ProcessingTask的进度，减少消息代理和数据库往返
+    """
+    
+    def __init__(self, celery_task, task_id, total):
+        """
+        Args:
+            celery_task: 绑定的Celery任务（self）
+            task_id: ProcessingTask记录ID
+            total: 总步数
+        """
+        self.celery_task = celery_task
+        self.task_id = task_id
+        self.total = total
+        self._last_decile = None
+        self._last_time = 0.0
+    
+    def update(self, current, step, force=False):
+        """
+        上报进度
+        
+        Args:
+            current: 已完成步数
+            step: 当前步骤描述
+            force: 是否忽略节流立即上报
+        """
+        progress = int(current / self.total * 100) if self.total else 100
+        decile = progress // 10
+        now = time.monotonic()
+        if not force and decile == self._last_decile and now - self._last_time < PROGRESS_MIN_INTERVAL:
+            return
+        self._last_decile = decile
+        self._last_time = now
+        
+        self.celery_task.update_state(
+            state='PROGRESS',
+            meta={'current': current, 'total': self.total, 'status': step}
+        )
+        # 只更新两列，不触发完整save
+        ProcessingTask.objects.filter(id=self.task_id).update(progress=progress, current_step=step)
+
 
 @shared_task(bind=True)
-def calculate_ecological_indices(self, image_id, indices_list):
+def calculate_ecological_indices(self, image_id, indices_list, use_memmap=False, overview_factor=1):
     """
     计算生态指数的Celery任务
     
     Args:
         image_id: 遥感影像ID
         indices_list: 要计算的指数列表
+        use_memmap: 影像是否支持内存映射读取（RemoteSensingImage.supports_memmap）
+        overview_factor: 降采样倍数，大于1时按降采样后的影像计算，结果栅格分辨率相应降低
     """
     try:
-        # 获取遥感影像
-        image = RemoteSensingImage.objects.get(id=image_id)
-        
-        # 创建处理任务记录
-        task = ProcessingTask.objects.create(
-            remote_sensing_image=image,
-            task_type='ecological_index_calculation',
-            status='processing',
-            celery_task_id=self.request.id
-        )
+        # 延迟导入：rasterio/GDAL只在计算任务中加载，不影响清理等轻量任务的worker启动
+        from ._kernels import HAVE_NUMBA
+        from .ecological_indices import EcologicalIndexCalculator
+        
+        # 获取遥感影像并创建处理任务记录；锁定影像行，同一影像的并发任务在此串行判断，
+        # 已有未完成的同类任务时直接返回，避免重复计算
+        with transaction.atomic():
+            image = RemoteSensingImage.objects.select_for_update().get(id=image_id)
+            active_tasks = ProcessingTask.objects.filter(
+                remote_sensing_image=image,
+                task_type='ecological_index_calculation',
+                status__in=ACTIVE_TASK_STATUSES
+            )
+            # worker因OOM/SIGKILL退出时任务记录停留在进行中，超时的记录标记为失败，不再阻塞重新计算
+            active_tasks.filter(created_at__lt=timezone.now() - ACTIVE_TASK_TIMEOUT).update(
+                status='failed',
+                error_message='任务超时未完成，已标记为失败',
+                completed_at=timezone.now()
+            )
+            if active_tasks.exists():
+                logger.info(f"影像 {image_id} 已有进行中的生态指数计算任务，跳过")
+                return {
+                    'status': 'skipped',
+                    'message': '该影像已有进行中的生态指数计算任务'
+                }
+            
+            task = ProcessingTask.objects.create(
+                remote_sensing_image=image,
+                task_type='ecological_index_calculation',
+                status='processing',
+                celery_task_id=self.request.id
+            )
         
         # 更新任务进度
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 0, 'total': len(indices_list), 'status': '开始处理...'}
-        )
-        
-        # 初始化计算器
-        calculator = EcologicalIndexCalculator(image.file_path.path)
-        if not calculator.load_image():
-            raise Exception("无法加载遥感影像")
+        progress = ProgressReporter(self, task.id, len(indices_list))
+        progress.update(0, '开始处理...', force=True)
         
         # 创建输出目录
         output_dir = os.path.join(settings.MEDIA_ROOT, 'ecological_indices', str(image_id))
         os.makedirs(output_dir, exist_ok=True)
         
-        # 计算各指数
-        calculated_indices = {}
+        # 初始化计算器，先只打开数据集以判断影像大小
+        calculator = EcologicalIndexCalculator(get_local_image_path(image))
+        if not calculator.load_image(read_bands=False):
+            raise Exception("无法加载遥感影像")
         
-        for i, index_type in enumerate(indices_list):
-            try:
-                # 更新进度
-                progress = int((i / len(indices_list)) * 100)
-                self.update_state(
-                    state='PROGRESS',
-                    meta={
-                        'current': i + 1, 
-                        'total': len(indices_list), 
-                        'status': f'正在计算 {index_type}...'
-                    }
+        # 大影像且不需要RSEI（全图主成分分析）时，逐像素指数分块流式计算：
+        # 每个数据块只读取一次，结果文件和统计信息在同一遍中得到；降采样读取时影像已足够小，不需要分块
+        rsei_components = ['greenness', 'wetness', 'dryness', 'heat']
+        use_streaming = (
+            overview_factor == 1
+            and calculator.should_stream()
+            and not all(comp in indices_list for comp in rsei_components)
+        )
+        if use_streaming:
+            streaming_types = [
+                index_type for index_type in indices_list
+                if index_type in calculator.NORM_DIFF_BANDS
+                or index_type in calculator.TASSELED_CAP_COEFFICIENTS
+            ]
+            streamed_stats = calculator.run_streaming_indices(
+                streaming_types,
+                {
+                    index_type: os.path.join(output_dir, f"{index_type}_result.tif")
+                    for index_type in streaming_types
+                }
+            )
+            if streamed_stats is None:
+                raise Exception("分块计算生态指数失败")
+        else:
+            calculator.close()
+            if not calculator.load_image(use_memmap=use_memmap, overview_factor=overview_factor):
+                raise Exception("无法加载遥感影像")
+        
+        # 各指数的统计、结果保存（GDAL压缩编码）和可视化（PNG编码）均在C代码中释放GIL，
+        # 在线程池中并行执行；数据库记录先在内存中累积，全部完成后一次批量插入。
+        # 有Numba时统计和量化为并行内核，在当前线程中调用，避免多个线程同时启动并行内核，
+        # 线程池只负责GeoTIFF写出和PNG编码
+        calculated_indices = {}
+        pending_indices = []
+        
+        def summarize_index(index_type, index_data, stats):
+            """计算统计信息并生成可视化图片，返回 (统计信息, 图片)"""
+            if use_streaming:
+                # 结果文件和统计信息已在分块计算中得到，可视化使用降采样预览
+                result_path = os.path.join(output_dir, f"{index_type}_result.tif")
+                index_data = calculator.read_preview(result_path)
+            else:
+                stats = calculator.calculate_statistics(index_data)
+            return stats, calculator.render_visualization(index_data, index_type.upper())
+        
+        def save_index(index_type, index_data, stats, viz_image):
+            """保存结果文件和可视化图片，返回待保存的EcologicalIndex"""
+            result_filename = f"{index_type}_result.tif"
+            result_path = os.path.join(output_dir, result_filename)
+            
+            if not use_streaming:
+                # 保存结果文件
+                calculator.save_result(
+                    index_data, result_path, scaled=index_type in calculator.SCALED_INDEX_TYPES
                 )
+            
+            # 保存可视化
+            viz_filename = f"{index_type}_visualization.png"
+            viz_path = os.path.join(output_dir, viz_filename)
+            calculator.save_visualization(viz_image, viz_path)
+            
+            return EcologicalIndex(
+                remote_sensing_image=image,
+                index_type=index_type,
+                result_file=f'ecological_indices/{image_id}/{result_filename}',
+                visualization_file=f'ecological_indices/{image_id}/{viz_filename}',
+                min_value=stats['min_value'] if stats else None,
+                max_value=stats['max_value'] if stats else None,
+                mean_value=stats['mean_value'] if stats else None,
+                std_value=stats['std_value'] if stats else None,
+                excellent_area=stats['excellent_area'] if stats else None,
+                good_area=stats['good_area'] if stats else None,
+                moderate_area=stats['moderate_area'] if stats else None,
+                poor_area=stats['poor_area'] if stats else None,
+                bad_area=stats['bad_area'] if stats else None,
+            )
+        
+        def process_index(index_type, index_data, stats):
+            """统计、保存结果并生成可视化，返回待保存的EcologicalIndex"""
+            return save_index(index_type, index_data, *summarize_index(index_type, index_data, stats))
+        
+        def submit_index(executor, futures, index_type, index_data, stats):
+            """提交指数处理任务，有Numba时先在当前线程完成统计和可视化量化"""
+            if not HAVE_NUMBA:
+                futures[executor.submit(process_index, index_type, index_data, stats)] = index_type
+                return
+            try:
+                summary = summarize_index(index_type, index_data, stats)
+            except Exception as e:
+                logger.error(f"计算 {index_type} 时出错: {e}")
+                return
+            futures[executor.submit(save_index, index_type, index_data, *summary)] = index_type
+        
+        with ThreadPoolExecutor(max_workers=INDEX_WORKERS) as executor:
+            futures = {}
+            for index_type in indices_list:
+                if use_streaming:
+                    if index_type not in streamed_stats:
+                        logger.warning(f"不支持的指数类型: {index_type}")
+                        continue
+                    submit_index(executor, futures, index_type, None, streamed_stats[index_type])
+                    continue
                 
-                # 计算指数
-                if index_type == 'ndvi':
-                    index_data = calculator.calculate_ndvi()
-                elif index_type == 'ndwi':
-                    index_data = calculator.calculate_ndwi()
-                elif index_type == 'ndbi':
-                    index_data = calculator.calculate_ndbi()
-                elif index_type == 'ndsi':
-                    index_data = calculator.calculate_ndsi()
-                elif index_type == 'wetness':
-                    index_data = calculator.calculate_wetness()
-                elif index_type == 'dryness':
-                    index_data = calculator.calculate_dryness()
-                elif index_type == 'heat':
-                    index_data = calculator.calculate_heat()
-                elif index_type == 'greenness':
-                    index_data = calculator.calculate_greenness()
-                else:
+                # 逐像素指数共享计算器缓存，在当前线程中按顺序获取
+                if index_type not in INDEX_METHODS:
                     logger.warning(f"不支持的指数类型: {index_type}")
                     continue
-                
+                index_data = getattr(calculator, INDEX_METHODS[index_type])()
                 if index_data is None:
                     logger.warning(f"计算 {index_type} 失败")
                     continue
+                submit_index(executor, futures, index_type, index_data, None)
+            
+            for i, future in enumerate(as_completed(futures)):
+                index_type = futures[future]
                 
-                # 计算统计信息
-                stats = calculator.calculate_statistics(index_data)
-                
-                # 保存结果文件
-                result_filename = f"{index_type}_result.tif"
-                result_path = os.path.join(output_dir, result_filename)
-                calculator.save_result(index_data, result_path)
-                
-                # 创建可视化
-                viz_filename = f"{index_type}_visualization.png"
-                viz_path = os.path.join(output_dir, viz_filename)
-                calculator.create_visualization(index_data, index_type.upper(), viz_path)
+                # 更新进度
+                progress.update(i + 1, f'已完成 {index_type}')
                 
-                # 保存到数据库
-                ecological_index = EcologicalIndex.objects.create(
+                try:
+                    pending_indices.append(future.result())
+                    logger.info(f"成功计算 {index_type}")
+                except Exception as e:
+                    logger.error(f"计算 {index_type} 时出错: {e}")
+        
+        # 一次INSERT保存全部指数；同一影像同类指数已存在时先删除旧记录（重新计算的结果覆盖旧结果）
+        if pending_indices:
+            with transaction.atomic():
+                EcologicalIndex.objects.filter(
                     remote_sensing_image=image,
-                    index_type=index_type,
-                    result_file=f'ecological_indices/{image_id}/{result_filename}',
-                    visualization_file=f'ecological_indices/{image_id}/{viz_filename}',
-                    min_value=stats['min_value'] if stats else None,
-                    max_value=stats['max_value'] if stats else None,
-                    mean_value=stats['mean_value'] if stats else None,
-                    std_value=stats['std_value'] if stats else None,
-                    excellent_area=stats['excellent_area'] if stats else None,
-                    good_area=stats['good_area'] if stats else None,
-                    moderate_area=stats['moderate_area'] if stats else None,
-                    poor_area=stats['poor_area'] if stats else None,
-                    bad_area=stats['bad_area'] if stats else None,
-                )
-                
-                calculated_indices[index_type] = ecological_index
-                logger.info(f"成功计算 {index_type}")
-                
-            except Exception as e:
-                logger.error(f"计算 {index_type} 时出错: {e}")
-                continue
-        
-        # 如果计算了RSEI所需的四个分量，则计算RSEI
-        rsei_components = ['greenness', 'wetness', 'dryness', 'heat']
+                    index_type__in=[index.index_type for index in pending_indices]
+                ).delete()
+                EcologicalIndex.objects.bulk_create(pending_indices)
+            calculated_indices = {index.index_type: index for index in pending_indices}
+        
+        # 如果计算了RSEI所需的四个分量，则计算RSEI（数据库记录留到最后与状态更新一起写入）
+        rsei_index = None
+        rsei_record = None
         if all(comp in calculated_indices for comp in rsei_components):
             try:
-                self.update_state(
-                    state='PROGRESS',
-                    meta={'current': len(indices_list), 'total': len(indices_list) + 1, 'status': '正在计算RSEI...'}
-                )
+                progress.update(len(indices_list), '正在计算RSEI...', force=True)
                 
                 rsei_result = calculator.calculate_rsei()
                 if rsei_result:
                     # 保存RSEI结果
                     rsei_filename = "rsei_result.tif"
                     rsei_path = os.path.join(output_dir, rsei_filename)
-                    calculator.save_result(rsei_result['rsei'], rsei_path)
+                    calculator.save_result(rsei_result['rsei'], rsei_path, scaled=True)
                     
                     # 创建RSEI可视化
                     rsei_viz_filename = "rsei_visualization.png"
@@ -153,8 +329,8 @@ def calculate_ecological_indices(self, image_id, indices_list):
                     # 计算RSEI统计信息
                     rsei_stats = calculator.calculate_statistics(rsei_result['rsei'])
                     
-                    # 保存RSEI指数
-                    rsei_index = EcologicalIndex.objects.create(
+                    # 待保存的RSEI指数
+                    rsei_index = EcologicalIndex(
                         remote_sensing_image=image,
                         index_type='rsei',
                         result_file=f'ecological_indices/{image_id}/{rsei_filename}',
@@ -170,22 +346,16 @@ def calculate_ecological_indices(self, image_id, indices_list):
                         bad_area=rsei_stats['bad_area'] if rsei_stats else None,
                     )
                     
-                    # 创建RSEI结果记录
-                    RSEIResult.objects.create(
+                    # 待保存的RSEI结果记录
+                    rsei_record = RSEIResult(
                         remote_sensing_image=image,
                         greenness=calculated_indices['greenness'],
                         wetness=calculated_indices['wetness'],
                         dryness=calculated_indices['dryness'],
                         heat=calculated_indices['heat'],
                         rsei_result=rsei_index,
-                        pc1_variance=rsei_result['pca_variance'][0],
-                        pc2_variance=rsei_result['pca_variance'][1],
-                        pc3_variance=rsei_result['pca_variance'][2],
-                        pc4_variance=rsei_result['pca_variance'][3],
-                        greenness_weight=rsei_result['pca_components'][0][0],
-                        wetness_weight=rsei_result['pca_components'][0][1],
-                        dryness_weight=rsei_result['pca_components'][0][2],
-                        heat_weight=rsei_result['pca_components'][0][3],
+                        pca_variance=rsei_result['pca_variance'].tolist(),
+                        pca_weights=rsei_result['pca_components'][0].tolist(),
                     )
                     
                     logger.info("成功计算RSEI")
@@ -193,17 +363,28 @@ def calculate_ecological_indices(self, image_id, indices_list):
             except Exception as e:
                 logger.error(f"计算RSEI时出错: {e}")
         
-        # 更新遥感影像状态
-        image.is_processed = True
-        image.processing_status = 'completed'
-        image.save()
-        
-        # 更新任务状态
-        task.status = 'completed'
-        task.progress = 100
-        task.current_step = '处理完成'
-        task.completed_at = time.time()
-        task.save()
+        # RSEI记录、影像状态和任务状态在同一个事务中提交
+        with transaction.atomic():
+            if rsei_record is not None:
+                try:
+                    with transaction.atomic():
+                        EcologicalIndex.objects.filter(remote_sensing_image=image, index_type='rsei').delete()
+                        rsei_index.save(force_insert=True)
+                        rsei_record.save(force_insert=True)
+                except Exception as e:
+                    logger.error(f"保存RSEI结果时出错: {e}")
+            
+            # 更新遥感影像状态
+            image.is_processed = True
+            image.processing_status = 'completed'
+            image.save(update_fields=['is_processed', 'processing_status'])
+            
+            # 更新任务状态
+            task.status = 'completed'
+            task.progress = 100
+            task.current_step = '处理完成'
+            task.completed_at = timezone.now()
+            task.save(update_fields=['status', 'progress', 'current_step', 'completed_at'])
         
         calculator.close()
         
@@ -220,25 +401,30 @@ def calculate_ecological_indices(self, image_id, indices_list):
         if 'task' in locals():
             task.status = 'failed'
             task.error_message = str(e)
-            task.save()
+            task.save(update_fields=['status', 'error_message'])
         
         # 更新遥感影像状态
         if 'image' in locals():
             image.processing_status = 'failed'
-            image.save()
+            image.save(update_fields=['processing_status'])
         
         raise e
 
 
 @shared_task(bind=True)
-def calculate_rsei_only(self, image_id):
+def calculate_rsei_only(self, image_id, use_memmap=False, overview_factor=1):
     """
     仅计算RSEI的Celery任务
     
     Args:
         image_id: 遥感影像ID
+        use_memmap: 影像是否支持内存映射读取（RemoteSensingImage.supports_memmap）
+        overview_factor: 降采样倍数，大于1时按降采样后的影像计算，结果栅格分辨率相应降低
     """
     try:
+        # 延迟导入计算器模块（同calculate_ecological_indices）
+        from .ecological_indices import EcologicalIndexCalculator
+        
         # 获取遥感影像
         image = RemoteSensingImage.objects.get(id=image_id)
         
@@ -251,8 +437,8 @@ def calculate_rsei_only(self, image_id):
         )
         
         # 初始化计算器
-        calculator = EcologicalIndexCalculator(image.file_path.path)
-        if not calculator.load_image():
+        calculator = EcologicalIndexCalculator(get_local_image_path(image))
+        if not calculator.load_image(use_memmap=use_memmap, overview_factor=overview_factor):
             raise Exception("无法加载遥感影像")
         
         # 创建输出目录
@@ -272,7 +458,7 @@ def calculate_rsei_only(self, image_id):
         # 保存RSEI结果
         rsei_filename = "rsei_result.tif"
         rsei_path = os.path.join(output_dir, rsei_filename)
-        calculator.save_result(rsei_result['rsei'], rsei_path)
+        calculator.save_result(rsei_result['rsei'], rsei_path, scaled=True)
         
         # 创建RSEI可视化
         rsei_viz_filename = "rsei_visualization.png"
@@ -303,8 +489,8 @@ def calculate_rsei_only(self, image_id):
         task.status = 'completed'
         task.progress = 100
         task.current_step = 'RSEI计算完成'
-        task.completed_at = time.time()
-        task.save()
+        task.completed_at = timezone.now()
+        task.save(update_fields=['status', 'progress', 'current_step', 'completed_at'])
         
         calculator.close()
         
@@ -321,11 +507,58 @@ def calculate_rsei_only(self, image_id):
         if 'task' in locals():
             task.status = 'failed'
             task.error_message = str(e)
-            task.save()
+            task.save(update_fields=['status', 'error_message'])
         
         raise e
 
 
+@shared_task
+def extract_image_metadata(image_id):
+    """
+    读取遥感影像元数据并更新影像记录的Celery任务
+    
+    上传接口只保存文件和创建记录，波段数、分辨率和中心经纬度在worker中从影像头信息读取
+    
+    Args:
+        image_id: 遥感影像ID
+    """
+    try:
+        import rasterio
+        from rasterio.warp import transform
+        
+        image = RemoteSensingImage.objects.get(id=image_id)
+        
+        # 只读取影像头信息，不读取像素数据
+        with rasterio.open(get_local_image_path(image)) as dataset:
+            updates = {
+                'bands_count': dataset.count,
+                # 未压缩的GeoTIFF可由计算任务通过内存映射读取
+                'supports_memmap': dataset.driver == 'GTiff' and dataset.profile.get('compress') is None,
+            }
+            if dataset.crs:
+                # 投影坐标系下像元大小即分辨率(米)
+                if dataset.crs.is_projected:
+                    updates['resolution'] = float(abs(dataset.res[0]))
+                
+                # 影像中心点转换为WGS84经纬度
+                bounds = dataset.bounds
+                lons, lats = transform(
+                    dataset.crs, 'EPSG:4326',
+                    [(bounds.left + bounds.right) / 2],
+                    [(bounds.bottom + bounds.top) / 2]
+                )
+                updates['center_lon'] = lons[0]
+                updates['center_lat'] = lats[0]
+        
+        RemoteSensingImage.objects.filter(id=image_id).update(**updates)
+        
+        return {'status': 'success', 'message': '影像元数据提取完成'}
+        
+    except Exception as e:
+        logger.error(f"提取影像元数据失败: {e}")
+        return {'status': 'error', 'message': str(e)}
+
+
 @shared_task
 def cleanup_temp_files():
     """清理临时文件的任务"""
@@ -337,18 +570,21 @@ def cleanup_temp_files():
         temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
         if os.path.exists(temp_dir):
             current_time = datetime.now()
-            for item in os.listdir(temp_dir):
-                item_path = os.path.join(temp_dir, item)
-                if os.path.isfile(item_path):
-                    file_time = datetime.fromtimestamp(os.path.getctime(item_path))
-                    if current_time - file_time > timedelta(hours=24):
-                        os.remove(item_path)
-                        logger.info(f"删除临时文件: {item_path}")
-                elif os.path.isdir(item_path):
-                    dir_time = datetime.fromtimestamp(os.path.getctime(item_path))
-                    if current_time - dir_time > timedelta(hours=24):
-                        shutil.rmtree(item_path)
-                        logger.info(f"删除临时目录: {item_path}")
+            # scandir的目录项缓存了文件类型，每项只需一次stat获取创建时间
+            with os.scandir(temp_dir) as entries:
+                for entry in entries:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if not is_dir and not entry.is_file(follow_symlinks=False):
+                        continue
+                    item_time = datetime.fromtimestamp(entry.stat(follow_symlinks=False).st_ctime)
+                    if current_time - item_time <= timedelta(hours=24):
+                        continue
+                    if is_dir:
+                        shutil.rmtree(entry.path)
+                        logger.info(f"删除临时目录: {entry.path}")
+                    else:
+                        os.remove(entry.path)
+                        logger.info(f"删除临时文件: {entry.path}")
         
         return {'status': 'success', 'message': '临时文件清理完成'}
         
@@ -1,13 +1,14 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.shortcuts import get_object_or_404
-from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce, NullIf, Round
+from django.core.cache import cache
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 import os
-import logging
 
 from .models import (
     RemoteSensingImage, 
@@ -17,6 +18,7 @@ from .models import (
 )
 from .serializers import (
     RemoteSensingImageSerializer,
+    RemoteSensingImageListSerializer,
     EcologicalIndexSerializer,
     RSEIResultSerializer,
     ProcessingTaskSerializer,
@@ -24,9 +26,49 @@ from .serializers import (
     EcologicalIndexCalculationSerializer,
     RSEICalculationSerializer
 )
-from .tasks import calculate_ecological_indices, calculate_rsei_only
+from .tasks import calculate_ecological_indices, calculate_rsei_only, extract_image_metadata
 
-logger = logging.getLogger(__name__)
+# 序列化器嵌套的外键，通过JOIN一次查出，避免列表序列化时逐行查询（N+1）
+IMAGE_RELATED = ('remote_sensing_image__uploaded_by',)
+RSEI_RESULT_RELATED = (
+    'remote_sensing_image__uploaded_by',
+    'greenness__remote_sensing_image__uploaded_by',
+    'wetness__remote_sensing_image__uploaded_by',
+    'dryness__remote_sensing_image__uploaded_by',
+    'heat__remote_sensing_image__uploaded_by',
+    'rsei_result__remote_sensing_image__uploaded_by',
+)
+
+# 生态指数的分级（由优到差），对应 {等级}_area 面积字段
+AREA_LEVELS = ('excellent', 'good', 'moderate', 'poor', 'bad')
+
+# 各等级面积之和，空值按0计
+TOTAL_AREA_EXPRESSION = (
+    Coalesce('excellent_area', Value(0.0))
+    + Coalesce('good_area', Value(0.0))
+    + Coalesce('moderate_area', Value(0.0))
+    + Coalesce('poor_area', Value(0.0))
+    + Coalesce('bad_area', Value(0.0))
+)
+
+# 已结束的处理任务状态
+TERMINAL_TASK_STATUSES = ('completed', 'failed', 'cancelled')
+
+# Celery任务状态的缓存时间（秒）
+CELERY_STATUS_CACHE_TIMEOUT = 2
+
+# 只使用影像本身、不序列化上传用户的操作，get_object时无需JOIN用户表
+IMAGE_ONLY_ACTIONS = ('destroy', 'calculate_indices', 'calculate_rsei', 'indices', 'rsei_result')
+
+# 遥感影像列表不返回的列（长文本描述、文件路径和用户密码哈希），列表查询时不读取
+IMAGE_LIST_DEFERRED_FIELDS = ('description', 'file_path', 'thumbnail', 'uploaded_by__password')
+
+# 处理任务序列化器用到的列，影像只取名称
+PROCESSING_TASK_FIELDS = (
+    'id', 'task_type', 'status', 'progress', 'current_step', 'error_message',
+    'celery_task_id', 'created_at', 'started_at', 'completed_at',
+    'remote_sensing_image_id', 'remote_sensing_image__name',
+)
 
 
 class RemoteSensingImageViewSet(viewsets.ModelViewSet):
@@ -38,10 +80,24 @@ class RemoteSensingImageViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """根据用户权限过滤查询集"""
         user = self.request.user
+        queryset = RemoteSensingImage.objects.all()
+        if self.action not in IMAGE_ONLY_ACTIONS:
+            queryset = queryset.select_related('uploaded_by')
+        if self.action == 'list':
+            # 文件大小(MB)由数据库计算，列表序列化时不再逐行调用Python方法
+            queryset = queryset.defer(*IMAGE_LIST_DEFERRED_FIELDS).annotate(
+                file_size_mb=Round(NullIf('file_size', Value(0)) / 1048576.0, 2)
+            )
         if user.is_superuser or user.role == 'admin':
-            return RemoteSensingImage.objects.all()
+            return queryset
         else:
-            return RemoteSensingImage.objects.filter(uploaded_by=user)
+            return queryset.filter(uploaded_by=user)
+    
+    def get_serializer_class(self):
+        """列表使用精简序列化器，详情仍返回全部字段"""
+        if self.action == 'list':
+            return RemoteSensingImageListSerializer
+        return super().get_serializer_class()
     
     def perform_create(self, serializer):
         """创建时设置上传用户"""
@@ -50,157 +106,123 @@ class RemoteSensingImageViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def upload(self, request):
         """上传遥感影像"""
+        serializer = RemoteSensingImageUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            raise ValidationError({'error': '数据验证失败', 'details': serializer.errors})
+        
+        # 获取文件信息
+        file_obj = request.FILES.get('file_path')
+        if not file_obj:
+            raise ValidationError({'error': '请选择要上传的文件'})
+        
+        # 保存文件：直接传入上传文件对象，存储后端按块写入，不将整个文件读入内存
+        file_path = default_storage.save(f'remote_sensing/{file_obj.name}', file_obj)
+        
+        # 创建遥感影像记录（单条INSERT，无需事务）；写入失败时删除已保存的文件
         try:
-            serializer = RemoteSensingImageUploadSerializer(data=request.data)
-            if serializer.is_valid():
-                # 获取文件信息
-                file_obj = request.FILES.get('file_path')
-                if not file_obj:
-                    return Response(
-                        {'error': '请选择要上传的文件'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # 保存文件
-                file_path = default_storage.save(
-                    f'remote_sensing/{file_obj.name}', 
-                    ContentFile(file_obj.read())
-                )
-                
-                # 创建遥感影像记录
-                with transaction.atomic():
-                    remote_sensing_image = RemoteSensingImage.objects.create(
-                        name=serializer.validated_data['name'],
-                        description=serializer.validated_data.get('description', ''),
-                        image_type=serializer.validated_data['image_type'],
-                        file_path=file_path,
-                        acquisition_date=serializer.validated_data['acquisition_date'],
-                        center_lat=serializer.validated_data['center_lat'],
-                        center_lon=serializer.validated_data['center_lon'],
-                        uploaded_by=request.user,
-                        file_size=file_obj.size
-                    )
-                
-                # 返回创建的数据
-                result_serializer = RemoteSensingImageSerializer(remote_sensing_image)
-                return Response(
-                    {
-                        'message': '遥感影像上传成功',
-                        'data': result_serializer.data
-                    },
-                    status=status.HTTP_201_CREATED
-                )
-            else:
-                return Response(
-                    {'error': '数据验证失败', 'details': serializer.errors},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except Exception as e:
-            logger.error(f"上传遥感影像失败: {e}")
-            return Response(
-                {'error': '上传失败', 'details': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            remote_sensing_image = RemoteSensingImage.objects.create(
+                name=serializer.validated_data['name'],
+                description=serializer.validated_data.get('description', ''),
+                image_type=serializer.validated_data['image_type'],
+                file_path=file_path,
+                acquisition_date=serializer.validated_data['acquisition_date'],
+                center_lat=serializer.validated_data['center_lat'],
+                center_lon=serializer.validated_data['center_lon'],
+                uploaded_by=request.user,
+                file_size=file_obj.size
             )
+        except Exception:
+            default_storage.delete(file_path)
+            raise
+        
+        # 波段数、分辨率和中心经纬度由worker异步从影像中读取
+        extract_image_metadata.delay(str(remote_sensing_image.id))
+        
+        # 返回创建的数据
+        result_serializer = RemoteSensingImageSerializer(remote_sensing_image)
+        return Response(
+            {
+                'message': '遥感影像上传成功',
+                'data': result_serializer.data
+            },
+            status=status.HTTP_201_CREATED
+        )
     
     @action(detail=True, methods=['post'])
     def calculate_indices(self, request, pk=None):
         """计算生态指数"""
-        try:
-            remote_sensing_image = self.get_object()
-            
-            serializer = EcologicalIndexCalculationSerializer(data=request.data)
-            if serializer.is_valid():
-                indices_list = serializer.validated_data['indices']
-                
-                # 启动异步任务
-                task = calculate_ecological_indices.delay(
-                    str(remote_sensing_image.id), 
-                    indices_list
-                )
-                
-                return Response({
-                    'message': '生态指数计算任务已启动',
-                    'task_id': task.id,
-                    'indices': indices_list
-                }, status=status.HTTP_202_ACCEPTED)
-            else:
-                return Response(
-                    {'error': '参数验证失败', 'details': serializer.errors},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except Exception as e:
-            logger.error(f"启动生态指数计算失败: {e}")
-            return Response(
-                {'error': '启动计算失败', 'details': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        remote_sensing_image = self.get_object()
+        
+        serializer = EcologicalIndexCalculationSerializer(data=request.data)
+        if not serializer.is_valid():
+            raise ValidationError({'error': '参数验证失败', 'details': serializer.errors})
+        indices_list = serializer.validated_data['indices']
+        
+        # 启动异步任务
+        task = calculate_ecological_indices.delay(
+            str(remote_sensing_image.id), 
+            indices_list,
+            use_memmap=remote_sensing_image.supports_memmap,
+            overview_factor=serializer.validated_data['overview_factor']
+        )
+        
+        return Response({
+            'message': '生态指数计算任务已启动',
+            'task_id': task.id,
+            'indices': indices_list
+        }, status=status.HTTP_202_ACCEPTED)
     
     @action(detail=True, methods=['post'])
     def calculate_rsei(self, request, pk=None):
         """计算RSEI"""
-        try:
-            remote_sensing_image = self.get_object()
-            
-            serializer = RSEICalculationSerializer(data=request.data)
-            if serializer.is_valid():
-                # 启动异步任务
-                task = calculate_rsei_only.delay(str(remote_sensing_image.id))
-                
-                return Response({
-                    'message': 'RSEI计算任务已启动',
-                    'task_id': task.id
-                }, status=status.HTTP_202_ACCEPTED)
-            else:
-                return Response(
-                    {'error': '参数验证失败', 'details': serializer.errors},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except Exception as e:
-            logger.error(f"启动RSEI计算失败: {e}")
-            return Response(
-                {'error': '启动计算失败', 'details': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        remote_sensing_image = self.get_object()
+        
+        serializer = RSEICalculationSerializer(data=request.data)
+        if not serializer.is_valid():
+            raise ValidationError({'error': '参数验证失败', 'details': serializer.errors})
+        
+        # 启动异步任务
+        task = calculate_rsei_only.delay(
+            str(remote_sensing_image.id),
+            use_memmap=remote_sensing_image.supports_memmap,
+            overview_factor=serializer.validated_data['overview_factor']
+        )
+        
+        return Response({
+            'message': 'RSEI计算任务已启动',
+            'task_id': task.id
+        }, status=status.HTTP_202_ACCEPTED)
     
     @action(detail=True, methods=['get'])
     def indices(self, request, pk=None):
         """获取遥感影像的所有生态指数"""
-        try:
-            remote_sensing_image = self.get_object()
-            indices = EcologicalIndex.objects.filter(remote_sensing_image=remote_sensing_image)
-            serializer = EcologicalIndexSerializer(indices, many=True)
-            
-            return Response({
-                'data': serializer.data,
-                'count': indices.count()
-            })
-        except Exception as e:
-            logger.error(f"获取生态指数失败: {e}")
-            return Response(
-                {'error': '获取失败', 'details': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        remote_sensing_image = self.get_object()
+        indices = EcologicalIndex.objects.select_related(*IMAGE_RELATED).filter(
+            remote_sensing_image=remote_sensing_image
+        )
+        # 查询集只执行一次，数量取自已序列化的结果，不再单独发COUNT查询
+        data = EcologicalIndexSerializer(indices, many=True).data
+        
+        return Response({
+            'data': data,
+            'count': len(data)
+        })
     
     @action(detail=True, methods=['get'])
     def rsei_result(self, request, pk=None):
         """获取RSEI结果"""
-        try:
-            remote_sensing_image = self.get_object()
-            rsei_result = RSEIResult.objects.filter(remote_sensing_image=remote_sensing_image).first()
-            
-            if rsei_result:
-                serializer = RSEIResultSerializer(rsei_result)
-                return Response(serializer.data)
-            else:
-                return Response(
-                    {'message': '暂无RSEI结果'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-        except Exception as e:
-            logger.error(f"获取RSEI结果失败: {e}")
+        remote_sensing_image = self.get_object()
+        rsei_result = RSEIResult.objects.select_related(*RSEI_RESULT_RELATED).filter(
+            remote_sensing_image=remote_sensing_image
+        ).first()
+        
+        if rsei_result:
+            serializer = RSEIResultSerializer(rsei_result)
+            return Response(serializer.data)
+        else:
             return Response(
-                {'error': '获取失败', 'details': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'message': '暂无RSEI结果'},
+                status=status.HTTP_404_NOT_FOUND
             )
 
 
@@ -212,53 +234,43 @@ class EcologicalIndexViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         """根据用户权限过滤查询集"""
         user = self.request.user
+        if self.action == 'statistics':
+            # 统计接口不序列化影像，总面积由数据库计算
+            queryset = EcologicalIndex.objects.annotate(total_area=TOTAL_AREA_EXPRESSION)
+        else:
+            queryset = EcologicalIndex.objects.select_related(*IMAGE_RELATED)
         if user.is_superuser or user.role == 'admin':
-            return EcologicalIndex.objects.all()
+            return queryset
         else:
-            return EcologicalIndex.objects.filter(remote_sensing_image__uploaded_by=user)
+            return queryset.filter(remote_sensing_image__uploaded_by=user)
     
     @action(detail=True, methods=['get'])
     def statistics(self, request, pk=None):
         """获取生态指数统计信息"""
-        try:
-            ecological_index = self.get_object()
-            
-            # 计算统计信息
-            stats = {
-                'index_type': ecological_index.index_type,
-                'index_type_display': ecological_index.get_index_type_display(),
-                'total_area': sum([
-                    ecological_index.excellent_area or 0,
-                    ecological_index.good_area or 0,
-                    ecological_index.moderate_area or 0,
-                    ecological_index.poor_area or 0,
-                    ecological_index.bad_area or 0
-                ]),
-                'excellent_percentage': 0,
-                'good_percentage': 0,
-                'moderate_percentage': 0,
-                'poor_percentage': 0,
-                'bad_percentage': 0,
-                'mean_value': ecological_index.mean_value,
-                'std_value': ecological_index.std_value,
-            }
-            
-            # 计算百分比
-            total_area = stats['total_area']
-            if total_area > 0:
-                stats['excellent_percentage'] = (ecological_index.excellent_area or 0) / total_area * 100
-                stats['good_percentage'] = (ecological_index.good_area or 0) / total_area * 100
-                stats['moderate_percentage'] = (ecological_index.moderate_area or 0) / total_area * 100
-                stats['poor_percentage'] = (ecological_index.poor_area or 0) / total_area * 100
-                stats['bad_percentage'] = (ecological_index.bad_area or 0) / total_area * 100
-            
-            return Response(stats)
-        except Exception as e:
-            logger.error(f"获取统计信息失败: {e}")
-            return Response(
-                {'error': '获取统计信息失败', 'details': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        ecological_index = self.get_object()
+        
+        # 计算统计信息，总面积来自查询集注解
+        total_area = ecological_index.total_area
+        stats = {
+            'index_type': ecological_index.index_type,
+            'index_type_display': EcologicalIndex.INDEX_TYPE_MAP.get(
+                ecological_index.index_type, ecological_index.index_type
+            ),
+            'total_area': total_area,
+        }
+        
+        # 计算百分比
+        stats.update({
+            f'{level}_percentage': (
+                (getattr(ecological_index, f'{level}_area') or 0) / total_area * 100
+                if total_area > 0 else 0
             )
+            for level in AREA_LEVELS
+        })
+        stats['mean_value'] = ecological_index.mean_value
+        stats['std_value'] = ecological_index.std_value
+        
+        return Response(stats)
 
 
 class RSEIResultViewSet(viewsets.ReadOnlyModelViewSet):
@@ -269,10 +281,11 @@ class RSEIResultViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         """根据用户权限过滤查询集"""
         user = self.request.user
+        queryset = RSEIResult.objects.select_related(*RSEI_RESULT_RELATED)
         if user.is_superuser or user.role == 'admin':
-            return RSEIResult.objects.all()
+            return queryset
         else:
-            return RSEIResult.objects.filter(remote_sensing_image__uploaded_by=user)
+            return queryset.filter(remote_sensing_image__uploaded_by=user)
 
 
 class ProcessingTaskViewSet(viewsets.ReadOnlyModelViewSet):
@@ -283,48 +296,48 @@ class ProcessingTaskViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         """根据用户权限过滤查询集"""
         user = self.request.user
+        queryset = ProcessingTask.objects.select_related('remote_sensing_image').only(*PROCESSING_TASK_FIELDS)
         if user.is_superuser or user.role == 'admin':
-            return ProcessingTask.objects.all()
+            return queryset
         else:
-            return ProcessingTask.objects.filter(remote_sensing_image__uploaded_by=user)
+            return queryset.filter(remote_sensing_image__uploaded_by=user)
     
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
         """获取任务状态"""
-        try:
-            task = self.get_object()
+        task = self.get_object()
+        
+        # 未结束的Celery任务才查询结果后端获取实时状态，已结束的任务以数据库状态为准
+        if task.celery_task_id and task.status not in TERMINAL_TASK_STATUSES:
+            from celery.result import AsyncResult
             
-            # 如果是Celery任务，获取实时状态
-            if task.celery_task_id:
-                from celery.result import AsyncResult
-                celery_result = AsyncResult(task.celery_task_id)
-                
-                return Response({
-                    'task_id': task.id,
-                    'celery_task_id': task.celery_task_id,
-                    'status': task.status,
-                    'celery_status': celery_result.status,
-                    'progress': task.progress,
-                    'current_step': task.current_step,
-                    'error_message': task.error_message,
-                    'created_at': task.created_at,
-                    'started_at': task.started_at,
-                    'completed_at': task.completed_at,
-                })
-            else:
-                return Response({
-                    'task_id': task.id,
-                    'status': task.status,
-                    'progress': task.progress,
-                    'current_step': task.current_step,
-                    'error_message': task.error_message,
-                    'created_at': task.created_at,
-                    'started_at': task.started_at,
-                    'completed_at': task.completed_at,
-                })
-        except Exception as e:
-            logger.error(f"获取任务状态失败: {e}")
-            return Response(
-                {'error': '获取状态失败', 'details': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            ) 
\ No newline at end of file
+            # 前端轮询时短时间内复用结果后端的查询结果
+            celery_status = cache.get_or_set(
+                f'celery_status:{task.celery_task_id}',
+                lambda: AsyncResult(task.celery_task_id).status,
+                timeout=CELERY_STATUS_CACHE_TIMEOUT
+            )
+            
+            return Response({
+                'task_id': task.id,
+                'celery_task_id': task.celery_task_id,
+                'status': task.status,
+                'celery_status': celery_status,
+                'progress': task.progress,
+                'current_step': task.current_step,
+                'error_message': task.error_message,
+                'created_at': task.created_at,
+                'started_at': task.started_at,
+                'completed_at': task.completed_at,
+            })
+        else:
+            return Response({
+                'task_id': task.id,
+                'status': task.status,
+                'progress': task.progress,
+                'current_step': task.current_step,
+                'error_message': task.error_message,
+                'created_at': task.created_at,
+                'started_at': task.started_at,
+                'completed_at': task.completed_at,
+            })
\ No newline at end of file
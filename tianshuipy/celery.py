@@ -9,6 +9,12 @@ app = Celery('tianshuipy')
 # 使用Django的设置
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
+# 复用到消息代理的连接（delay/apply_async从连接池中获取生产者），启动时代理未就绪则重试连接
+app.conf.update(
+    broker_pool_limit=10,
+    broker_connection_retry_on_startup=True,
+)
+
 # 自动发现任务
 app.autodiscover_tasks()
 
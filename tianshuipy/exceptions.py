@@ -0,0 +1,34 @@
+import logging
+
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
+
+logger = logging.getLogger(__name__)
+
+
+def api_exception_handler(exc, context):
+    """
+    统一的API异常处理
+    
+    DRF能处理的异常（参数验证、404、认证和权限等）交给默认处理；
+    其余未预期的异常在此统一记录日志，并返回 {'error', 'details'} 格式的500响应
+    
+    Args:
+        exc: 视图中抛出的异常
+        context: 包含view、request等信息的上下文
+        
+    Returns:
+        Response: 错误响应
+    """
+    response = exception_handler(exc, context)
+    if response is not None:
+        return response
+    
+    view = context.get('view')
+    action = getattr(view, 'action', None)
+    logger.error(f"{view.__class__.__name__}.{action} 请求处理失败: {exc}", exc_info=exc)
+    return Response(
+        {'error': '服务器内部错误', 'details': str(exc)},
+        status=status.HTTP_500_INTERNAL_SERVER_ERROR
+    )
@@ -26,6 +26,9 @@ SECRET_KEY = "django-insecure-@jmeepv1459j^#n1nfu@87jcfkcp_ia@jip2)m=k#h7n6@89lw
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# 非DEBUG环境下是否挂载API文档（文档生成会在启动时扫描全部视图集）
+ENABLE_API_DOCS = False
+
 ALLOWED_HOSTS = ['*']
 
 
@@ -149,6 +152,7 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    'EXCEPTION_HANDLER': 'tianshuipy.exceptions.api_exception_handler',
 }
 
 # CORS 配置
@@ -156,7 +160,8 @@ CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
 # 文件上传配置
-FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
+# 超过该大小的上传文件由Django写入临时文件（TemporaryUploadedFile），不整体驻留内存
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
 
 # 日志配置
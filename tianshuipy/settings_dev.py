@@ -118,6 +118,7 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    'EXCEPTION_HANDLER': 'tianshuipy.exceptions.api_exception_handler',
 }
 
 # CORS 配置 - 允许前端访问
@@ -125,7 +126,8 @@ CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
 # 文件上传配置
-FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
+# 超过该大小的上传文件由Django写入临时文件（TemporaryUploadedFile），不整体驻留内存
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
 
 # 日志配置
@@ -20,7 +20,6 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.shortcuts import render
-from rest_framework.documentation import include_docs_urls
 
 def home_view(request):
     """首页视图 - 显示系统信息"""
@@ -33,9 +32,16 @@ urlpatterns = [
         path("users/", include('users.urls')),
         path("environment/", include('environment.urls')),
     ])),
-    path("api/docs/", include_docs_urls(title='天水平台 API 文档'), name="api-docs"),
 ]
 
+# API文档只在开发环境或显式开启时挂载
+if settings.DEBUG or getattr(settings, 'ENABLE_API_DOCS', False):
+    from rest_framework.documentation import include_docs_urls
+    
+    urlpatterns.append(
+        path("api/docs/", include_docs_urls(title='天水平台 API 文档'), name="api-docs")
+    )
+
 # 开发环境下提供媒体文件服务
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
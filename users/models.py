@@ -9,6 +9,8 @@ class User(AbstractUser):
         ('user', '普通用户'),
         ('expert', '专家'),
     ]
+    # 角色值 -> 显示名称
+    ROLE_MAP = dict(ROLE_CHOICES)
     
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='user', verbose_name='用户角色')
     phone = models.CharField(max_length=11, blank=True, null=True, verbose_name='手机号')
@@ -50,7 +52,7 @@ class UserPermission(models.Model):
 class UserSession(models.Model):
     """用户会话模型"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='用户')
-    session_key = models.CharField(max_length=40, verbose_name='会话键')
+    session_key = models.CharField(max_length=40, db_index=True, verbose_name='会话键')
     ip_address = models.GenericIPAddressField(verbose_name='IP地址')
     user_agent = models.TextField(verbose_name='用户代理')
     login_time = models.DateTimeField(auto_now_add=True, verbose_name='登录时间')
@@ -61,6 +63,10 @@ class UserSession(models.Model):
         verbose_name = '用户会话'
         verbose_name_plural = '用户会话'
         db_table = 'user_sessions'
+        indexes = [
+            # 查询用户的活跃会话
+            models.Index(fields=['user', 'is_active']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.login_time}" 
\ No newline at end of file
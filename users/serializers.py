@@ -4,7 +4,7 @@ from .models import User, UserPermission, UserSession
 
 class UserSerializer(serializers.ModelSerializer):
     """用户序列化器"""
-    role_display = serializers.CharField(source='get_role_display', read_only=True)
+    role_display = serializers.SerializerMethodField()
     
     class Meta:
         model = User
@@ -14,6 +14,10 @@ class UserSerializer(serializers.ModelSerializer):
             'is_active', 'date_joined', 'last_login'
         ]
         read_only_fields = ['id', 'date_joined', 'last_login']
+    
+    def get_role_display(self, obj):
+        """获取角色显示名称（直接查表，不调用模型的get_role_display）"""
+        return User.ROLE_MAP.get(obj.role, obj.role)
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -35,11 +39,8 @@ class UserCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         validated_data.pop('password_confirm')
-        password = validated_data.pop('password')
-        user = User.objects.create(**validated_data)
-        user.set_password(password)
-        user.save()
-        return user
+        # create_user在INSERT前完成密码哈希，只需一次写入
+        return User.objects.create_user(**validated_data)
 
 
 class UserUpdateSerializer(serializers.ModelSerializer):
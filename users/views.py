@@ -10,11 +10,26 @@ from .serializers import (
 )
 
 
+# UserSerializer用到的列，列表和详情查询只读取这些列（不读取密码哈希等）
+USER_SERIALIZER_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'role',
+    'phone', 'organization', 'department', 'position', 'avatar',
+    'is_active', 'date_joined', 'last_login'
+)
+
+
 class UserViewSet(viewsets.ModelViewSet):
     """用户视图集"""
     queryset = User.objects.all()
     serializer_class = UserSerializer
     
+    def get_queryset(self):
+        """列表和详情只查询序列化需要的列"""
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.only(*USER_SERIALIZER_FIELDS)
+        return queryset
+    
     def get_serializer_class(self):
         """根据操作类型选择序列化器"""
         if self.action == 'create':
@@ -23,13 +38,15 @@ class UserViewSet(viewsets.ModelViewSet):
             return UserUpdateSerializer
         return UserSerializer
     
+    # 权限类均无状态，实例在各请求间共享
+    _ANON_PERMISSIONS = (permissions.AllowAny(),)
+    _AUTH_PERMISSIONS = (permissions.IsAuthenticated(),)
+    
     def get_permissions(self):
         """设置权限"""
         if self.action in ['create', 'login']:
-            permission_classes = [permissions.AllowAny]
-        else:
-            permission_classes = [permissions.IsAuthenticated]
-        return [permission() for permission in permission_classes]
+            return self._ANON_PERMISSIONS
+        return self._AUTH_PERMISSIONS
     
     @action(detail=False, methods=['post'])
     def login(self, request):
@@ -74,10 +91,11 @@ class UserViewSet(viewsets.ModelViewSet):
         """更新当前用户信息"""
         serializer = UserUpdateSerializer(request.user, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            # save()返回已更新的实例，直接序列化
+            user = serializer.save()
             return Response({
                 'message': '用户信息更新成功',
-                'user': UserSerializer(request.user).data
+                'user': UserSerializer(user, context={'request': request}).data
             })
         else:
             return Response(